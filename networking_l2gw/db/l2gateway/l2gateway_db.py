@@ -19,6 +19,7 @@ from neutron.callbacks import events
 from neutron.callbacks import registry
 from neutron.callbacks import resources
 from neutron.common import exceptions
+from neutron.extensions import portbindings
 from neutron import manager
 
 from networking_l2gw.db.l2gateway import db_query
@@ -26,6 +27,7 @@ from networking_l2gw.db.l2gateway import l2gateway_models as models
 from networking_l2gw.extensions import l2gateway
 from networking_l2gw.extensions import l2gatewayconnection
 from networking_l2gw.services.l2gateway.common import config
+from networking_l2gw.services.l2gateway.common import connected_networks
 from networking_l2gw.services.l2gateway.common import constants
 from networking_l2gw.services.l2gateway.common import l2gw_validators
 from networking_l2gw.services.l2gateway import exceptions as l2gw_exc
@@ -35,6 +37,10 @@ from sqlalchemy.orm import exc as sa_orm_exc
 
 LOG = logging.getLogger(__name__)
 
+# The port attributes the MACs programmed on the gateways depend on.
+GATEWAY_PORT_ATTRIBUTES = (portbindings.HOST_ID, 'device_owner',
+                           'mac_address', 'fixed_ips', 'network_id')
+
 
 class L2GatewayMixin(l2gateway.L2GatewayPluginBase,
                      db_query.L2GatewayCommonDbMixin,
@@ -329,6 +335,7 @@ class L2GatewayMixin(l2gateway.L2GatewayPluginBase,
                                                network_id=network_id,
                                                l2_gateway_id=l2_gw_id,
                                                segmentation_id=segmentation_id)
+        connected_networks.get_cache().invalidate(network_id)
         return self._make_l2gw_connections_dict(gw_db)
 
     def get_l2_gateway_connections(self, context, filters=None,
@@ -346,6 +353,12 @@ class L2GatewayMixin(l2gateway.L2GatewayPluginBase,
                                     marker_obj=marker_obj,
                                     page_reverse=page_reverse)
 
+    def get_l2_gateway_connections_count(self, context, filters=None):
+        """Return the number of l2 gateway connections."""
+        self._admin_check(context, 'GET')
+        return self._get_collection_count(context, models.L2GatewayConnection,
+                                          filters=filters)
+
     def get_l2_gateway_connection(self, context, id, fields=None):
         """Get l2 gateway connection."""
         self._admin_check(context, 'GET')
@@ -358,7 +371,9 @@ class L2GatewayMixin(l2gateway.L2GatewayPluginBase,
         self._admin_check(context, 'DELETE')
         with context.session.begin(subtransactions=True):
             gw_db = self._get_l2_gateway_connection(context, id)
+            network_id = gw_db.network_id
             context.session.delete(gw_db)
+        connected_networks.get_cache().invalidate(network_id)
         LOG.debug("l2 gateway '%s' was destroyed.", id)
 
     def _admin_check(self, context, action):
@@ -501,11 +516,33 @@ class L2GatewayMixin(l2gateway.L2GatewayPluginBase,
         return gw
 
 
+def _is_gateway_port_event(event, port_dict, original_port=None):
+    """Return whether a port event may change the gateways.
+
+    The ports without owner are never programmed on the gateways, nor are
+    the ports not bound to a host, and an update that leaves all the
+    GATEWAY_PORT_ATTRIBUTES unchanged has nothing to program.
+    """
+    if not port_dict or not port_dict.get('device_owner'):
+        return False
+    if event == events.AFTER_DELETE:
+        return True
+    if not port_dict.get(portbindings.HOST_ID):
+        return False
+    if not original_port:
+        return True
+    return any(port_dict.get(attribute) != original_port.get(attribute)
+               for attribute in GATEWAY_PORT_ATTRIBUTES)
+
+
 def l2gw_callback(resource, event, trigger, **kwargs):
-    l2gwservice = manager.NeutronManager.get_service_plugins().get(
-        constants.L2GW)
     context = kwargs.get('context')
     port_dict = kwargs.get('port')
+    if not _is_gateway_port_event(event, port_dict,
+                                  kwargs.get('original_port')):
+        return
+    l2gwservice = manager.NeutronManager.get_service_plugins().get(
+        constants.L2GW)
     if l2gwservice:
         if event == events.AFTER_UPDATE:
             l2gwservice.add_port_mac(context, port_dict)
@@ -12,8 +12,11 @@
 # implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import datetime
+
 from oslo_log import log as logging
 from oslo_utils import timeutils
+import sqlalchemy as sa
 from sqlalchemy import asc
 from sqlalchemy.orm import exc
 
@@ -216,6 +219,161 @@ def delete_ucast_mac_remote(context, record_dict):
                 ovsdb_identifier=record_dict['ovsdb_identifier']).delete()
 
 
+def _bulk_add(context, model, key_columns, rows):
+    """Insert the rows whose key does not exist yet in a single statement.
+
+    The existing keys are fetched with one IN query on the first key
+    column, so that N rows take two queries instead of 2N. Returns the
+    inserted rows.
+    """
+    if not rows:
+        return []
+    session = context.session
+    columns = [getattr(model, column) for column in key_columns]
+    with session.begin(subtransactions=True):
+        query = session.query(*columns).filter(
+            columns[0].in_(set(row[key_columns[0]] for row in rows)),
+            model.ovsdb_identifier.in_(
+                set(row['ovsdb_identifier'] for row in rows)))
+        existing_keys = set(tuple(key) for key in query)
+        new_rows = []
+        for row in rows:
+            key = tuple(row[column] for column in key_columns)
+            if key not in existing_keys:
+                existing_keys.add(key)
+                new_rows.append(row)
+        if new_rows:
+            session.bulk_insert_mappings(model, new_rows)
+    return new_rows
+
+
+def bulk_add_vlan_bindings(context, record_dicts):
+    """Insert the vlan bindings that do not exist yet."""
+    rows = [{'port_uuid': record_dict['port_uuid'],
+             'vlan': record_dict['vlan'],
+             'logical_switch_uuid': record_dict['logical_switch_uuid'],
+             'ovsdb_identifier': record_dict['ovsdb_identifier']}
+            for record_dict in record_dicts]
+    return _bulk_add(context, models.VlanBindings,
+                     ('port_uuid', 'vlan', 'logical_switch_uuid',
+                      'ovsdb_identifier'), rows)
+
+
+def bulk_add_physical_locators(context, record_dicts):
+    """Insert the physical locators that do not exist yet."""
+    rows = [{'uuid': record_dict['uuid'],
+             'dst_ip': record_dict['dst_ip'],
+             'ovsdb_identifier': record_dict['ovsdb_identifier']}
+            for record_dict in record_dicts]
+    return _bulk_add(context, models.PhysicalLocators,
+                     ('uuid', 'ovsdb_identifier'), rows)
+
+
+def bulk_add_physical_switches(context, record_dicts):
+    """Insert the physical switches that do not exist yet."""
+    rows = [{'uuid': record_dict['uuid'],
+             'name': record_dict['name'],
+             'tunnel_ip': record_dict['tunnel_ip'],
+             'ovsdb_identifier': record_dict['ovsdb_identifier'],
+             'switch_fault_status': record_dict['switch_fault_status']}
+            for record_dict in record_dicts]
+    return _bulk_add(context, models.PhysicalSwitches,
+                     ('uuid', 'ovsdb_identifier'), rows)
+
+
+def bulk_add_logical_switches(context, record_dicts):
+    """Insert the logical switches that do not exist yet."""
+    rows = [{'uuid': record_dict['uuid'],
+             'name': record_dict['name'],
+             'key': record_dict['key'],
+             'ovsdb_identifier': record_dict['ovsdb_identifier']}
+            for record_dict in record_dicts]
+    return _bulk_add(context, models.LogicalSwitches,
+                     ('uuid', 'ovsdb_identifier'), rows)
+
+
+def bulk_add_physical_ports(context, record_dicts):
+    """Insert the physical ports that do not exist yet."""
+    rows = [{'uuid': record_dict['uuid'],
+             'name': record_dict['name'],
+             'physical_switch_id': record_dict['physical_switch_id'],
+             'ovsdb_identifier': record_dict['ovsdb_identifier'],
+             'port_fault_status': record_dict['port_fault_status']}
+            for record_dict in record_dicts]
+    return _bulk_add(context, models.PhysicalPorts,
+                     ('uuid', 'ovsdb_identifier'), rows)
+
+
+def _get_ucast_mac_rows(record_dicts):
+    return [{'uuid': record_dict['uuid'],
+             'mac': record_dict['mac'],
+             'logical_switch_id': record_dict['logical_switch_id'],
+             'physical_locator_id': record_dict['physical_locator_id'],
+             'ip_address': record_dict['ip_address'],
+             'ovsdb_identifier': record_dict['ovsdb_identifier']}
+            for record_dict in record_dicts]
+
+
+def bulk_add_ucast_macs_locals(context, record_dicts):
+    """Insert the ucast macs local that do not exist yet."""
+    return _bulk_add(context, models.UcastMacsLocals,
+                     ('uuid', 'ovsdb_identifier'),
+                     _get_ucast_mac_rows(record_dicts))
+
+
+def bulk_add_ucast_macs_remotes(context, record_dicts):
+    """Insert the ucast macs remote that do not exist yet."""
+    return _bulk_add(context, models.UcastMacsRemotes,
+                     ('uuid', 'ovsdb_identifier'),
+                     _get_ucast_mac_rows(record_dicts))
+
+
+def _bulk_delete(context, model, ovsdb_identifier, uuids):
+    """Delete the rows with the given uuids in a single statement.
+
+    Returns the number of deleted rows.
+    """
+    uuids = set(uuid for uuid in uuids if uuid)
+    if not uuids:
+        return 0
+    session = context.session
+    with session.begin(subtransactions=True):
+        return session.query(model).filter(
+            model.uuid.in_(uuids),
+            model.ovsdb_identifier == ovsdb_identifier).delete(
+                synchronize_session=False)
+
+
+def bulk_delete_physical_locators(context, ovsdb_identifier, uuids):
+    """Delete the physical locators that match the supplied uuids."""
+    return _bulk_delete(context, models.PhysicalLocators,
+                        ovsdb_identifier, uuids)
+
+
+def bulk_delete_physical_switches(context, ovsdb_identifier, uuids):
+    """Delete the physical switches that match the supplied uuids."""
+    return _bulk_delete(context, models.PhysicalSwitches,
+                        ovsdb_identifier, uuids)
+
+
+def bulk_delete_logical_switches(context, ovsdb_identifier, uuids):
+    """Delete the logical switches that match the supplied uuids."""
+    return _bulk_delete(context, models.LogicalSwitches,
+                        ovsdb_identifier, uuids)
+
+
+def bulk_delete_ucast_macs_locals(context, ovsdb_identifier, uuids):
+    """Delete the ucast macs local that match the supplied uuids."""
+    return _bulk_delete(context, models.UcastMacsLocals,
+                        ovsdb_identifier, uuids)
+
+
+def bulk_delete_ucast_macs_remotes(context, ovsdb_identifier, uuids):
+    """Delete the ucast macs remote that match the supplied uuids."""
+    return _bulk_delete(context, models.UcastMacsRemotes,
+                        ovsdb_identifier, uuids)
+
+
 def get_physical_port(context, record_dict):
     """Get physical port that matches the uuid and ovsdb_identifier."""
     try:
@@ -415,6 +573,13 @@ def get_all_physical_switches_by_ovsdb_id(context, ovsdb_identifier):
         ovsdb_identifier=ovsdb_identifier).all()
 
 
+def get_all_physical_locators_by_ovsdb_id(context, ovsdb_identifier):
+    """Get physical locators that match the supplied ovsdb identifier."""
+    query = context.session.query(models.PhysicalLocators)
+    return query.filter_by(
+        ovsdb_identifier=ovsdb_identifier).all()
+
+
 def get_all_logical_switches_by_ovsdb_id(context, ovsdb_identifier):
     """Get logical Switches that match the supplied ovsdb identifier."""
     query = context.session.query(models.LogicalSwitches)
@@ -435,15 +600,22 @@ def add_pending_ucast_mac_remote(context, operation,
                                  logical_switch_id,
                                  physical_locator,
                                  mac_remotes):
-    """Insert a pending ucast_mac_remote (insert/update/delete)."""
+    """Insert a pending ucast_mac_remote (insert/update/delete).
+
+    mac_remotes are MAC dicts or, for deletions, MAC addresses. The
+    change is merged with the pending changes of the same MAC, so that
+    only the net operation is replayed.
+    """
     session = context.session
     with session.begin(subtransactions=True):
         for mac in mac_remotes:
+            if not isinstance(mac, dict):
+                mac = {'mac': mac}
             pending_mac = models.PendingUcastMacsRemote(
                 uuid=mac.get('uuid', None),
                 mac=mac['mac'],
                 logical_switch_uuid=logical_switch_id,
-                vm_ip=mac['ip_address'],
+                vm_ip=mac.get('ip_address', None),
                 ovsdb_identifier=ovsdb_identifier,
                 operation=operation,
                 timestamp=timeutils.utcnow())
@@ -451,7 +623,84 @@ def add_pending_ucast_mac_remote(context, operation,
                 pending_mac['dst_ip'] = physical_locator.get('dst_ip', None)
                 pending_mac['locator_uuid'] = physical_locator.get('uuid',
                                                                    None)
-            session.add(pending_mac)
+            _merge_pending_ucast_mac_remote(session, pending_mac)
+
+
+def _get_net_pending_changes(pending_macs):
+    """Return the pending changes equivalent to the given ones.
+
+    pending_macs are the changes of a MAC in the order in which they were
+    requested. The MAC is in the OVSDB server unless the first change
+    inserts it, so the changes collapse into the last one, preceded by the
+    first deletion when the MAC is deleted and then added back. An update
+    keeps the uuid of the MAC in the OVSDB server.
+    """
+    first, last = pending_macs[0], pending_macs[-1]
+    if first is last:
+        return [first]
+    if last.operation == 'delete':
+        return [] if first.operation == 'insert' else [last]
+    if first.operation == 'insert':
+        last.operation = 'insert'
+        return [last]
+    if first.operation == 'delete':
+        last.operation = 'insert'
+        return [first, last]
+    last.operation = 'update'
+    last.uuid = first.uuid
+    return [last]
+
+
+def _get_queued_ucast_mac_remotes(session, ovsdb_identifier,
+                                  logical_switch_uuid, mac):
+    return session.query(models.PendingUcastMacsRemote).filter_by(
+        ovsdb_identifier=ovsdb_identifier,
+        logical_switch_uuid=logical_switch_uuid,
+        mac=mac).order_by(
+            asc(models.PendingUcastMacsRemote.timestamp)).all()
+
+
+def _merge_pending_ucast_mac_remote(session, pending_mac):
+    queued_macs = _get_queued_ucast_mac_remotes(
+        session, pending_mac.ovsdb_identifier,
+        pending_mac.logical_switch_uuid, pending_mac.mac)
+    if queued_macs and queued_macs[-1].timestamp > pending_mac.timestamp:
+        # A change requeued from the outbox may be older than the pending
+        # ones, it is replayed in its place without being merged.
+        session.add(pending_mac)
+        return
+    net_macs = _get_net_pending_changes(queued_macs + [pending_mac])
+    for queued_mac in queued_macs:
+        if queued_mac not in net_macs:
+            session.delete(queued_mac)
+    if pending_mac in net_macs:
+        session.add(pending_mac)
+
+
+def coalesce_pending_ucast_mac_remotes(context, ovsdb_identifier):
+    """Collapse the MACs with several pending changes to their net change.
+
+    Returns the number of removed pending changes.
+    """
+    pending_macs = models.PendingUcastMacsRemote
+    session = context.session
+    removed = 0
+    with session.begin(subtransactions=True):
+        keys = session.query(
+            pending_macs.logical_switch_uuid, pending_macs.mac).filter_by(
+                ovsdb_identifier=ovsdb_identifier).group_by(
+                    pending_macs.logical_switch_uuid,
+                    pending_macs.mac).having(
+                        sa.func.count(pending_macs.id) > 1).all()
+        for logical_switch_uuid, mac in keys:
+            queued_macs = _get_queued_ucast_mac_remotes(
+                session, ovsdb_identifier, logical_switch_uuid, mac)
+            net_macs = _get_net_pending_changes(queued_macs)
+            for queued_mac in queued_macs:
+                if queued_mac not in net_macs:
+                    session.delete(queued_mac)
+                    removed += 1
+    return removed
 
 
 def delete_pending_ucast_mac_remote(context, operation,
@@ -468,9 +717,18 @@ def delete_pending_ucast_mac_remote(context, operation,
                 ovsdb_identifier=ovsdb_identifier,
                 logical_switch_uuid=logical_switch_id,
                 operation=operation)
-            row_count = query.count()
-            query.delete()
-            return row_count
+            return query.delete()
+
+
+def delete_pending_ucast_mac_remotes(context, pending_mac_ids):
+    """Delete the pending ucast_mac_remotes with the supplied ids."""
+    if not pending_mac_ids:
+        return 0
+    session = context.session
+    with session.begin(subtransactions=True):
+        return session.query(models.PendingUcastMacsRemote).filter(
+            models.PendingUcastMacsRemote.id.in_(pending_mac_ids)).delete(
+                synchronize_session=False)
 
 
 def get_pending_ucast_mac_remote(context, ovsdb_identifier, mac,
@@ -487,6 +745,91 @@ def get_pending_ucast_mac_remote(context, ovsdb_identifier, mac,
         return
 
 
+def add_outbox_ucast_mac_remotes(context, op_id, operation,
+                                 ovsdb_identifier, entries):
+    """Record the ucast_mac_remote changes cast to an agent as op_id.
+
+    entries is a list of (logical_switch_uuid, physical_locator, mac)
+    tuples, where mac is a MAC dict or, for deletions, a MAC address.
+    """
+    session = context.session
+    timestamp = timeutils.utcnow()
+    with session.begin(subtransactions=True):
+        for seq, (logical_switch_id, physical_locator, mac) in enumerate(
+                entries):
+            if not isinstance(mac, dict):
+                mac = {'mac': mac}
+            outbox_mac = models.UcastMacsRemoteOutbox(
+                op_id=op_id,
+                seq=seq,
+                uuid=mac.get('uuid', None),
+                mac=mac['mac'],
+                logical_switch_uuid=logical_switch_id,
+                vm_ip=mac.get('ip_address', None),
+                ovsdb_identifier=ovsdb_identifier,
+                operation=operation,
+                timestamp=timestamp)
+            if physical_locator:
+                outbox_mac['dst_ip'] = physical_locator.get('dst_ip', None)
+                outbox_mac['locator_uuid'] = physical_locator.get('uuid',
+                                                                  None)
+            session.add(outbox_mac)
+
+
+def complete_outbox_ucast_mac_remotes(context, op_id, errors=None):
+    """Remove the changes of op_id, moving the failed ones to pending.
+
+    errors holds the outcome of each change in the order in which they
+    were recorded, all the changes have failed when it is None. Returns
+    the number of changes moved to the pending_ucast_mac_remote table.
+    """
+    session = context.session
+    with session.begin(subtransactions=True):
+        query = session.query(models.UcastMacsRemoteOutbox).filter_by(
+            op_id=op_id)
+        failed = 0
+        for outbox_mac in query.all():
+            if errors is None or (outbox_mac.seq < len(errors) and
+                                  errors[outbox_mac.seq]):
+                _add_pending_from_outbox(session, outbox_mac)
+                failed += 1
+        query.delete()
+        return failed
+
+
+def requeue_stale_outbox_ucast_mac_remotes(context, ovsdb_identifier,
+                                           timeout):
+    """Move the changes not acknowledged within timeout to pending."""
+    session = context.session
+    cutoff = timeutils.utcnow() - datetime.timedelta(seconds=timeout)
+    with session.begin(subtransactions=True):
+        query = session.query(models.UcastMacsRemoteOutbox).filter(
+            models.UcastMacsRemoteOutbox.ovsdb_identifier ==
+            ovsdb_identifier,
+            models.UcastMacsRemoteOutbox.timestamp < cutoff)
+        stale_macs = query.order_by(
+            asc(models.UcastMacsRemoteOutbox.timestamp)).all()
+        for outbox_mac in stale_macs:
+            _add_pending_from_outbox(session, outbox_mac)
+        query.delete(synchronize_session=False)
+        return len(stale_macs)
+
+
+def _add_pending_from_outbox(session, outbox_mac):
+    # Keep the original timestamp so that the pending changes are
+    # replayed in the order in which they were requested.
+    _merge_pending_ucast_mac_remote(session, models.PendingUcastMacsRemote(
+        uuid=outbox_mac.uuid,
+        mac=outbox_mac.mac,
+        logical_switch_uuid=outbox_mac.logical_switch_uuid,
+        locator_uuid=outbox_mac.locator_uuid,
+        dst_ip=outbox_mac.dst_ip,
+        vm_ip=outbox_mac.vm_ip,
+        ovsdb_identifier=outbox_mac.ovsdb_identifier,
+        operation=outbox_mac.operation,
+        timestamp=outbox_mac.timestamp))
+
+
 def get_all_pending_remote_macs_in_asc_order(context, ovsdb_identifier):
     """Get all the pending remote macs in ascending order of timestamp."""
     session = context.session
@@ -498,6 +841,48 @@ def get_all_pending_remote_macs_in_asc_order(context, ovsdb_identifier):
                             asc(models.PendingUcastMacsRemote.timestamp)).all()
 
 
+def get_pending_remote_macs_in_asc_order(context, ovsdb_identifier, limit,
+                                         marker=None):
+    """Get a page of the pending remote macs in ascending order of timestamp.
+
+    marker is the (timestamp, id) of the last pending mac of the previous
+    page, the macs are ordered by id within a timestamp so that the pages
+    do not overlap.
+    """
+    pending_macs = models.PendingUcastMacsRemote
+    query = context.session.query(pending_macs).filter_by(
+        ovsdb_identifier=ovsdb_identifier)
+    if marker:
+        timestamp, pending_mac_id = marker
+        query = query.filter(sa.or_(
+            pending_macs.timestamp > timestamp,
+            sa.and_(pending_macs.timestamp == timestamp,
+                    pending_macs.id > pending_mac_id)))
+    return query.order_by(asc(pending_macs.timestamp),
+                          asc(pending_macs.id)).limit(limit).all()
+
+
+def iter_pending_remote_macs_in_asc_order(context, ovsdb_identifier,
+                                          page_size=1000):
+    """Iterate over the pending remote macs in ascending order of timestamp.
+
+    The pending macs are loaded page_size at a time, the pages follow the
+    last returned mac so that the macs deleted in the meantime do not
+    shift them.
+    """
+    marker = None
+    while True:
+        page = get_pending_remote_macs_in_asc_order(
+            context, ovsdb_identifier, page_size, marker)
+        if not page:
+            return
+        marker = (page[-1].timestamp, page[-1].id)
+        for pending_mac in page:
+            yield pending_mac
+        if len(page) < page_size:
+            return
+
+
 def get_all_ucast_mac_remote_by_ls(context, record_dict):
     """Get ucast macs remote that matches ls_id and ovsdb_identifier."""
     session = context.session
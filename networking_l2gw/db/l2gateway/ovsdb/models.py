@@ -14,10 +14,15 @@
 # limitations under the License.
 
 import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
 
 from neutron.db import model_base
 from neutron.db import models_v2
 
+# The pending changes are replayed in the order of their timestamp, MySQL
+# would truncate a DATETIME to the second.
+PreciseDateTime = sa.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
+
 
 class PhysicalLocators(model_base.BASEV2):
     __tablename__ = 'physical_locators'
@@ -26,7 +31,9 @@ class PhysicalLocators(model_base.BASEV2):
     ovsdb_identifier = sa.Column(sa.String(64), nullable=False,
                                  primary_key=True)
     __table_args__ = (sa.UniqueConstraint(uuid,
-                                          ovsdb_identifier),)
+                                          ovsdb_identifier),
+                      sa.Index('ix_physical_locators_dst_ip_ovsdb',
+                               dst_ip, ovsdb_identifier),)
 
 
 class PhysicalSwitches(model_base.BASEV2):
@@ -38,7 +45,9 @@ class PhysicalSwitches(model_base.BASEV2):
                                  primary_key=True)
     switch_fault_status = sa.Column(sa.String(length=32), nullable=True)
     __table_args__ = (sa.UniqueConstraint(uuid,
-                                          ovsdb_identifier),)
+                                          ovsdb_identifier),
+                      sa.Index('ix_physical_switches_name_ovsdb',
+                               name, ovsdb_identifier),)
 
 
 class PhysicalPorts(model_base.BASEV2):
@@ -61,7 +70,9 @@ class LogicalSwitches(model_base.BASEV2):
     ovsdb_identifier = sa.Column(sa.String(64), nullable=False,
                                  primary_key=True)
     __table_args__ = (sa.UniqueConstraint(uuid,
-                                          ovsdb_identifier),)
+                                          ovsdb_identifier),
+                      sa.Index('ix_logical_switches_name_ovsdb',
+                               name, ovsdb_identifier),)
 
 
 class UcastMacsLocals(model_base.BASEV2):
@@ -87,7 +98,9 @@ class UcastMacsRemotes(model_base.BASEV2):
     ovsdb_identifier = sa.Column(sa.String(64), nullable=False,
                                  primary_key=True)
     __table_args__ = (sa.UniqueConstraint(uuid,
-                                          ovsdb_identifier),)
+                                          ovsdb_identifier),
+                      sa.Index('ix_ucast_macs_remotes_mac_ls_ovsdb',
+                               mac, logical_switch_id, ovsdb_identifier),)
 
 
 class VlanBindings(model_base.BASEV2):
@@ -100,7 +113,9 @@ class VlanBindings(model_base.BASEV2):
                                  primary_key=True)
     __table_args__ = (sa.UniqueConstraint(port_uuid, vlan,
                                           logical_switch_uuid,
-                                          ovsdb_identifier),)
+                                          ovsdb_identifier),
+                      sa.Index('ix_vlan_bindings_ls_ovsdb',
+                               logical_switch_uuid, ovsdb_identifier),)
 
 
 class PendingUcastMacsRemote(model_base.BASEV2, models_v2.HasId):
@@ -113,4 +128,28 @@ class PendingUcastMacsRemote(model_base.BASEV2, models_v2.HasId):
     vm_ip = sa.Column(sa.String(64))
     ovsdb_identifier = sa.Column(sa.String(64), nullable=False)
     operation = sa.Column(sa.String(8), nullable=False)
-    timestamp = sa.Column(sa.DateTime, nullable=False)
+    timestamp = sa.Column(PreciseDateTime, nullable=False)
+    __table_args__ = (sa.Index('ix_pending_ucast_macs_remotes_ovsdb_ts',
+                               ovsdb_identifier, timestamp),
+                      sa.Index('ix_pending_ucast_macs_remotes_mac_ls',
+                               mac, logical_switch_uuid, ovsdb_identifier,
+                               operation),)
+
+
+class UcastMacsRemoteOutbox(model_base.BASEV2):
+    """Remote MAC changes cast to an agent and not acknowledged yet."""
+    __tablename__ = 'ucast_macs_remote_outbox'
+    op_id = sa.Column(sa.String(36), nullable=False, primary_key=True)
+    seq = sa.Column(sa.Integer, nullable=False, primary_key=True,
+                    autoincrement=False)
+    uuid = sa.Column(sa.String(36), nullable=True)
+    mac = sa.Column(sa.String(32), nullable=False)
+    logical_switch_uuid = sa.Column(sa.String(36), nullable=True)
+    locator_uuid = sa.Column(sa.String(36), nullable=True)
+    dst_ip = sa.Column(sa.String(64))
+    vm_ip = sa.Column(sa.String(64))
+    ovsdb_identifier = sa.Column(sa.String(64), nullable=False)
+    operation = sa.Column(sa.String(8), nullable=False)
+    timestamp = sa.Column(PreciseDateTime, nullable=False)
+    __table_args__ = (sa.Index('ix_ucast_macs_remote_outbox_ovsdb_ts',
+                               ovsdb_identifier, timestamp),)
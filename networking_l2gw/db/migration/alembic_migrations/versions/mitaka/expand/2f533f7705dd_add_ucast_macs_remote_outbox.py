@@ -0,0 +1,53 @@
+# Copyright 2016 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""add ucast_macs_remote_outbox
+
+Revision ID: 2f533f7705dd
+Revises: 60019185aa99
+Create Date: 2016-01-20 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2f533f7705dd'
+down_revision = '60019185aa99'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('ucast_macs_remote_outbox',
+                    sa.Column('op_id', sa.String(length=36), nullable=False),
+                    sa.Column('seq', sa.Integer(), nullable=False,
+                              autoincrement=False),
+                    sa.Column('uuid', sa.String(length=36), nullable=True),
+                    sa.Column('mac', sa.String(length=32), nullable=False),
+                    sa.Column('logical_switch_uuid', sa.String(length=36),
+                              nullable=True),
+                    sa.Column('locator_uuid', sa.String(length=36),
+                              nullable=True),
+                    sa.Column('dst_ip', sa.String(length=64), nullable=True),
+                    sa.Column('vm_ip', sa.String(length=64), nullable=True),
+                    sa.Column('ovsdb_identifier', sa.String(length=64),
+                              nullable=False),
+                    sa.Column('operation', sa.String(length=8),
+                              nullable=False),
+                    sa.Column('timestamp', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('op_id', 'seq'))
+    op.create_index('ix_ucast_macs_remote_outbox_ovsdb_ts',
+                    'ucast_macs_remote_outbox',
+                    ['ovsdb_identifier', 'timestamp'])
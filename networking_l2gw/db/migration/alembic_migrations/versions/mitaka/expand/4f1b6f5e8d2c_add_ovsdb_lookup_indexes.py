@@ -0,0 +1,46 @@
+# Copyright 2016 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""add lookup indexes to the ovsdb tables
+
+Revision ID: 4f1b6f5e8d2c
+Revises: 2f533f7705dd
+Create Date: 2016-02-03 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4f1b6f5e8d2c'
+down_revision = '2f533f7705dd'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_logical_switches_name_ovsdb',
+                    'logical_switches',
+                    ['name', 'ovsdb_identifier'])
+    op.create_index('ix_physical_switches_name_ovsdb',
+                    'physical_switches',
+                    ['name', 'ovsdb_identifier'])
+    op.create_index('ix_physical_locators_dst_ip_ovsdb',
+                    'physical_locators',
+                    ['dst_ip', 'ovsdb_identifier'])
+    op.create_index('ix_ucast_macs_remotes_mac_ls_ovsdb',
+                    'ucast_macs_remotes',
+                    ['mac', 'logical_switch_id', 'ovsdb_identifier'])
+    op.create_index('ix_vlan_bindings_ls_ovsdb',
+                    'vlan_bindings',
+                    ['logical_switch_uuid', 'ovsdb_identifier'])
@@ -0,0 +1,38 @@
+# Copyright 2016 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""add pending_ucast_macs_remotes indexes
+
+Revision ID: 5a3c8e2b9d41
+Revises: 4f1b6f5e8d2c
+Create Date: 2016-02-05 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5a3c8e2b9d41'
+down_revision = '4f1b6f5e8d2c'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('ix_pending_ucast_macs_remotes_ovsdb_ts',
+                    'pending_ucast_macs_remotes',
+                    ['ovsdb_identifier', 'timestamp'])
+    op.create_index('ix_pending_ucast_macs_remotes_mac_ls',
+                    'pending_ucast_macs_remotes',
+                    ['mac', 'logical_switch_uuid', 'ovsdb_identifier',
+                     'operation'])
@@ -0,0 +1,38 @@
+# Copyright 2016 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+#
+
+"""keep the microseconds of the pending ucast_macs_remotes timestamps
+
+Revision ID: 7c2d4e6f8a13
+Revises: 5a3c8e2b9d41
+Create Date: 2016-02-12 00:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7c2d4e6f8a13'
+down_revision = '5a3c8e2b9d41'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+precise_datetime = sa.DateTime().with_variant(mysql.DATETIME(fsp=6), 'mysql')
+
+
+def upgrade():
+    for table in ('pending_ucast_macs_remotes', 'ucast_macs_remote_outbox'):
+        op.alter_column(table, 'timestamp', type_=precise_datetime,
+                        existing_type=sa.DateTime(), nullable=False)
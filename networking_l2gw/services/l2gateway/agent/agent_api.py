@@ -19,7 +19,12 @@ import oslo_messaging as messaging
 
 
 class L2GatewayAgentApi(object):
-    """Agent side of the Agent to Plugin RPC API."""
+    """Agent side of the Agent to Plugin RPC API.
+
+    API version history:
+        1.0 - Initial version.
+        1.1 - Added ack_vif_operation.
+    """
 
     API_VERSION = '1.0'
 
@@ -39,3 +44,10 @@ class L2GatewayAgentApi(object):
         return cctxt.cast(context,
                           'notify_ovsdb_states',
                           ovsdb_states=ovsdb_states)
+
+    def ack_vif_operation(self, context, op_id, errors):
+        cctxt = self.client.prepare(version='1.1')
+        return cctxt.cast(context,
+                          'ack_vif_operation',
+                          op_id=op_id,
+                          errors=errors)
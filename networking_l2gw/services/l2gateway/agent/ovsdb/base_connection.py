@@ -13,18 +13,20 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-import copy
 import socket
 import ssl
 import time
 
 import eventlet
+from eventlet import event
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_utils import excutils
 
 from networking_l2gw._i18n import _LE, _LW
+from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_framer
+from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_replica
 from networking_l2gw.services.l2gateway.common import constants as n_const
 
 LOG = logging.getLogger(__name__)
@@ -39,7 +41,8 @@ class BaseConnection(object):
        on a given host and TCP port.
     """
     def __init__(self, conf, gw_config):
-        self.responses = []
+        self.pending_requests = {}
+        self.framers = {}
         self.connected = False
         self.enable_manager = cfg.CONF.ovsdb.enable_manager
         if self.enable_manager:
@@ -49,8 +52,10 @@ class BaseConnection(object):
             eventlet.greenthread.spawn(self._rcv_socket)
             self.ovsdb_dicts = {}
             self.ovsdb_fd_states = {}
+            self.replicas = {}
         else:
             self.gw_config = gw_config
+            self.replica = None
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             if gw_config.use_ssl:
                 ssl_sock = ssl.wrap_socket(
@@ -104,44 +109,42 @@ class BaseConnection(object):
             eventlet.greenthread.spawn(self._common_sock_rcv_thread, addr)
 
     def _common_sock_rcv_thread(self, addr):
-        chunks = []
-        lc = rc = 0
-        prev_char = None
         self._echo_response(addr)
         if self.enable_manager and self.check_c_sock:
+            framer = self._get_framer(addr)
             while self.read_on:
                 response = self.ovsdb_dicts.get(addr).recv(n_const.BUFFER_SIZE)
                 self.ovsdb_fd_states[addr] = 'connected'
                 eventlet.greenthread.sleep(0)
                 self.check_sock_rcv = True
                 if response:
-                    response = response.decode('utf8')
-                    message_mark = 0
-                    for i, c in enumerate(response):
-                        if c == '{' and not (prev_char and
-                                             prev_char == '\\'):
-                            lc += 1
-                        elif c == '}' and not (prev_char and
-                                               prev_char == '\\'):
-                            rc += 1
-                        if rc > lc:
-                            raise Exception(_LE("json string not valid"))
-                        elif lc == rc and lc is not 0:
-                            chunks.append(response[message_mark:i + 1])
-                            message = "".join(chunks)
-                            eventlet.greenthread.spawn_n(
-                                self._on_remote_message, message, addr)
-                            eventlet.greenthread.sleep(0)
-                            lc = rc = 0
-                            message_mark = i + 1
-                            chunks = []
-                        prev_char = c
-                    chunks.append(response[message_mark:])
+                    for message in framer.feed(response):
+                        eventlet.greenthread.spawn_n(
+                            self._on_remote_message, message, addr)
+                        eventlet.greenthread.sleep(0)
                 else:
                     self.read_on = False
                     self.disconnect(addr)
                     self.ovsdb_fd_states[addr] = 'disconnected'
 
+    def _get_framer(self, addr=None):
+        """Returns the JSON-RPC framer of the given connection."""
+        framer = self.framers.get(addr)
+        if framer is None:
+            framer = ovsdb_framer.JSONRPCFramer()
+            self.framers[addr] = framer
+        return framer
+
+    def _get_replica(self, addr=None):
+        """Returns the replica of the given OVSDB server tables, if any."""
+        if self.enable_manager:
+            replica = self.replicas.get(addr)
+            if replica is None:
+                replica = ovsdb_replica.OVSDBReplica()
+                self.replicas[addr] = replica
+            return replica
+        return self.replica
+
     def _echo_response(self, addr):
         while True:
             try:
@@ -160,10 +163,19 @@ class BaseConnection(object):
             except Exception:
                 continue
 
-    def send(self, message, callback=None, addr=None):
-        """Sends a message to the OVSDB server."""
+    def send(self, message, callback=None, addr=None, rcv_required=True):
+        """Sends a message to the OVSDB server.
+
+           The response to a request is only kept when rcv_required is
+           set, as nobody waits for the response otherwise.
+        """
         if callback:
             self.callbacks[message['id']] = callback
+        op_id = None
+        if rcv_required and message.get('method'):
+            op_id = message.get('id')
+        if op_id is not None:
+            self._register_request(op_id)
         retry_count = 0
         bytes_sent = 0
         while retry_count <= n_const.MAX_RETRIES:
@@ -182,6 +194,7 @@ class BaseConnection(object):
 
         LOG.warning(_LW("Could not send message to the "
                         "OVSDB server."))
+        self.pending_requests.pop(op_id, None)
         self.disconnect(addr)
         return False
 
@@ -192,16 +205,35 @@ class BaseConnection(object):
             del self.ovsdb_dicts[addr]
         else:
             self.socket.close()
+        self.framers.pop(addr, None)
         self.connected = False
 
+    def _register_request(self, operation_id):
+        """Registers the event the response to a request completes."""
+        self.pending_requests[operation_id] = event.Event()
+
+    def _complete_request(self, message):
+        """Hands a response over to the request waiting for it."""
+        operation_id = message.get('id')
+        pending = self.pending_requests.get(operation_id)
+        if pending is None or pending.ready():
+            LOG.debug("Discarding response for unknown request %s",
+                      operation_id)
+            return False
+        pending.send(message)
+        return True
+
     def _response(self, operation_id):
-        x_copy = None
-        to_delete = None
-        for x in self.responses:
-            if x['id'] == operation_id:
-                x_copy = copy.deepcopy(x)
-                to_delete = x
-                break
-        if to_delete:
-            self.responses.remove(to_delete)
-        return x_copy
+        """Waits for the response to the request with the given id.
+
+           Returns None if the request is unknown or the OVSDB server
+           did not respond in time.
+        """
+        pending = self.pending_requests.get(operation_id)
+        if pending is None:
+            return
+        try:
+            with eventlet.Timeout(cfg.CONF.ovsdb.response_timeout, False):
+                return pending.wait()
+        finally:
+            self.pending_requests.pop(operation_id, None)
@@ -14,12 +14,14 @@
 #    under the License.
 
 import eventlet
+import functools
 
 from contextlib import contextmanager
 from neutron import context as ctx
 
 from oslo_config import cfg
 from oslo_log import log as logging
+import oslo_messaging
 from oslo_service import loopingcall
 
 from networking_l2gw._i18n import _LE
@@ -27,7 +29,9 @@ from networking_l2gw.services.l2gateway.agent import base_agent_manager
 from networking_l2gw.services.l2gateway.agent import l2gateway_config
 from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_common_class
 from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_monitor
-from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_writer
+from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_replica
+from networking_l2gw.services.l2gateway.agent.ovsdb import transaction_batcher
+from networking_l2gw.services.l2gateway.agent.ovsdb import writer_pool
 from networking_l2gw.services.l2gateway.common import constants as n_const
 
 LOG = logging.getLogger(__name__)
@@ -39,6 +43,12 @@ class OVSDBManager(base_agent_manager.BaseAgentManager):
        Listens to state change notifications from OVSDB servers and
        handles transactions (RPCs) destined to OVSDB servers.
     """
+    # 1.0 Initial version
+    # 1.1 Added add_vifs_to_gateway and update_vifs_to_gateway
+    # 1.2 Added op_id to add_vifs_to_gateway, update_vifs_to_gateway and
+    #     delete_vif_from_gateway
+    target = oslo_messaging.Target(version='1.2')
+
     def __init__(self, conf=None):
         super(OVSDBManager, self).__init__(conf)
         self._extract_ovsdb_config(conf)
@@ -49,8 +59,17 @@ class OVSDBManager(base_agent_manager.BaseAgentManager):
             self.looping_task_ovsdb_states = (
                 loopingcall.FixedIntervalLoopingCall(self._send_ovsdb_states))
         else:
+            self.writer_pools = {}
+            self.mac_batchers = {}
+            self.replicas = {}
             self.looping_task = loopingcall.FixedIntervalLoopingCall(
                 self._connect_to_ovsdb_server)
+            if self.conf.ovsdb.writer_keepalive_interval:
+                self.looping_task_keepalive = (
+                    loopingcall.FixedIntervalLoopingCall(
+                        self._keepalive_writer_connections))
+                self.looping_task_keepalive.start(
+                    interval=self.conf.ovsdb.writer_keepalive_interval)
 
     def _extract_ovsdb_config(self, conf):
         self.conf = conf or cfg.CONF
@@ -115,7 +134,8 @@ class OVSDBManager(base_agent_manager.BaseAgentManager):
                         ovsdb_fd = ovsdb_monitor.OVSDBMonitor(
                             self.conf.ovsdb,
                             gateway,
-                            self.agent_to_plugin_rpc)
+                            self.agent_to_plugin_rpc,
+                            self._get_replica(key))
                     except Exception:
                         ovsdb_states[key] = 'disconnected'
                         # Log a warning and continue so that it can be
@@ -161,6 +181,11 @@ class OVSDBManager(base_agent_manager.BaseAgentManager):
                 ovsdb_fd = gateway.ovsdb_fd
                 if ovsdb_fd and ovsdb_fd.connected:
                     gateway.ovsdb_fd.disconnect()
+        self._close_writer_pools()
+
+    def _close_writer_pools(self):
+        for ovsdb_identifier in list(self.writer_pools):
+            self.writer_pools.pop(ovsdb_identifier).close()
 
     def set_monitor_agent(self, context, hostname):
         """Handle RPC call from plugin to update agent type.
@@ -221,17 +246,60 @@ class OVSDBManager(base_agent_manager.BaseAgentManager):
                 gateway,
                 self.agent_to_plugin_rpc)
 
+    def _get_replica(self, ovsdb_identifier):
+        # The replica is shared by the monitor of the OVSDB server, which
+        # keeps it up to date, and the writers, which look rows up in it.
+        replica = self.replicas.get(ovsdb_identifier)
+        if replica is None:
+            replica = ovsdb_replica.OVSDBReplica()
+            self.replicas[ovsdb_identifier] = replica
+        return replica
+
+    def _get_writer_pool(self, ovsdb_identifier):
+        pool = self.writer_pools.get(ovsdb_identifier)
+        if pool is None:
+            gateway = self.gateways.get(ovsdb_identifier)
+            pool = writer_pool.OVSDBWriterPool(
+                self.conf.ovsdb, gateway, self._get_replica(ovsdb_identifier))
+            self.writer_pools[ovsdb_identifier] = pool
+        return pool
+
     @contextmanager
     def _open_connection(self, ovsdb_identifier):
-        ovsdb_fd = None
-        gateway = self.gateways.get(ovsdb_identifier)
-        try:
-            ovsdb_fd = ovsdb_writer.OVSDBWriter(self.conf.ovsdb,
-                                                gateway)
+        pool = self._get_writer_pool(ovsdb_identifier)
+        with pool.connection() as ovsdb_fd:
             yield ovsdb_fd
-        finally:
-            if ovsdb_fd:
-                ovsdb_fd.disconnect()
+
+    def _commit_mac_requests(self, ovsdb_identifier, requests):
+        with self._open_connection(ovsdb_identifier) as ovsdb_fd:
+            return ovsdb_fd.transact_ucast_macs_remote(requests,
+                                                       ovsdb_identifier)
+
+    def _transact_mac_request(self, ovsdb_identifier, request):
+        # Remote MAC changes are coalesced with the ones arriving for the
+        # same OVSDB server in the batching window.
+        if not self.conf.ovsdb.mac_batch_window:
+            errors = self._commit_mac_requests(ovsdb_identifier, [request])
+            if errors[0] is not None:
+                raise errors[0]
+            return
+        batcher = self.mac_batchers.get(ovsdb_identifier)
+        if batcher is None:
+            batcher = transaction_batcher.OVSDBTransactionBatcher(
+                functools.partial(self._commit_mac_requests,
+                                  ovsdb_identifier),
+                self.conf.ovsdb.mac_batch_window,
+                self.conf.ovsdb.mac_batch_max_ops)
+            self.mac_batchers[ovsdb_identifier] = batcher
+        batcher.submit(request)
+
+    def _keepalive_writer_connections(self):
+        for pool in list(self.writer_pools.values()):
+            try:
+                pool.keepalive()
+            except Exception as ex:
+                LOG.exception(_LE("Exception %s while checking the idle "
+                                  "OVSDB connections"), ex)
 
     def _is_valid_request(self, ovsdb_identifier):
         val_req = ovsdb_identifier and ovsdb_identifier in self.gateways.keys()
@@ -279,15 +347,19 @@ class OVSDBManager(base_agent_manager.BaseAgentManager):
                     mac_dict, ovsdb_identifier)
         elif not self.enable_manager:
             if self._is_valid_request(ovsdb_identifier):
-                with self._open_connection(ovsdb_identifier) as ovsdb_fd:
-                    ovsdb_fd.insert_ucast_macs_remote(logical_switch_dict,
-                                                      locator_dict,
-                                                      mac_dict,
-                                                      ovsdb_identifier)
+                self._transact_mac_request(
+                    ovsdb_identifier,
+                    ('insert', (logical_switch_dict, locator_dict,
+                                mac_dict)))
 
     def delete_vif_from_gateway(self, context, ovsdb_identifier,
-                                logical_switch_uuid, mac):
+                                logical_switch_uuid, mac, op_id=None):
         """Handle RPC cast from plugin to delete neutron port MACs."""
+        if op_id:
+            requests = [('delete', (logical_switch_uuid, [m])) for m in mac]
+            self._handle_mac_requests(context, ovsdb_identifier,
+                                      requests, op_id)
+            return
         if self.enable_manager and self.l2gw_agent_type == n_const.MONITOR:
             self.ovsdb_fd.delete_ucast_macs_remote(logical_switch_uuid, mac,
                                                    ovsdb_identifier,
@@ -302,9 +374,9 @@ class OVSDBManager(base_agent_manager.BaseAgentManager):
                     mac, ovsdb_identifier)
         elif not self.enable_manager:
             if self._is_valid_request(ovsdb_identifier):
-                with self._open_connection(ovsdb_identifier) as ovsdb_fd:
-                    ovsdb_fd.delete_ucast_macs_remote(
-                        logical_switch_uuid, mac, ovsdb_identifier)
+                self._transact_mac_request(
+                    ovsdb_identifier,
+                    ('delete', (logical_switch_uuid, mac)))
 
     def update_vif_to_gateway(self, context, ovsdb_identifier,
                               locator_dict, mac_dict):
@@ -326,9 +398,76 @@ class OVSDBManager(base_agent_manager.BaseAgentManager):
                                                        ovsdb_identifier)
         elif not self.enable_manager:
             if self._is_valid_request(ovsdb_identifier):
-                with self._open_connection(ovsdb_identifier) as ovsdb_fd:
-                    ovsdb_fd.update_ucast_macs_remote(
-                        locator_dict, mac_dict, ovsdb_identifier)
+                self._transact_mac_request(
+                    ovsdb_identifier,
+                    ('update', (locator_dict, mac_dict)))
+
+    def add_vifs_to_gateway(self, context, ovsdb_identifier,
+                            logical_switch_vifs, op_id=None):
+        """Handle RPC from plugin to insert several neutron port MACs.
+
+        Returns the error for each MAC, None for the inserted ones. When
+        the RPC is cast with an op_id, the errors are acknowledged to
+        the plugin instead.
+        """
+        requests = []
+        for ls_vifs in logical_switch_vifs:
+            for vif in ls_vifs['vifs']:
+                requests.append(('insert', (ls_vifs['logical_switch_dict'],
+                                            vif['locator_dict'],
+                                            vif['mac_dict'])))
+        return self._handle_mac_requests(context, ovsdb_identifier,
+                                         requests, op_id)
+
+    def update_vifs_to_gateway(self, context, ovsdb_identifier, vifs,
+                               op_id=None):
+        """Handle RPC from plugin to update several neutron port MACs.
+
+        Returns the error for each MAC, None for the updated ones. When
+        the RPC is cast with an op_id, the errors are acknowledged to
+        the plugin instead.
+        """
+        requests = [('update', (vif['locator_dict'], vif['mac_dict']))
+                    for vif in vifs]
+        return self._handle_mac_requests(context, ovsdb_identifier,
+                                         requests, op_id)
+
+    def _handle_mac_requests(self, context, ovsdb_identifier, requests,
+                             op_id=None):
+        try:
+            errors = self._apply_mac_requests(context, ovsdb_identifier,
+                                              requests)
+        except Exception as ex:
+            if not op_id:
+                raise
+            LOG.exception(_LE("Exception %(ex)s while applying the remote "
+                              "MAC changes %(op_id)s"),
+                          {'ex': ex, 'op_id': op_id})
+            errors = [str(ex)] * len(requests)
+        if op_id:
+            self.plugin_rpc.ack_vif_operation(ctx.get_admin_context(),
+                                              op_id, errors)
+        return errors
+
+    def _apply_mac_requests(self, context, ovsdb_identifier, requests):
+        if self.enable_manager:
+            # The connections accepted from the OVSDB manager are shared
+            # with the monitor, so the requests are applied one by one.
+            handlers = {'insert': self.add_vif_to_gateway,
+                        'update': self.update_vif_to_gateway,
+                        'delete': self.delete_vif_from_gateway}
+            errors = []
+            for operation, args in requests:
+                try:
+                    handlers[operation](context, ovsdb_identifier, *args)
+                    errors.append(None)
+                except Exception as ex:
+                    errors.append(str(ex))
+            return errors
+        if not self._is_valid_request(ovsdb_identifier):
+            return [None] * len(requests)
+        errors = self._commit_mac_requests(ovsdb_identifier, requests)
+        return [str(error) if error else None for error in errors]
 
     def update_connection_to_gateway(self, context, ovsdb_identifier,
                                      logical_switch_dict, locator_dicts,
@@ -0,0 +1,102 @@
+# Copyright (c) 2015 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import re
+
+from networking_l2gw._i18n import _LE
+
+# Characters that change the framing state outside and inside of a
+# JSON string respectively.
+_STRUCTURAL_CHARS = re.compile(b'[{}"]')
+_STRING_CHARS = re.compile(b'["\\\\]')
+
+
+class JSONRPCFramer(object):
+    """Splits a stream of bytes into complete JSON-RPC messages.
+
+       OVSDB sends JSON-RPC messages back to back on the socket, and a
+       single recv() may carry a partial message or several of them.
+       The framer buffers the received bytes and tracks the object
+       nesting depth, ignoring braces that appear inside JSON strings,
+       so that every complete top level object is emitted exactly once.
+       Only the structural characters are visited, which keeps large
+       monitor dumps cheap to frame.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, data):
+        """Appends data and returns the list of messages it completed."""
+        buf = self._buffer
+        buf.extend(data)
+        messages = []
+        pos = self._pos
+        start = 0
+        while True:
+            if self._in_string:
+                match = _STRING_CHARS.search(buf, pos)
+                if not match:
+                    pos = len(buf)
+                    break
+                pos = match.start()
+                if match.group() == b'\\':
+                    if pos + 1 >= len(buf):
+                        # Wait for the escaped character.
+                        break
+                    pos += 2
+                    continue
+                self._in_string = False
+                pos += 1
+                continue
+            match = _STRUCTURAL_CHARS.search(buf, pos)
+            if not match:
+                pos = len(buf)
+                break
+            pos = match.start()
+            char = match.group()
+            if char == b'"':
+                self._in_string = True
+            elif char == b'{':
+                if not self._depth:
+                    start = pos
+                self._depth += 1
+            else:
+                if not self._depth:
+                    self.reset()
+                    raise ValueError(_LE("json string not valid"))
+                self._depth -= 1
+                if not self._depth:
+                    messages.append(
+                        bytes(buf[start:pos + 1]).decode('utf8'))
+                    start = pos + 1
+            pos += 1
+        # Drop everything that has been consumed. Outside of a message
+        # only whitespace can be left over.
+        if not self._depth:
+            start = pos
+        del buf[:start]
+        self._pos = pos - start
+        return messages
+
+    def reset(self):
+        """Discards any partially received message."""
+        del self._buffer[:]
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
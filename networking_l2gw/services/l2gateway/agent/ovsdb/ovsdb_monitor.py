@@ -13,14 +13,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import copy
 import random
 
 import eventlet
+from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
 from oslo_utils import excutils
 
-from networking_l2gw._i18n import _LE
+from networking_l2gw._i18n import _LE, _LI
 from networking_l2gw.services.l2gateway.agent.ovsdb import base_connection
 from networking_l2gw.services.l2gateway.common import constants as n_const
 from networking_l2gw.services.l2gateway.common import ovsdb_schema
@@ -28,16 +30,26 @@ from networking_l2gw.services.l2gateway import exceptions
 
 LOG = logging.getLogger(__name__)
 
+# Columns of the monitored tables, keyed by table name, with their default
+# values. The other columns are neither sent by the OVSDB server nor decoded.
+MONITORED_COLUMNS = ovsdb_schema.get_monitored_columns()
+
+# Error of the OVSDB servers not implementing a JSON-RPC method.
+UNKNOWN_METHOD_ERROR = 'unknown method'
+
 
 class OVSDBMonitor(base_connection.BaseConnection):
     """Monitors OVSDB servers."""
-    def __init__(self, conf, gw_config, callback):
+    def __init__(self, conf, gw_config, callback, replica=None):
         super(OVSDBMonitor, self).__init__(conf, gw_config)
+        if not self.enable_manager:
+            self.replica = replica
         self.rpc_callback = callback
         self.callbacks = {}
         self._setup_dispatch_table()
         self.read_on = True
         self.handlers = {"echo": self._default_echo_handler}
+        self._update2_backlog = {}
         if self.enable_manager:
             self.check_monitor_table_thread = False
         if not self.enable_manager:
@@ -91,24 +103,29 @@ class OVSDBMonitor(base_connection.BaseConnection):
     def set_monitor_response_handler(self, addr=None):
         """Monitor OVSDB tables to receive events for any changes in OVSDB."""
         if self.connected:
+                # Conditional monitoring sends only the processed columns
+                # and the changed values of the modified rows, which are
+                # merged into the rows kept in the replica.
+                if self._get_replica(addr):
+                    try:
+                        if self._monitor_cond(addr):
+                            return
+                    except exceptions.OVSDBError:
+                        with excutils.save_and_reraise_exception():
+                            if self.enable_manager:
+                                self.check_monitor_table_thread = False
+                            LOG.exception(_LE("Exception while receiving "
+                                              "the response for the "
+                                              "monitor_cond message"))
+                    LOG.info(_LI("Falling back to the monitor request as "
+                                 "the OVSDB server does not implement the "
+                                 "monitor_cond request"))
                 op_id = str(random.getrandbits(128))
-                props = {'select': {'initial': True,
-                                    'insert': True,
-                                    'delete': True,
-                                    'modify': True}}
                 monitor_message = {'id': op_id,
                                    'method': 'monitor',
                                    'params': [n_const.OVSDB_SCHEMA_NAME,
                                               None,
-                                              {'Logical_Switch': [props],
-                                               'Physical_Switch': [props],
-                                               'Physical_Port': [props],
-                                               'Ucast_Macs_Local': [props],
-                                               'Ucast_Macs_Remote': [props],
-                                               'Physical_Locator': [props],
-                                               'Mcast_Macs_Local': [props],
-                                               'Physical_Locator_Set': [props]}
-                                              ]}
+                                              self._get_monitor_requests()]}
                 self._set_handler("update", self._update_event_handler)
                 if not self.send(monitor_message, addr=addr):
                     # Return so that this will retried in the next iteration
@@ -123,9 +140,49 @@ class OVSDBMonitor(base_connection.BaseConnection):
                                           "response for the monitor message"))
                 self._process_monitor_msg(response_result, addr)
 
+    def _monitor_cond(self, addr=None):
+        """Sends a monitor_cond request.
+
+           Returns False if the OVSDB server does not implement the
+           request, True otherwise. The other errors are raised.
+        """
+        op_id = str(random.getrandbits(128))
+        monitor_message = {'id': op_id,
+                           'method': 'monitor_cond',
+                           'params': [n_const.OVSDB_SCHEMA_NAME,
+                                      None,
+                                      self._get_monitor_requests()]}
+        self._set_handler("update2", self._update2_event_handler)
+        if not self.send(monitor_message, addr=addr):
+            # Return so that this will retried in the next iteration
+            return True
+        result = self._response(op_id)
+        error = result and result.get("error", None)
+        if (error == UNKNOWN_METHOD_ERROR or (
+                isinstance(error, dict) and
+                error.get("error") == UNKNOWN_METHOD_ERROR)):
+            return False
+        response_result = self._process_response_result(result)
+        self._process_monitor_cond_msg(response_result, addr)
+        return True
+
+    def _get_monitor_requests(self):
+        """Returns the monitor requests of the monitored tables."""
+        requests = {}
+        for table_name, columns in MONITORED_COLUMNS.items():
+            requests[table_name] = [{'columns': sorted(columns),
+                                     'select': {'initial': True,
+                                                'insert': True,
+                                                'delete': True,
+                                                'modify': True}}]
+        return requests
+
     def _update_event_handler(self, message, addr):
         self._process_update_event(message, addr)
 
+    def _update2_event_handler(self, message, addr):
+        self._process_update2_event(message, addr)
+
     def _process_update_event(self, message, addr):
         """Process update event that is triggered by the OVSDB server."""
         LOG.debug("_process_update_event: message = %s ", str(message))
@@ -133,8 +190,94 @@ class OVSDBMonitor(base_connection.BaseConnection):
         if message.get('method') == 'update':
             params_list = message.get('params')
             param_dict = params_list[1]
+            replica = self._get_replica(addr)
+            if replica:
+                replica.update(param_dict)
             self._process_tables(param_dict, data_dict)
-            self.rpc_callback(self._form_ovsdb_data(data_dict, addr))
+            self._notify_plugin(data_dict, addr)
+
+    def _process_update2_event(self, message, addr):
+        """Process update2 event that is triggered by the OVSDB server."""
+        LOG.debug("_process_update2_event: message = %s ", str(message))
+        replica = self._get_replica(addr)
+        if not replica.synced:
+            # The notification was handled before the reply to the
+            # monitor_cond request, the rows it modifies are not known yet.
+            self._update2_backlog.setdefault(addr, []).append(message)
+            return
+        data_dict = self._initialize_data_dict()
+        param_dict = self._get_table_updates(message.get('params')[1],
+                                             replica)
+        replica.update(param_dict)
+        self._process_tables(param_dict, data_dict)
+        self._notify_plugin(data_dict, addr)
+
+    def _get_table_updates(self, table_updates2, replica):
+        """Converts the update2 notation into the old/new rows of update."""
+        table_updates = {}
+        for table_name, table_dict in table_updates2.items():
+            columns = MONITORED_COLUMNS.get(table_name, {})
+            row_updates = {}
+            for uuid, row_update in table_dict.items():
+                old_row = replica.get_row(table_name, uuid)
+                if 'modify' in row_update:
+                    new_row = dict(old_row or self._get_default_row(columns))
+                    for column, diff in row_update['modify'].items():
+                        new_row[column] = self._apply_diff(
+                            new_row.get(column), diff, columns.get(column))
+                    row_updates[uuid] = {'old': old_row or {},
+                                         'new': new_row}
+                elif 'delete' in row_update:
+                    if old_row is not None:
+                        row_updates[uuid] = {'old': old_row}
+                else:
+                    new_row = self._get_default_row(columns)
+                    new_row.update(row_update.get('initial') or
+                                   row_update.get('insert') or {})
+                    row_updates[uuid] = {'new': new_row}
+            table_updates[table_name] = row_updates
+        return table_updates
+
+    def _get_default_row(self, columns):
+        return copy.deepcopy(columns)
+
+    def _apply_diff(self, value, diff, default):
+        if default == ovsdb_schema.EMPTY_SET:
+            # The diff of a set is the symmetric difference of the old
+            # and the new set.
+            elements = self._get_set_elements(value)
+            for element in self._get_set_elements(diff):
+                if element in elements:
+                    elements.remove(element)
+                else:
+                    elements.append(element)
+            if len(elements) == 1:
+                return elements[0]
+            return ['set', elements]
+        if default == ovsdb_schema.EMPTY_MAP:
+            # Pairs of the diff with a new key are inserted, the ones with
+            # the same value are deleted and the others are updated.
+            pairs = [list(pair) for pair in
+                     (value or ovsdb_schema.EMPTY_MAP)[1]]
+            keys = [pair[0] for pair in pairs]
+            for key, pair_value in diff[1]:
+                if key not in keys:
+                    keys.append(key)
+                    pairs.append([key, pair_value])
+                    continue
+                index = keys.index(key)
+                if pairs[index][1] == pair_value:
+                    del keys[index]
+                    del pairs[index]
+                else:
+                    pairs[index][1] = pair_value
+            return ['map', pairs]
+        return diff
+
+    def _get_set_elements(self, value):
+        if isinstance(value, list) and value and value[0] == 'set':
+            return list(value[1])
+        return [value]
 
     def _process_tables(self, param_dict, data_dict):
         # Process all the tables one by one.
@@ -157,16 +300,13 @@ class OVSDBMonitor(base_connection.BaseConnection):
                                                         data_dict)
 
     def _process_response(self, op_id):
-        result = self._response(op_id)
-        count = 0
-        while (not result and count <= n_const.MAX_RETRIES):
-            count = count + 1
-            eventlet.greenthread.sleep(0)
-            result = self._response(op_id)
-        if not result and count >= n_const.MAX_RETRIES:
+        return self._process_response_result(self._response(op_id))
+
+    def _process_response_result(self, result):
+        if not result:
             raise exceptions.OVSDBError(
                 message="OVSDB server did not respond within "
-                "max retry attempts.")
+                "the response timeout.")
         error = result.get("error", None)
         if error:
             raise exceptions.OVSDBError(
@@ -190,41 +330,21 @@ class OVSDBMonitor(base_connection.BaseConnection):
             if handler_method:
                 self.handlers.get(handler_method)(json_m, addr)
             else:
-                self.responses.append(json_m)
+                self._complete_request(json_m)
         except Exception as e:
             LOG.exception(_LE("Exception [%s] while handling "
                               "message"), e)
 
     def _rcv_thread(self):
-        chunks = []
-        lc = rc = 0
-        prev_char = None
+        framer = self._get_framer()
         while self.read_on:
             try:
                 response = self.socket.recv(n_const.BUFFER_SIZE)
                 eventlet.greenthread.sleep(0)
                 if response:
-                    response = response.decode('utf8')
-                    message_mark = 0
-                    for i, c in enumerate(response):
-                        if c == '{' and not (prev_char and
-                                             prev_char == '\\'):
-                            lc += 1
-                        elif c == '}' and not (prev_char and
-                                               prev_char == '\\'):
-                            rc += 1
-                        if rc > lc:
-                            raise Exception(_LE("json string not valid"))
-                        elif lc == rc and lc is not 0:
-                            chunks.append(response[message_mark:i + 1])
-                            message = "".join(chunks)
-                            eventlet.greenthread.spawn_n(
-                                self._on_remote_message, message)
-                            lc = rc = 0
-                            message_mark = i + 1
-                            chunks = []
-                        prev_char = c
-                    chunks.append(response[message_mark:])
+                    for message in framer.feed(response):
+                        eventlet.greenthread.spawn_n(
+                            self._on_remote_message, message)
                 else:
                     self.read_on = False
                     self.disconnect()
@@ -237,6 +357,10 @@ class OVSDBMonitor(base_connection.BaseConnection):
     def disconnect(self, addr=None):
         """disconnects the connection from the OVSDB server."""
         self.read_on = False
+        self._update2_backlog.pop(addr, None)
+        replica = self._get_replica(addr)
+        if replica:
+            replica.invalidate()
         super(OVSDBMonitor, self).disconnect(addr)
 
     def _process_monitor_msg(self, message, addr=None):
@@ -244,65 +368,78 @@ class OVSDBMonitor(base_connection.BaseConnection):
         result_dict = message.get('result')
         data_dict = self._initialize_data_dict()
         try:
+            replica = self._get_replica(addr)
+            if replica:
+                replica.reset(result_dict)
             self._process_tables(result_dict, data_dict)
-            self.rpc_callback(self._form_ovsdb_data(data_dict, addr))
+            self._stream_initial_records(data_dict, addr)
         except Exception as e:
             LOG.exception(_LE("_process_monitor_msg:ERROR %s "), e)
 
+    def _process_monitor_cond_msg(self, message, addr=None):
+        """Process initial set of records of the monitor_cond request."""
+        replica = self._get_replica(addr)
+        data_dict = self._initialize_data_dict()
+        try:
+            result_dict = self._get_table_updates(message.get('result'),
+                                                  replica)
+            replica.reset(result_dict)
+            self._process_tables(result_dict, data_dict)
+            self._stream_initial_records(data_dict, addr)
+        except Exception as e:
+            LOG.exception(_LE("_process_monitor_cond_msg:ERROR %s "), e)
+        for update in self._update2_backlog.pop(addr, []):
+            self._process_update2_event(update, addr)
+
     def _get_list(self, resource_list):
         return [element.__dict__ for element in resource_list]
 
     def _form_ovsdb_data(self, data_dict, addr):
-        return {n_const.OVSDB_IDENTIFIER: str(addr) if (
-                self.enable_manager) else (self.gw_config.ovsdb_identifier),
-                'new_logical_switches': self._get_list(
-                    data_dict.get('new_logical_switches')),
-                'new_physical_switches': self._get_list(
-                    data_dict.get('new_physical_switches')),
-                'new_physical_ports': self._get_list(
-                    data_dict.get('new_physical_ports')),
-                'new_physical_locators': self._get_list(
-                    data_dict.get('new_physical_locators')),
-                'new_local_macs': self._get_list(
-                    data_dict.get('new_local_macs')),
-                'new_remote_macs': self._get_list(
-                    data_dict.get('new_remote_macs')),
-                'new_mlocal_macs': self._get_list(
-                    data_dict.get('new_mlocal_macs')),
-                'new_locator_sets': self._get_list(
-                    data_dict.get('new_locator_sets')),
-                'deleted_logical_switches': self._get_list(
-                    data_dict.get('deleted_logical_switches')),
-                'deleted_physical_switches': self._get_list(
-                    data_dict.get('deleted_physical_switches')),
-                'deleted_physical_ports': self._get_list(
-                    data_dict.get('deleted_physical_ports')),
-                'deleted_physical_locators': self._get_list(
-                    data_dict.get('deleted_physical_locators')),
-                'deleted_local_macs': self._get_list(
-                    data_dict.get('deleted_local_macs')),
-                'deleted_remote_macs': self._get_list(
-                    data_dict.get('deleted_remote_macs')),
-                'deleted_mlocal_macs': self._get_list(
-                    data_dict.get('deleted_mlocal_macs')),
-                'deleted_locator_sets': self._get_list(
-                    data_dict.get('deleted_locator_sets')),
-                'modified_logical_switches': self._get_list(
-                    data_dict.get('modified_logical_switches')),
-                'modified_physical_switches': self._get_list(
-                    data_dict.get('modified_physical_switches')),
-                'modified_physical_ports': self._get_list(
-                    data_dict.get('modified_physical_ports')),
-                'modified_physical_locators': self._get_list(
-                    data_dict.get('modified_physical_locators')),
-                'modified_local_macs': self._get_list(
-                    data_dict.get('modified_local_macs')),
-                'modified_remote_macs': self._get_list(
-                    data_dict.get('modified_remote_macs')),
-                'modified_mlocal_macs': self._get_list(
-                    data_dict.get('modified_mlocal_macs')),
-                'modified_locator_sets': self._get_list(
-                    data_dict.get('modified_locator_sets'))}
+        if self.enable_manager:
+            ovsdb_identifier = str(addr)
+        else:
+            ovsdb_identifier = self.gw_config.ovsdb_identifier
+        ovsdb_data = {n_const.OVSDB_IDENTIFIER: ovsdb_identifier}
+        for key in n_const.OVSDB_PLUGIN_CHANGES:
+            resources = data_dict.get(key)
+            if resources:
+                ovsdb_data[key] = self._get_list(resources)
+        return ovsdb_data
+
+    def _notify_plugin(self, data_dict, addr):
+        ovsdb_data = self._form_ovsdb_data(data_dict, addr)
+        # Nothing is sent for the changes the plugin does not process.
+        if len(ovsdb_data) > 1:
+            self.rpc_callback(ovsdb_data)
+
+    def _stream_initial_records(self, data_dict, addr):
+        """Sends the initial records to the plugin in bounded chunks.
+
+           Each chunk is sent as soon as it is full. The chunks are
+           numbered and the last one, which is sent even if there are no
+           records, completes the sync.
+        """
+        chunk_size = cfg.CONF.ovsdb.initial_sync_chunk_size
+        chunk = self._initialize_data_dict()
+        count = 0
+        seq = 0
+        for key in n_const.OVSDB_PLUGIN_CHANGES:
+            for resource in data_dict.get(key):
+                if chunk_size and count == chunk_size:
+                    self._send_sync_chunk(chunk, addr, seq)
+                    chunk = self._initialize_data_dict()
+                    count = 0
+                    seq += 1
+                chunk[key].append(resource)
+                count += 1
+        self._send_sync_chunk(chunk, addr, seq, complete=True)
+
+    def _send_sync_chunk(self, chunk, addr, seq, complete=False):
+        ovsdb_data = self._form_ovsdb_data(chunk, addr)
+        ovsdb_data[n_const.OVSDB_SYNC_SEQ] = seq
+        if complete:
+            ovsdb_data[n_const.OVSDB_SYNC_COMPLETE] = True
+        self.rpc_callback(ovsdb_data)
 
     def _process_physical_port(self, uuid, uuid_dict, port_map, data_dict):
         """Processes Physical_Port record from the OVSDB event."""
@@ -319,9 +456,9 @@ class OVSDBMonitor(base_connection.BaseConnection):
             if switch_id:
                 port.physical_switch_id = switch_id
             # Update the vlan bindings
-            outer_binding_list = new_row.get('vlan_bindings')
-            # First element is "map"
-            outer_binding_list.remove(outer_binding_list[0])
+            # First element is "map". The row is not modified as it is
+            # kept in the replica of the OVSDB server tables.
+            outer_binding_list = new_row.get('vlan_bindings')[1:]
             vlan_bindings = []
             if len(outer_binding_list) > 0:
                 for binding in outer_binding_list:
@@ -360,11 +497,11 @@ class OVSDBMonitor(base_connection.BaseConnection):
             # insert or modify operation
             ports = new_row.get('ports')
             # First element in the list is either 'set' or 'uuid'
-            # Let us remove it.
+            # Let us skip it.
             is_set = False
             if ports[0] == 'set':
                 is_set = True
-            ports.remove(ports[0])
+            ports = ports[1:]
             all_ports = []
             if not is_set:
                 all_ports.append(ports[0])
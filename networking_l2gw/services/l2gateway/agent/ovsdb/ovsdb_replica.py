@@ -0,0 +1,123 @@
+# Copyright (c) 2015 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+
+def _get_uuid(value):
+    # References are encoded as ["uuid", <uuid>]
+    if isinstance(value, list) and len(value) == 2 and value[0] == 'uuid':
+        return value[1]
+
+
+def _mac_key(row):
+    return (row.get('MAC'), _get_uuid(row.get('logical_switch')))
+
+
+# Natural keys by which the rows of a table can be looked up, in
+# addition to their _uuid.
+NATURAL_KEYS = {'Logical_Switch': lambda row: row.get('name'),
+                'Physical_Locator': lambda row: row.get('dst_ip'),
+                'Physical_Switch': lambda row: row.get('name'),
+                'Ucast_Macs_Local': _mac_key,
+                'Ucast_Macs_Remote': _mac_key}
+
+
+class OVSDBReplica(object):
+    """In-memory replica of the monitored hardware_vtep tables.
+
+       The replica of an OVSDB server is loaded from the initial records
+       of the monitor request and kept up to date with the update
+       notifications of the server, so that the transactions can refer
+       to the existing rows without asking the plugin for their uuids.
+       The lookups return None while the replica is not in sync with the
+       server, for instance before the monitor request is answered or
+       after the monitor connection is lost.
+    """
+
+    def __init__(self):
+        self.synced = False
+        self._rows = {}
+        self._indexes = {}
+        self._backlog = []
+
+    def reset(self, table_updates):
+        """Loads the records of the monitor reply.
+
+           The update notifications handled before the reply are newer
+           than its records, so they are applied again afterwards.
+        """
+        self._rows = {}
+        self._indexes = {}
+        self._apply(table_updates)
+        backlog, self._backlog = self._backlog, []
+        for updates in backlog:
+            self._apply(updates)
+        self.synced = True
+
+    def update(self, table_updates):
+        """Applies an update notification of the OVSDB server."""
+        if not self.synced:
+            self._backlog.append(table_updates)
+            return
+        self._apply(table_updates)
+
+    def invalidate(self):
+        """Drops the records once the monitor connection is lost."""
+        self.synced = False
+        self._rows = {}
+        self._indexes = {}
+        self._backlog = []
+
+    def _apply(self, table_updates):
+        for table_name, table_dict in (table_updates or {}).items():
+            rows = self._rows.setdefault(table_name, {})
+            index = self._indexes.setdefault(table_name, {})
+            get_key = NATURAL_KEYS.get(table_name)
+            for uuid, row_update in table_dict.items():
+                old_row = rows.pop(uuid, None)
+                if old_row is not None and get_key:
+                    key = get_key(old_row)
+                    if index.get(key) == uuid:
+                        del index[key]
+                new_row = row_update.get('new')
+                if new_row is None:
+                    continue
+                rows[uuid] = new_row
+                if get_key:
+                    index[get_key(new_row)] = uuid
+
+    def get_row(self, table_name, uuid):
+        """Returns the row of the table with the given uuid."""
+        if self.synced:
+            return self._rows.get(table_name, {}).get(uuid)
+
+    def get_rows(self, table_name):
+        """Returns the rows of the table keyed by their uuid."""
+        if self.synced:
+            return dict(self._rows.get(table_name, {}))
+        return {}
+
+    def lookup(self, table_name, key):
+        """Returns the uuid of the row with the given natural key."""
+        if self.synced:
+            return self._indexes.get(table_name, {}).get(key)
+
+    def get_logical_switch_uuid(self, name):
+        return self.lookup('Logical_Switch', name)
+
+    def get_physical_locator_uuid(self, dst_ip):
+        return self.lookup('Physical_Locator', dst_ip)
+
+    def get_ucast_mac_remote_uuid(self, mac, logical_switch_uuid):
+        return self.lookup('Ucast_Macs_Remote', (mac, logical_switch_uuid))
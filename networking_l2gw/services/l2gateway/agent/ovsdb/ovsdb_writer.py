@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import random
 import socket
 
@@ -31,8 +32,16 @@ LOG = logging.getLogger(__name__)
 
 class OVSDBWriter(base_connection.BaseConnection):
     """Performs transactions to OVSDB server tables."""
-    def __init__(self, conf, gw_config):
+    def __init__(self, conf, gw_config, replica=None):
         super(OVSDBWriter, self).__init__(conf, gw_config)
+        self._rcvd_messages = {}
+        if not self.enable_manager:
+            self.replica = replica
+
+    def disconnect(self, addr=None):
+        """disconnects the connection from the OVSDB server."""
+        self._rcvd_messages.pop(addr, None)
+        super(OVSDBWriter, self).disconnect(addr)
 
     def _process_response(self, op_id):
         result = self._response(op_id)
@@ -51,24 +60,29 @@ class OVSDBWriter(base_connection.BaseConnection):
                         message="Error from the OVSDB server: %s" % error)
         return result
 
-    def _get_reply(self, operation_id, ovsdb_identifier):
+    def _get_reply(self, operation_id, ovsdb_identifier, process=None):
+        process = process or self._process_response
         count = 0
-        while count <= n_const.MAX_RETRIES:
+        while count <= n_const.MAX_RETRIES and self.connected:
             response = self._recv_data(ovsdb_identifier)
             LOG.debug("Response from OVSDB server = %s", str(response))
             if response:
                 try:
                     json_m = jsonutils.loads(response)
-                    self.responses.append(json_m)
                     method_type = json_m.get('method', None)
-                    if method_type == "echo" and self.enable_manager:
-                        self.ovsdb_dicts.get(ovsdb_identifier).send(
-                            jsonutils.dumps(
-                                {"result": json_m.get("params", None),
-                                 "error": None, "id": json_m['id']}))
-                    else:
-                        if self._process_response(operation_id):
-                            return True
+                    if method_type == "echo":
+                        echo_reply = {"result": json_m.get("params", None),
+                                      "error": None, "id": json_m['id']}
+                        if self.enable_manager:
+                            self.ovsdb_dicts.get(ovsdb_identifier).send(
+                                jsonutils.dumps(echo_reply))
+                        else:
+                            self.send(echo_reply)
+                    elif json_m.get('id') == operation_id:
+                        self._complete_request(json_m)
+                        result = process(operation_id)
+                        if result:
+                            return result
                 except Exception as ex:
                     with excutils.save_and_reraise_exception():
                         LOG.exception(_LE("Exception while receiving the "
@@ -81,11 +95,23 @@ class OVSDBWriter(base_connection.BaseConnection):
 
     def _send_and_receive(self, query, operation_id, ovsdb_identifier,
                           rcv_required):
-        if not self.send(query, addr=ovsdb_identifier):
+        if not self.send(query, addr=ovsdb_identifier,
+                         rcv_required=rcv_required):
             return
         if rcv_required:
             self._get_reply(operation_id, ovsdb_identifier)
 
+    def echo(self, ovsdb_identifier):
+        """Sends an echo request to check that the connection is alive."""
+        op_id = str(random.getrandbits(128))
+        query = {"method": "echo",
+                 "params": [],
+                 "id": op_id}
+        self._send_and_receive(query, op_id, ovsdb_identifier, True)
+        if not self.connected:
+            raise exceptions.OVSDBError(
+                message="Connection to the OVSDB server is closed")
+
     def delete_logical_switch(self, logical_switch_uuid, ovsdb_identifier,
                               rcv_required=True):
         """Delete an entry from Logical_Switch OVSDB table."""
@@ -106,43 +132,13 @@ class OVSDBWriter(base_connection.BaseConnection):
                                  mac_dict, ovsdb_identifier,
                                  rcv_required=True):
         """Insert an entry in Ucast_Macs_Remote OVSDB table."""
-        # To insert an entry in Ucast_Macs_Remote table, it requires
-        # corresponding entry in Physical_Locator (Compute node VTEP IP)
-        # and Logical_Switch (Neutron network) tables.
-        logical_switch = ovsdb_schema.LogicalSwitch(l_switch_dict['uuid'],
-                                                    l_switch_dict['name'],
-                                                    l_switch_dict['key'],
-                                                    l_switch_dict['description'
-                                                                  ])
-        locator = ovsdb_schema.PhysicalLocator(locator_dict['uuid'],
-                                               locator_dict['dst_ip'])
-        macObject = ovsdb_schema.UcastMacsRemote(mac_dict['uuid'],
-                                                 mac_dict['mac'],
-                                                 mac_dict['logical_switch_id'],
-                                                 mac_dict['physical_locator_id'
-                                                          ],
-                                                 mac_dict['ip_address'])
         # Form the insert query now.
         commit_dict = {"op": "commit", "durable": True}
         op_id = str(random.getrandbits(128))
         params = [n_const.OVSDB_SCHEMA_NAME]
-
-        if locator.uuid:
-            locator_list = ['uuid', locator.uuid]
-        else:
-            locator.uuid = ''.join(['a', str(random.getrandbits(128))])
-            locator_list = ["named-uuid", locator.uuid]
-            params.append(self._get_physical_locator_dict(locator))
-
-        if logical_switch.uuid:
-            l_switches = ['uuid', logical_switch.uuid]
-        else:
-            logical_switch.uuid = ''.join(['a', str(random.getrandbits(128))])
-            l_switches = ["named-uuid", logical_switch.uuid]
-            params.append(self._get_logical_switch_dict(logical_switch))
-
-        params.append(self._get_ucast_macs_remote_dict(
-            macObject, locator_list, l_switches))
+        params.extend(self._get_insert_ucast_macs_remote_ops(
+            l_switch_dict, locator_dict, mac_dict, {},
+            self._get_replica(ovsdb_identifier)))
         params.append(commit_dict)
         query = {"method": "transact",
                  "params": params,
@@ -154,31 +150,12 @@ class OVSDBWriter(base_connection.BaseConnection):
                                  ovsdb_identifier,
                                  rcv_required=True):
         """Update an entry in Ucast_Macs_Remote OVSDB table."""
-        # It is possible that the locator may not exist already.
-        locator = ovsdb_schema.PhysicalLocator(locator_dict['uuid'],
-                                               locator_dict['dst_ip'])
-        macObject = ovsdb_schema.UcastMacsRemote(mac_dict['uuid'],
-                                                 mac_dict['mac'],
-                                                 mac_dict['logical_switch_id'],
-                                                 mac_dict['physical_locator_id'
-                                                          ],
-                                                 mac_dict['ip_address'])
         # Form the insert query now.
         commit_dict = {"op": "commit", "durable": True}
         op_id = str(random.getrandbits(128))
         params = [n_const.OVSDB_SCHEMA_NAME]
-
-        # If the physical_locator does not exist (VM moving to a new compute
-        # node), then insert a new record in Physical_Locator first.
-        if locator.uuid:
-            locator_list = ['uuid', locator.uuid]
-        else:
-            locator.uuid = ''.join(['a', str(random.getrandbits(128))])
-            locator_list = ["named-uuid", locator.uuid]
-            params.append(self._get_physical_locator_dict(locator))
-
-        params.append(self._get_dict_for_update_ucast_mac_remote(
-            macObject, locator_list))
+        params.extend(self._get_update_ucast_macs_remote_ops(
+            locator_dict, mac_dict, {}, self._get_replica(ovsdb_identifier)))
         params.append(commit_dict)
         query = {"method": "transact",
                  "params": params,
@@ -193,6 +170,155 @@ class OVSDBWriter(base_connection.BaseConnection):
         commit_dict = {"op": "commit", "durable": True}
         op_id = str(random.getrandbits(128))
         params = [n_const.OVSDB_SCHEMA_NAME]
+        params.extend(self._get_delete_ucast_macs_remote_ops(
+            logical_switch_uuid, macs))
+        params.append(commit_dict)
+        query = {"method": "transact",
+                 "params": params,
+                 "id": op_id}
+        LOG.debug("delete_ucast_macs_remote: query: %s", query)
+        self._send_and_receive(query, op_id, ovsdb_identifier, rcv_required)
+
+    def transact_ucast_macs_remote(self, requests, ovsdb_identifier):
+        """Applies several Ucast_Macs_Remote requests in one transaction.
+
+           Every request is a tuple of the operation ('insert', 'update'
+           or 'delete') and the arguments of the corresponding single
+           request method, without the ovsdb_identifier. Returns
+           a list with the error of each request, None for the requests
+           that have been committed.
+        """
+        errors = [None] * len(requests)
+        pending = list(range(len(requests)))
+        while pending:
+            index, error = self._transact_requests(
+                [requests[i] for i in pending], ovsdb_identifier)
+            if not error:
+                break
+            if index is not None:
+                # The server aborted the transaction because of this
+                # request; commit the remaining ones without it.
+                errors[pending.pop(index)] = error
+                continue
+            if len(pending) == 1:
+                errors[pending[0]] = error
+                break
+            # The error can not be attributed to a single request, for
+            # instance a referential integrity violation detected at
+            # commit time, so apply the requests one by one.
+            for i in pending:
+                errors[i] = self._transact_requests([requests[i]],
+                                                    ovsdb_identifier)[1]
+            break
+        return errors
+
+    def _transact_requests(self, requests, ovsdb_identifier):
+        # Returns the index of the request that failed, if it is known,
+        # and the error; (None, None) when the transaction is committed.
+        commit_dict = {"op": "commit", "durable": True}
+        op_id = str(random.getrandbits(128))
+        params = [n_const.OVSDB_SCHEMA_NAME]
+        named_uuids = {}
+        replica = self._get_replica(ovsdb_identifier)
+        bounds = []
+        for operation, args in requests:
+            start = len(params)
+            params.extend(self._get_request_ops(operation, args,
+                                                named_uuids, replica))
+            bounds.append((start, len(params)))
+        params.append(commit_dict)
+        query = {"method": "transact",
+                 "params": params,
+                 "id": op_id}
+        LOG.debug("transact_ucast_macs_remote: query: %s", query)
+        if not self.send(query, addr=ovsdb_identifier):
+            raise exceptions.OVSDBError(
+                message="Could not send the transaction to the OVSDB server")
+        reply = self._get_reply(op_id, ovsdb_identifier, self._response)
+        if not reply:
+            raise exceptions.OVSDBError(
+                message="Could not obtain response from the OVSDB server")
+        error = reply.get("error", None)
+        if error:
+            return None, exceptions.OVSDBError(
+                message="Error from the OVSDB server: %s" % error)
+        # The outcomes are in the same order as the params, without the
+        # schema name.
+        for position, outcome in enumerate(reply.get("result") or [], 1):
+            error = outcome and outcome.get("error", None)
+            if not error:
+                continue
+            error = exceptions.OVSDBError(
+                message="Error from the OVSDB server: %s" % error)
+            for index, (start, end) in enumerate(bounds):
+                if start <= position < end:
+                    return index, error
+            return None, error
+        return None, None
+
+    def _get_request_ops(self, operation, args, named_uuids, replica=None):
+        if operation == 'insert':
+            return self._get_insert_ucast_macs_remote_ops(
+                *args, named_uuids=named_uuids, replica=replica)
+        elif operation == 'update':
+            return self._get_update_ucast_macs_remote_ops(
+                *args, named_uuids=named_uuids, replica=replica)
+        elif operation == 'delete':
+            return self._get_delete_ucast_macs_remote_ops(*args)
+        raise exceptions.OVSDBError(
+            message="Unknown operation %s" % operation)
+
+    def _get_insert_ucast_macs_remote_ops(self, l_switch_dict, locator_dict,
+                                          mac_dict, named_uuids,
+                                          replica=None):
+        # To insert an entry in Ucast_Macs_Remote table, it requires
+        # corresponding entry in Physical_Locator (Compute node VTEP IP)
+        # and Logical_Switch (Neutron network) tables.
+        logical_switch = ovsdb_schema.LogicalSwitch(l_switch_dict['uuid'],
+                                                    l_switch_dict['name'],
+                                                    l_switch_dict['key'],
+                                                    l_switch_dict['description'
+                                                                  ])
+        locator = ovsdb_schema.PhysicalLocator(locator_dict['uuid'],
+                                               locator_dict['dst_ip'])
+        macObject = ovsdb_schema.UcastMacsRemote(mac_dict['uuid'],
+                                                 mac_dict['mac'],
+                                                 mac_dict['logical_switch_id'],
+                                                 mac_dict['physical_locator_id'
+                                                          ],
+                                                 mac_dict['ip_address'])
+        self._resolve_uuids(replica, logical_switch=logical_switch,
+                            locator=locator)
+        ops = []
+        locator_list = self._get_locator_ref(locator, named_uuids, ops)
+        l_switches = self._get_logical_switch_ref(logical_switch,
+                                                  named_uuids, ops)
+        ops.append(self._get_ucast_macs_remote_dict(
+            macObject, locator_list, l_switches))
+        return ops
+
+    def _get_update_ucast_macs_remote_ops(self, locator_dict, mac_dict,
+                                          named_uuids, replica=None):
+        # It is possible that the locator may not exist already.
+        locator = ovsdb_schema.PhysicalLocator(locator_dict['uuid'],
+                                               locator_dict['dst_ip'])
+        macObject = ovsdb_schema.UcastMacsRemote(mac_dict['uuid'],
+                                                 mac_dict['mac'],
+                                                 mac_dict['logical_switch_id'],
+                                                 mac_dict['physical_locator_id'
+                                                          ],
+                                                 mac_dict['ip_address'])
+        self._resolve_uuids(replica, locator=locator, mac=macObject)
+        ops = []
+        # If the physical_locator does not exist (VM moving to a new compute
+        # node), then insert a new record in Physical_Locator first.
+        locator_list = self._get_locator_ref(locator, named_uuids, ops)
+        ops.append(self._get_dict_for_update_ucast_mac_remote(
+            macObject, locator_list))
+        return ops
+
+    def _get_delete_ucast_macs_remote_ops(self, logical_switch_uuid, macs):
+        ops = []
         for mac in macs:
             sub_query = {"op": "delete",
                          "table": "Ucast_Macs_Remote",
@@ -203,13 +329,45 @@ class OVSDBWriter(base_connection.BaseConnection):
                                     "==",
                                     ["uuid",
                                      logical_switch_uuid]]]}
-            params.append(sub_query)
-        params.append(commit_dict)
-        query = {"method": "transact",
-                 "params": params,
-                 "id": op_id}
-        LOG.debug("delete_ucast_macs_remote: query: %s", query)
-        self._send_and_receive(query, op_id, ovsdb_identifier, rcv_required)
+            ops.append(sub_query)
+        return ops
+
+    def _resolve_uuids(self, replica, logical_switch=None, locator=None,
+                       mac=None):
+        # The rows the plugin does not know the uuid of may already be in
+        # the OVSDB server; refer to them instead of inserting new ones.
+        if not replica:
+            return
+        if logical_switch and not logical_switch.uuid:
+            logical_switch.uuid = replica.get_logical_switch_uuid(
+                logical_switch.name)
+        if locator and not locator.uuid:
+            locator.uuid = replica.get_physical_locator_uuid(locator.dst_ip)
+        if mac and not mac.uuid:
+            mac.uuid = replica.get_ucast_mac_remote_uuid(
+                mac.mac, mac.logical_switch_id)
+
+    def _get_locator_ref(self, locator, named_uuids, ops):
+        # Locators that are not in the OVSDB server yet are inserted once
+        # per transaction and shared by all the MACs behind them.
+        if locator.uuid:
+            return ['uuid', locator.uuid]
+        key = ('Physical_Locator', locator.dst_ip)
+        if key not in named_uuids:
+            locator.uuid = ''.join(['a', str(random.getrandbits(128))])
+            named_uuids[key] = locator.uuid
+            ops.append(self._get_physical_locator_dict(locator))
+        return ["named-uuid", named_uuids[key]]
+
+    def _get_logical_switch_ref(self, logical_switch, named_uuids, ops):
+        if logical_switch.uuid:
+            return ['uuid', logical_switch.uuid]
+        key = ('Logical_Switch', logical_switch.name)
+        if key not in named_uuids:
+            logical_switch.uuid = ''.join(['a', str(random.getrandbits(128))])
+            named_uuids[key] = logical_switch.uuid
+            ops.append(self._get_logical_switch_dict(logical_switch))
+        return ["named-uuid", named_uuids[key]]
 
     def update_connection_to_gateway(self, logical_switch_dict,
                                      locator_dicts, mac_dicts,
@@ -218,10 +376,9 @@ class OVSDBWriter(base_connection.BaseConnection):
         """Updates Physical Port's VNI to VLAN binding."""
         # Form the JSON Query so as to update the physical port with the
         # vni-vlan (logical switch uuid to vlan) binding
-        update_dicts = self._get_bindings_to_update(logical_switch_dict,
-                                                    locator_dicts,
-                                                    mac_dicts,
-                                                    port_dicts)
+        update_dicts = self._get_bindings_to_update(
+            logical_switch_dict, locator_dicts, mac_dicts, port_dicts,
+            self._get_replica(ovsdb_identifier))
         op_id = str(random.getrandbits(128))
         query = {"method": "transact",
                  "params": update_dicts,
@@ -230,10 +387,10 @@ class OVSDBWriter(base_connection.BaseConnection):
         self._send_and_receive(query, op_id, ovsdb_identifier, rcv_required)
 
     def _recv_data(self, ovsdb_identifier):
-        chunks = []
-        lc = rc = 0
-        prev_char = None
-        while True:
+        key = ovsdb_identifier if self.enable_manager else None
+        backlog = self._rcvd_messages.setdefault(key, collections.deque())
+        framer = self._get_framer(key)
+        while not backlog:
             try:
                 if self.enable_manager:
                     response = self.ovsdb_dicts.get(ovsdb_identifier).recv(
@@ -241,31 +398,28 @@ class OVSDBWriter(base_connection.BaseConnection):
                 else:
                     response = self.socket.recv(n_const.BUFFER_SIZE)
                 if response:
-                    response = response.decode('utf8')
-                    for i, c in enumerate(response):
-                        if c == '{' and not (prev_char and
-                                             prev_char == '\\'):
-                            lc += 1
-                        elif c == '}' and not (prev_char and
-                                               prev_char == '\\'):
-                            rc += 1
-                        if lc == rc and lc is not 0:
-                            chunks.append(response[0:i + 1])
-                            message = "".join(chunks)
-                            return message
-                        prev_char = c
-                    chunks.append(response)
+                    backlog.extend(framer.feed(response))
                 else:
                     LOG.warning(_LW("Did not receive any reply from the OVSDB "
                                     "server"))
+                    self._mark_disconnected()
                     return
             except (socket.error, socket.timeout):
                 LOG.warning(_LW("Did not receive any reply from the OVSDB "
                                 "server"))
+                self._mark_disconnected()
                 return
+        return backlog.popleft()
+
+    def _mark_disconnected(self):
+        # A dedicated connection is no longer usable once the server has
+        # closed it; the connections accepted from an OVSDB manager are
+        # tracked by the receive threads instead.
+        if not self.enable_manager:
+            self.connected = False
 
     def _get_bindings_to_update(self, l_switch_dict, locator_dicts,
-                                mac_dicts, port_dicts):
+                                mac_dicts, port_dicts, replica=None):
         # For connection-create, there are two cases to be handled
         # Case 1: VMs exist in a network on compute nodes.
         #         Connection request will contain locators, ports, MACs and
@@ -286,12 +440,14 @@ class OVSDBWriter(base_connection.BaseConnection):
                 l_switch_dict['name'],
                 l_switch_dict['key'],
                 l_switch_dict['description'])
+            self._resolve_uuids(replica, logical_switch=logical_switch)
 
         # Convert locator dicts into class objects
         for locator in locator_dicts:
-            locator_list.append(ovsdb_schema.PhysicalLocator(locator['uuid'],
-                                                             locator['dst_ip'])
-                                )
+            phys_locator = ovsdb_schema.PhysicalLocator(locator['uuid'],
+                                                        locator['dst_ip'])
+            self._resolve_uuids(replica, locator=phys_locator)
+            locator_list.append(phys_locator)
 
         # Convert MAC dicts into class objects. mac_dicts is a dictionary with
         # locator VTEP IP as the key and list of MACs as the value.
@@ -0,0 +1,72 @@
+# Copyright (c) 2015 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+from eventlet import event
+from eventlet import semaphore
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class OVSDBTransactionBatcher(object):
+    """Coalesces the write requests to one OVSDB server.
+
+       The requests submitted within the batching window, or until
+       max_ops requests are queued, are handed together to the commit
+       callable, which applies them in a single transaction and returns
+       the error of every request (None on success). Each submitter
+       blocks until its own request has been committed and gets its own
+       error raised. Batches are committed one at a time and in the
+       order in which the requests were submitted.
+    """
+
+    def __init__(self, commit, window, max_ops):
+        self._commit = commit
+        self.window = window
+        self.max_ops = max_ops
+        self._queue = []
+        self._timer = None
+        self._lock = semaphore.Semaphore()
+
+    def submit(self, request):
+        """Queues the request and waits until it has been committed."""
+        done = event.Event()
+        self._queue.append((request, done))
+        if len(self._queue) >= self.max_ops:
+            self._flush()
+        elif self._timer is None:
+            self._timer = eventlet.spawn_after(self.window, self._flush)
+        error = done.wait()
+        if error is not None:
+            raise error
+
+    def _flush(self):
+        with self._lock:
+            if self._timer is not None:
+                # Does nothing if the timer is the one flushing.
+                self._timer.cancel()
+                self._timer = None
+            batch, self._queue = self._queue, []
+            if not batch:
+                return
+            LOG.debug("Committing %d OVSDB requests in one transaction",
+                      len(batch))
+            try:
+                errors = self._commit([request for request, _done in batch])
+            except Exception as ex:
+                errors = [ex] * len(batch)
+            for (_request, done), error in zip(batch, errors):
+                done.send(error)
@@ -0,0 +1,112 @@
+# Copyright (c) 2015 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+from contextlib import contextmanager
+
+from eventlet import semaphore
+from oslo_log import log as logging
+from oslo_utils import excutils
+
+from networking_l2gw._i18n import _LW
+from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_writer
+
+LOG = logging.getLogger(__name__)
+
+
+class OVSDBWriterPool(object):
+    """Pool of established OVSDBWriter connections to one OVSDB server.
+
+       A connection is used by a single transaction at a time and is
+       returned to the pool afterwards, so that consecutive transactions
+       do not pay for a new TCP (and TLS) handshake. Idle connections are
+       kept alive with echo requests, and connections that fail are
+       dropped so that the next transaction reconnects.
+    """
+
+    def __init__(self, conf, gateway, replica=None):
+        self.conf = conf
+        self.gateway = gateway
+        self.replica = replica
+        self.max_size = conf.max_writer_connections
+        self._idle = collections.deque()
+        self._semaphore = semaphore.Semaphore(self.max_size)
+        self.closed = False
+
+    @contextmanager
+    def connection(self):
+        with self._semaphore:
+            ovsdb_fd = self._checkout()
+            try:
+                yield ovsdb_fd
+            except Exception:
+                with excutils.save_and_reraise_exception():
+                    self._discard(ovsdb_fd)
+            else:
+                self._checkin(ovsdb_fd)
+
+    def _checkout(self):
+        while self._idle:
+            ovsdb_fd = self._idle.pop()
+            if ovsdb_fd.connected:
+                return ovsdb_fd
+            self._discard(ovsdb_fd)
+        return ovsdb_writer.OVSDBWriter(self.conf, self.gateway,
+                                        self.replica)
+
+    def _checkin(self, ovsdb_fd):
+        if (not self.closed and ovsdb_fd.connected and
+                len(self._idle) < self.max_size):
+            self._idle.append(ovsdb_fd)
+        else:
+            self._discard(ovsdb_fd)
+
+    def _discard(self, ovsdb_fd):
+        try:
+            if ovsdb_fd.connected:
+                ovsdb_fd.disconnect()
+        except Exception as ex:
+            LOG.debug("Exception %s while closing the connection to the "
+                      "OVSDB server %s", ex, self.gateway.ovsdb_ip)
+
+    def keepalive(self):
+        """Probes the idle connections and drops the dead ones.
+
+           A connection being probed takes a slot of the pool, so that no
+           connection is opened in its place meanwhile.
+        """
+        for _i in range(len(self._idle)):
+            with self._semaphore:
+                if not self._idle:
+                    break
+                ovsdb_fd = self._idle.popleft()
+                try:
+                    ovsdb_fd.echo(self.gateway.ovsdb_identifier)
+                except Exception as ex:
+                    LOG.warning(_LW("Dropping the idle connection to the "
+                                    "OVSDB server %(ip)s: %(ex)s"),
+                                {'ip': self.gateway.ovsdb_ip, 'ex': ex})
+                    self._discard(ovsdb_fd)
+                    continue
+                self._checkin(ovsdb_fd)
+
+    def close(self):
+        """Closes all the idle connections.
+
+           The connections in use are closed when they are returned.
+        """
+        self.closed = True
+        while self._idle:
+            self._discard(self._idle.pop())
@@ -0,0 +1,119 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.callbacks import events
+from neutron.callbacks import registry
+from neutron.callbacks import resources
+
+from neutron_lib import constants as n_const
+from oslo_config import cfg
+from oslo_log import log as logging
+from oslo_serialization import jsonutils
+from oslo_utils import timeutils
+import six
+
+LOG = logging.getLogger(__name__)
+
+_cache = None
+
+
+def get_cache():
+    """Return the tunnel IP cache shared by the plugin."""
+    global _cache
+    if _cache is None:
+        _cache = AgentTunnelIpCache(cfg.CONF.agent_tunnel_ip_cache_ttl)
+        _cache.subscribe()
+    return _cache
+
+
+class AgentTunnelIpCache(object):
+    """Cache the tunneling IPs of the OVS agents.
+
+    The host to tunneling IP map is filled from the agents table on a
+    miss, kept up to date with the agent notifications of the core plugin,
+    and its entries expire after ttl seconds, 0 disables the cache.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        # host -> (tunneling_ip, timestamp)
+        self.tunnel_ips = {}
+        self.all_agents_timestamp = None
+
+    def subscribe(self):
+        for event in (events.AFTER_CREATE, events.AFTER_UPDATE):
+            registry.subscribe(self._agent_updated, resources.AGENT, event)
+        registry.subscribe(self._agent_deleted, resources.AGENT,
+                           events.BEFORE_DELETE)
+
+    def _is_fresh(self, timestamp):
+        return (timestamp is not None and
+                timeutils.utcnow_ts() - timestamp < self.ttl)
+
+    def _set(self, host, tunneling_ip):
+        self.tunnel_ips[host] = (tunneling_ip, timeutils.utcnow_ts())
+
+    def _load_agents(self, context, core_plugin, host=None):
+        filters = {'agent_type': [n_const.AGENT_TYPE_OVS]}
+        if host:
+            filters['host'] = [host]
+        agents = core_plugin.get_agents(context, filters=filters)
+        for agent in agents:
+            self._set(agent.get('host'), _get_tunneling_ip(agent))
+        return agents
+
+    def get_tunneling_ip(self, context, core_plugin, host):
+        """Return the tunneling IP of the OVS agent of host."""
+        tunneling_ip, timestamp = self.tunnel_ips.get(host, (None, None))
+        if self._is_fresh(timestamp):
+            return tunneling_ip
+        self.tunnel_ips.pop(host, None)
+        agents = self._load_agents(context, core_plugin, host)
+        if agents:
+            return _get_tunneling_ip(agents[0])
+
+    def get_agent_ips(self, context, core_plugin):
+        """Return the hosts of the OVS agents keyed by tunneling IP."""
+        if not self._is_fresh(self.all_agents_timestamp):
+            self.tunnel_ips.clear()
+            self._load_agents(context, core_plugin)
+            self.all_agents_timestamp = timeutils.utcnow_ts()
+        return dict((tunneling_ip, host)
+                    for host, (tunneling_ip, timestamp)
+                    in self.tunnel_ips.items())
+
+    def _agent_updated(self, resource, event, trigger, **kwargs):
+        agent = kwargs.get('agent') or {}
+        if agent.get('agent_type') != n_const.AGENT_TYPE_OVS:
+            return
+        host = agent.get('host')
+        tunneling_ip = _get_tunneling_ip(agent)
+        if tunneling_ip != self.tunnel_ips.get(host, (None, None))[0]:
+            LOG.debug("Tunneling IP of the OVS agent of %(host)s is "
+                      "%(ip)s", {'host': host, 'ip': tunneling_ip})
+        self._set(host, tunneling_ip)
+
+    def _agent_deleted(self, resource, event, trigger, **kwargs):
+        agent = kwargs.get('agent') or {}
+        if agent.get('agent_type') == n_const.AGENT_TYPE_OVS:
+            self.tunnel_ips.pop(agent.get('host'), None)
+
+
+def _get_tunneling_ip(agent):
+    configurations = agent.get('configurations') or {}
+    # The agent notifications carry the configurations serialized.
+    if isinstance(configurations, six.string_types):
+        configurations = jsonutils.loads(configurations)
+    return configurations.get('tunneling_ip')
@@ -39,7 +39,33 @@ OVSDB_OPTS = [
     cfg.IntOpt('max_connection_retries',
                default=10,
                help=_('Maximum number of retries to open a socket '
-                      'with the OVSDB server'))
+                      'with the OVSDB server')),
+    cfg.IntOpt('response_timeout',
+               default=60,
+               help=_('Seconds to wait for the OVSDB server to respond '
+                      'to a request')),
+    cfg.IntOpt('max_writer_connections',
+               default=2,
+               help=_('Maximum number of connections per OVSDB server '
+                      'kept open for transactions')),
+    cfg.IntOpt('writer_keepalive_interval',
+               default=4,
+               help=_('Seconds between echo requests on idle OVSDB '
+                      'connections, 0 to disable them')),
+    cfg.FloatOpt('mac_batch_window',
+                 default=0,
+                 help=_('Seconds during which remote MAC changes for an '
+                        'OVSDB server are gathered into one transaction, '
+                        '0 to disable the batching')),
+    cfg.IntOpt('mac_batch_max_ops',
+               default=100,
+               help=_('Maximum number of remote MAC changes committed '
+                      'in one transaction')),
+    cfg.IntOpt('initial_sync_chunk_size',
+               default=1000,
+               help=_('Maximum number of rows sent to the plugin in one '
+                      'message while streaming the initial records of an '
+                      'OVSDB server, 0 to send them in one message'))
 ]
 
 L2GW_OPTS = [
@@ -61,7 +87,55 @@ L2GW_OPTS = [
                default='networking_l2gw.services.l2gateway.ovsdb.'
                        'data.L2GatewayOVSDBCallbacks',
                help=_('L2 gateway plugin callback class where the'
-                      'RPCs from the agent are going to get invoked'))
+                      'RPCs from the agent are going to get invoked')),
+    cfg.BoolOpt('async_mac_programming',
+                default=False,
+                help=_('Cast the remote MAC changes to the L2 gateway agent '
+                       'instead of waiting for the OVSDB server, the agent '
+                       'acknowledges them once they are applied')),
+    cfg.IntOpt('mac_programming_ack_timeout',
+               default=300,
+               help=_('Seconds after which a remote MAC change cast to the '
+                      'L2 gateway agent and not acknowledged is retried')),
+    cfg.IntOpt('ovsdb_update_batch_size',
+               default=0,
+               help=_('Maximum number of rows of an OVSDB update committed '
+                      'in a single database transaction, 0 commits the '
+                      'whole update at once')),
+    cfg.IntOpt('pending_macs_replay_batch_size',
+               default=100,
+               help=_('Number of pending remote MAC changes sent to the L2 '
+                      'gateway agent in a single RPC when an OVSDB server '
+                      'reconnects')),
+    cfg.IntOpt('pending_macs_replay_rate',
+               default=0,
+               help=_('Maximum number of pending remote MAC changes '
+                      'replayed per second to an OVSDB server, 0 means '
+                      'no limit')),
+    cfg.IntOpt('pending_macs_replay_concurrency',
+               default=4,
+               help=_('Maximum number of OVSDB servers whose pending remote '
+                      'MAC changes are replayed at the same time')),
+    cfg.IntOpt('agent_tunnel_ip_cache_ttl',
+               default=60,
+               help=_('Seconds the tunneling IPs of the OVS agents are '
+                      'cached for, 0 disables the cache')),
+    cfg.IntOpt('l2gw_connection_cache_ttl',
+               default=0,
+               help=_('Seconds the networks having L2 gateway connections '
+                      'and their logical switches are cached for, 0 '
+                      'disables the cache. The logical switches added by '
+                      'the other neutron server processes are seen after '
+                      'this delay')),
+    cfg.IntOpt('port_event_queue_size',
+               default=0,
+               help=_('Maximum number of port events queued to be '
+                      'programmed on the gateways in the background, 0 '
+                      'programs them synchronously in the API requests')),
+    cfg.IntOpt('port_event_batch_size',
+               default=100,
+               help=_('Maximum number of queued port events programmed on '
+                      'the gateways at once'))
 ]
 
 
@@ -0,0 +1,115 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from networking_l2gw.db.l2gateway.ovsdb import lib as db
+
+from oslo_config import cfg
+from oslo_utils import timeutils
+
+_cache = None
+
+
+def get_cache():
+    """Return the connected network cache shared by the plugin."""
+    global _cache
+    if _cache is None:
+        _cache = ConnectedNetworkCache(cfg.CONF.l2gw_connection_cache_ttl)
+    return _cache
+
+
+class ConnectedNetworkCache(object):
+    """Cache the networks having L2 gateway connections.
+
+    Holds the set of networks connected to an L2 gateway and the logical
+    switches of these networks, so that the port events of the other
+    networks are ignored without loading the connections. The cache is
+    invalidated when a connection or a logical switch is added or removed
+    by this process, and reloaded after ttl seconds for the changes made
+    by the other neutron server processes, 0 disables the cache. A network
+    is only reported as unconnected while the number of connections is
+    unchanged, so that the connections created by the other processes are
+    seen at once; the logical switches they add are seen after ttl seconds.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.network_ids = None
+        self.connection_count = None
+        self.network_ids_timestamp = None
+        # network_id -> (logical switches, timestamp)
+        self.logical_switches = {}
+
+    def _is_fresh(self, timestamp):
+        return (timestamp is not None and
+                timeutils.utcnow_ts() - timestamp < self.ttl)
+
+    def _load_network_ids(self, context, service_plugin):
+        connections = service_plugin.get_l2_gateway_connections(
+            context, fields=['network_id'])
+        self.network_ids = set(connection['network_id']
+                               for connection in connections)
+        self.connection_count = len(connections)
+        self.network_ids_timestamp = timeutils.utcnow_ts()
+
+    def is_connected(self, context, service_plugin, network_id):
+        """Return whether the network has an L2 gateway connection."""
+        if not self.ttl:
+            return bool(service_plugin.get_l2_gateway_connections(
+                context, filters={'network_id': [network_id]},
+                fields=['network_id']))
+        if (self.network_ids is None or
+                not self._is_fresh(self.network_ids_timestamp)):
+            self._load_network_ids(context, service_plugin)
+        elif (network_id not in self.network_ids and
+                service_plugin.get_l2_gateway_connections_count(context) !=
+                self.connection_count):
+            self._load_network_ids(context, service_plugin)
+        return network_id in self.network_ids
+
+    def get_logical_switches(self, context, service_plugin, network_id):
+        """Return the logical switches of a connected network.
+
+        An empty list is returned for the networks without L2 gateway
+        connection. The logical switches are copies the caller may modify.
+        A network without logical switch yet is not cached, as its logical
+        switch is added once the agent reports it, possibly to another
+        neutron server process.
+        """
+        if not self.is_connected(context, service_plugin, network_id):
+            return []
+        logical_switches, timestamp = self.logical_switches.get(
+            network_id, (None, None))
+        if not self._is_fresh(timestamp):
+            logical_switches = [
+                dict(logical_switch) for logical_switch in
+                db.get_all_logical_switches_by_name(context, network_id)]
+            if logical_switches:
+                self.logical_switches[network_id] = (logical_switches,
+                                                     timeutils.utcnow_ts())
+            else:
+                self.logical_switches.pop(network_id, None)
+        return [dict(logical_switch) for logical_switch in logical_switches]
+
+    def invalidate(self, network_id=None):
+        """Drop the connected networks and the logical switches cached."""
+        self.network_ids = None
+        if network_id:
+            self.logical_switches.pop(network_id, None)
+        else:
+            self.logical_switches.clear()
+
+    def invalidate_logical_switches(self):
+        """Drop the logical switches cached."""
+        self.logical_switches.clear()
@@ -26,6 +26,27 @@ ERROR_DICT = {L2GW_INVALID_OVSDB_IDENTIFIER: "Invalid ovsdb_identifier in the "
 MONITOR = 'monitor'
 OVSDB_SCHEMA_NAME = 'hardware_vtep'
 OVSDB_IDENTIFIER = 'ovsdb_identifier'
+# Changes of the OVSDB tables that are processed by the plugin. The agent
+# leaves the other ones, and the empty ones, out of the OVSDB data it sends.
+OVSDB_PLUGIN_CHANGES = ('new_logical_switches',
+                        'new_physical_switches',
+                        'new_physical_ports',
+                        'new_physical_locators',
+                        'new_local_macs',
+                        'new_remote_macs',
+                        'deleted_logical_switches',
+                        'deleted_physical_switches',
+                        'deleted_physical_ports',
+                        'deleted_physical_locators',
+                        'deleted_local_macs',
+                        'deleted_remote_macs',
+                        'modified_physical_switches',
+                        'modified_physical_ports',
+                        'modified_remote_macs')
+# The initial records of an OVSDB server are sent to the plugin in chunks
+# with a sequence number, the last one is flagged as completing the sync.
+OVSDB_SYNC_SEQ = 'sync_seq'
+OVSDB_SYNC_COMPLETE = 'sync_complete'
 L2GW_AGENT_TYPE = 'l2gw_agent_type'
 NETWORK_ID = 'network_id'
 SEG_ID = 'segmentation_id'
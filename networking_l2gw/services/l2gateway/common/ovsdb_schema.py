@@ -13,14 +13,30 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+EMPTY_SET = ['set', []]
+EMPTY_MAP = ['map', []]
+
+# Every class built from the rows of an OVSDB table declares the table and
+# the columns the rows are processed with, along with their default values.
+# The OVSDB server leaves the columns that have their default value out of
+# update2 rows; the references that are always set have none.
+
 
 class PhysicalLocator(object):
+    table = 'Physical_Locator'
+    columns = {'dst_ip': ''}
+
     def __init__(self, uuid, dst_ip):
         self.uuid = uuid
         self.dst_ip = dst_ip
 
 
 class PhysicalSwitch(object):
+    table = 'Physical_Switch'
+    # The ports are used to link the Physical_Port rows to their switch.
+    columns = {'name': '', 'tunnel_ips': EMPTY_SET,
+               'switch_fault_status': EMPTY_SET, 'ports': EMPTY_SET}
+
     def __init__(self, uuid, name, tunnel_ip, switch_fault_status):
         self.uuid = uuid
         self.name = name
@@ -29,6 +45,10 @@ class PhysicalSwitch(object):
 
 
 class PhysicalPort(object):
+    table = 'Physical_Port'
+    columns = {'name': '', 'vlan_bindings': EMPTY_MAP,
+               'port_fault_status': EMPTY_SET}
+
     def __init__(self, uuid, name, phys_switch_id, vlan_binding_dicts,
                  port_fault_status):
         self.uuid = uuid
@@ -44,6 +64,9 @@ class PhysicalPort(object):
 
 
 class LogicalSwitch(object):
+    table = 'Logical_Switch'
+    columns = {'name': '', 'tunnel_key': EMPTY_SET, 'description': ''}
+
     def __init__(self, uuid, name, key, description):
         self.uuid = uuid
         self.name = name
@@ -52,6 +75,10 @@ class LogicalSwitch(object):
 
 
 class UcastMacsLocal(object):
+    table = 'Ucast_Macs_Local'
+    columns = {'MAC': '', 'logical_switch': None, 'locator': None,
+               'ipaddr': ''}
+
     def __init__(self, uuid, mac, logical_switch_id, physical_locator_id,
                  ip_address):
         self.uuid = uuid
@@ -62,6 +89,10 @@ class UcastMacsLocal(object):
 
 
 class UcastMacsRemote(object):
+    table = 'Ucast_Macs_Remote'
+    columns = {'MAC': '', 'logical_switch': None, 'locator': None,
+               'ipaddr': ''}
+
     def __init__(self, uuid, mac, logical_switch_id, physical_locator_id,
                  ip_address):
         self.uuid = uuid
@@ -78,6 +109,10 @@ class VlanBinding(object):
 
 
 class McastMacsLocal(object):
+    table = 'Mcast_Macs_Local'
+    columns = {'MAC': '', 'logical_switch': None, 'locator_set': None,
+               'ipaddr': ''}
+
     def __init__(self, uuid, mac, logical_switch, locator_set,
                  ip_address):
         self.uuid = uuid
@@ -88,6 +123,19 @@ class McastMacsLocal(object):
 
 
 class PhysicalLocatorSet(object):
+    table = 'Physical_Locator_Set'
+    columns = {'locators': EMPTY_SET}
+
     def __init__(self, uuid, locators):
         self.uuid = uuid
         self.locators = locators
+
+
+MONITORED_CLASSES = (LogicalSwitch, PhysicalSwitch, PhysicalPort,
+                     UcastMacsLocal, UcastMacsRemote, PhysicalLocator,
+                     McastMacsLocal, PhysicalLocatorSet)
+
+
+def get_monitored_columns():
+    """Returns the monitored columns of each table keyed by table name."""
+    return dict((cls.table, cls.columns) for cls in MONITORED_CLASSES)
@@ -13,16 +13,23 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import functools
+
+import eventlet
+from eventlet import semaphore
+
 from neutron import manager
 from neutron.plugins.ml2.drivers.l2pop import rpc as l2pop_rpc
 
-from networking_l2gw._i18n import _LE
+from networking_l2gw._i18n import _LE, _LI
 from networking_l2gw.db.l2gateway import l2gateway_db
 from networking_l2gw.db.l2gateway.ovsdb import lib as db
+from networking_l2gw.services.l2gateway.common import agent_tunnel_ips
+from networking_l2gw.services.l2gateway.common import connected_networks
 from networking_l2gw.services.l2gateway.common import constants as n_const
 from networking_l2gw.services.l2gateway.common import ovsdb_schema
 from networking_l2gw.services.l2gateway.common import topics
-from networking_l2gw.services.l2gateway import exceptions as l2gw_exc
 from networking_l2gw.services.l2gateway.service_drivers import agent_api
 
 from neutron_lib import constants
@@ -32,113 +39,311 @@ import oslo_messaging as messaging
 
 LOG = logging.getLogger(__name__)
 
+_replay_semaphore = None
+
+
+def _get_replay_semaphore():
+    # Created on first use, once the configuration has been loaded.
+    global _replay_semaphore
+    if _replay_semaphore is None:
+        _replay_semaphore = semaphore.Semaphore(
+            max(cfg.CONF.pending_macs_replay_concurrency, 1))
+    return _replay_semaphore
+
 
 class L2GatewayOVSDBCallbacks(object):
     """Implement the rpc call back functions from OVSDB."""
 
-    target = messaging.Target(version='1.0')
+    # 1.0 Initial version
+    # 1.1 Added ack_vif_operation
+    target = messaging.Target(version='1.1')
 
     def __init__(self, plugin):
         super(L2GatewayOVSDBCallbacks, self).__init__()
         self.plugin = plugin
-        self.ovsdb = None
+        self.sync_seqs = {}
+        # One handler per OVSDB server, sharing the agent RPC client, is
+        # kept for the lifetime of the plugin as the handlers hold no
+        # state of their own between the RPCs.
+        self.ovsdb_data_handlers = {}
+        self.agent_rpc = agent_api.L2gatewayAgentApi(
+            topics.L2GATEWAY_AGENT, cfg.CONF.host)
+        self.l2gw_mixin = l2gateway_db.L2GatewayMixin()
+        self.l2pop_notifier = l2pop_rpc.L2populationAgentNotifyAPI()
 
     def update_ovsdb_changes(self, context, ovsdb_data):
         """RPC to update the changes from OVSDB in the database."""
-        self.ovsdb = self.get_ovsdbdata_object(
-            ovsdb_data.get(n_const.OVSDB_IDENTIFIER))
-        self.ovsdb.update_ovsdb_changes(context, ovsdb_data)
+        ovsdb_identifier = ovsdb_data.get(n_const.OVSDB_IDENTIFIER)
+        ovsdb = self.get_ovsdbdata_object(ovsdb_identifier)
+        ovsdb.update_ovsdb_changes(context, ovsdb_data)
+        if n_const.OVSDB_SYNC_SEQ in ovsdb_data:
+            self._track_initial_sync(ovsdb_identifier, ovsdb_data)
+
+    def _track_initial_sync(self, ovsdb_identifier, ovsdb_data):
+        # The initial records of an OVSDB server are streamed in chunks,
+        # each of them is committed on its own. The sequence is only
+        # tracked within this process, the chunks received by the other
+        # RPC workers are seen as missing.
+        seq = ovsdb_data[n_const.OVSDB_SYNC_SEQ]
+        expected_seq = self.sync_seqs.get(ovsdb_identifier, 0) if seq else 0
+        if seq != expected_seq:
+            LOG.debug("Received the chunk %(seq)d of the initial records "
+                      "of the OVSDB server %(ovsdb)s instead of the chunk "
+                      "%(expected)d",
+                      {'seq': seq, 'ovsdb': ovsdb_identifier,
+                       'expected': expected_seq})
+        self.sync_seqs[ovsdb_identifier] = seq + 1
+        if ovsdb_data.get(n_const.OVSDB_SYNC_COMPLETE):
+            del self.sync_seqs[ovsdb_identifier]
+            LOG.info(_LI("Received the initial records of the OVSDB server "
+                         "%(ovsdb)s in %(count)d chunks"),
+                     {'ovsdb': ovsdb_identifier, 'count': seq + 1})
 
     def notify_ovsdb_states(self, context, ovsdb_states):
         """RPC to notify the OVSDB servers connection state."""
         if ovsdb_states:
-            self.ovsdb = self.get_ovsdbdata_object(ovsdb_states.keys()[0])
-        if self.ovsdb:
+            ovsdb = self.get_ovsdbdata_object(ovsdb_states.keys()[0])
             LOG.debug("ovsdb_states = %s", ovsdb_states)
-            self.ovsdb.notify_ovsdb_states(context, ovsdb_states)
+            ovsdb.notify_ovsdb_states(context, ovsdb_states)
+
+    def ack_vif_operation(self, context, op_id, errors):
+        """RPC to acknowledge the remote MAC changes cast to the agent."""
+        failed = db.complete_outbox_ucast_mac_remotes(context, op_id, errors)
+        if failed:
+            LOG.debug("%(failed)d remote MAC changes of %(op_id)s failed "
+                      "and are pending", {'failed': failed, 'op_id': op_id})
 
     def get_ovsdbdata_object(self, ovsdb_identifier):
-        return OVSDBData(ovsdb_identifier)
+        ovsdb = self.ovsdb_data_handlers.get(ovsdb_identifier)
+        if ovsdb is None:
+            ovsdb = OVSDBData(ovsdb_identifier, agent_rpc=self.agent_rpc,
+                              l2gw_mixin=self.l2gw_mixin,
+                              l2pop_notifier=self.l2pop_notifier)
+            self.ovsdb_data_handlers[ovsdb_identifier] = ovsdb
+        return ovsdb
 
 
 class OVSDBData(object):
     """Process the data coming from OVSDB."""
 
-    def __init__(self, ovsdb_identifier=None):
+    def __init__(self, ovsdb_identifier=None, agent_rpc=None,
+                 l2gw_mixin=None, l2pop_notifier=None):
         self.ovsdb_identifier = ovsdb_identifier
         self._setup_entry_table()
-        self.agent_rpc = agent_api.L2gatewayAgentApi(
+        self.agent_rpc = agent_rpc or agent_api.L2gatewayAgentApi(
             topics.L2GATEWAY_AGENT, cfg.CONF.host)
-        self.l2gw_mixin = l2gateway_db.L2GatewayMixin()
+        self.l2gw_mixin = l2gw_mixin or l2gateway_db.L2GatewayMixin()
+        self.l2pop_notifier = (l2pop_notifier or
+                               l2pop_rpc.L2populationAgentNotifyAPI())
 
     def update_ovsdb_changes(self, context, ovsdb_data):
         """RPC to update the changes from OVSDB in the database."""
 
-        for item, value in ovsdb_data.items():
-            lookup = self.entry_table.get(item, None)
-            if lookup:
-                lookup(context, value)
+        # The RPCs and casts to the agents are sent once the changes are
+        # committed, so that no row is locked while waiting for an agent
+        # and no agent acts on changes that are rolled back.
+        post_commit = []
+        for batch in self._get_update_batches(ovsdb_data):
+            with context.session.begin(subtransactions=True):
+                for lookup, rows in batch:
+                    if lookup in self.post_commit_handlers:
+                        lookup(context, rows, post_commit=post_commit)
+                    else:
+                        lookup(context, rows)
+        self._send_post_commit(post_commit)
         if ovsdb_data.get('new_remote_macs'):
             self._handle_l2pop(context, ovsdb_data.get('new_remote_macs'))
 
+    def _defer(self, post_commit, method, *args):
+        """Call method, or queue it in post_commit when it is not None."""
+        if post_commit is None:
+            method(*args)
+        else:
+            post_commit.append(functools.partial(method, *args))
+
+    def _send_post_commit(self, post_commit):
+        for method in post_commit:
+            try:
+                method()
+            except Exception as ex:
+                LOG.exception(_LE("Exception occurred = %s"), str(ex))
+
+    def _get_update_batches(self, ovsdb_data):
+        """Split the changes of an update into database transactions.
+
+           Each batch is a list of (handler, rows) holding at most
+           ovsdb_update_batch_size rows, the whole update is a single
+           batch when the option is 0.
+        """
+        batch_size = cfg.CONF.ovsdb_update_batch_size
+        batches = [[]]
+        batch_rows = 0
+        for item, value in ovsdb_data.items():
+            lookup = self.entry_table.get(item, None)
+            if not lookup or not value:
+                continue
+            if batch_size <= 0:
+                batches[0].append((lookup, value))
+                continue
+            start = 0
+            while start < len(value):
+                if batch_rows == batch_size:
+                    batches.append([])
+                    batch_rows = 0
+                rows = value[start:start + batch_size - batch_rows]
+                batches[-1].append((lookup, rows))
+                batch_rows += len(rows)
+                start += len(rows)
+        return [batch for batch in batches if batch]
+
     def notify_ovsdb_states(self, context, ovsdb_states):
         """RPC to notify the OVSDB servers connection state."""
         for ovsdb_identifier, state in ovsdb_states.items():
             if state == 'connected':
-                pending_recs = db.get_all_pending_remote_macs_in_asc_order(
-                    context, ovsdb_identifier)
-                if pending_recs:
-                    for pending_mac in pending_recs:
-                        logical_switch_uuid = pending_mac['logical_switch_uuid'
-                                                          ]
-                        mac = pending_mac['mac']
-                        operation = pending_mac['operation']
-                        try:
-                            if operation == 'insert' or operation == 'update':
-                                l_switch = ovsdb_schema.LogicalSwitch(
-                                    logical_switch_uuid, None, None, None)
-                                locator_uuid = pending_mac.get(
-                                    'locator_uuid', None)
-                                dst_ip = pending_mac.get(
-                                    'dst_ip', None)
-                                locator = ovsdb_schema.PhysicalLocator(
-                                    locator_uuid, dst_ip)
-                                mac_remote = ovsdb_schema.UcastMacsRemote(
-                                    pending_mac.get('uuid', None),
-                                    mac,
-                                    logical_switch_uuid,
-                                    locator_uuid,
-                                    pending_mac['vm_ip'])
-                                if operation == 'insert':
-                                    self.agent_rpc.add_vif_to_gateway(
-                                        context,
-                                        ovsdb_identifier,
-                                        l_switch.__dict__,
-                                        locator.__dict__,
-                                        mac_remote.__dict__)
-                                else:
-                                    # update operation
-                                    self.agent_rpc.update_vif_to_gateway(
-                                        context,
-                                        ovsdb_identifier,
-                                        locator.__dict__,
-                                        mac_remote.__dict__)
-                            else:
-                                self.agent_rpc.delete_vif_from_gateway(
-                                    context, ovsdb_identifier,
-                                    logical_switch_uuid, [mac])
-
-                            # As the pending operation is over, delete the
-                            # record from the pending_ucast_mac_remote table
-                            db.delete_pending_ucast_mac_remote(
-                                context,
-                                operation,
-                                ovsdb_identifier,
-                                logical_switch_uuid,
-                                mac)
-                        except Exception as ex:
-                            LOG.exception(_LE("Exception occurred = %s"),
-                                          str(ex))
+                # The changes cast to an agent that never acknowledged
+                # them are retried with the pending ones.
+                db.requeue_stale_outbox_ucast_mac_remotes(
+                    context, ovsdb_identifier,
+                    cfg.CONF.mac_programming_ack_timeout)
+                # The pending changes are replayed one page at a time, as
+                # they pile up while the OVSDB server is unreachable, and
+                # only the net change of each MAC is replayed.
+                db.coalesce_pending_ucast_mac_remotes(context,
+                                                      ovsdb_identifier)
+                self._replay_pending_remote_macs(context, ovsdb_identifier)
+
+    def _replay_pending_remote_macs(self, context, ovsdb_identifier):
+        # The pending changes are sent to the agent in batches, and the
+        # number of OVSDB servers replayed at the same time as well as the
+        # rate of each replay are limited, so that the reconnection of
+        # many gateways does not flood the agent and the database.
+        batch_size = max(cfg.CONF.pending_macs_replay_batch_size, 1)
+        rate = cfg.CONF.pending_macs_replay_rate
+        with _get_replay_semaphore():
+            pending_recs = db.iter_pending_remote_macs_in_asc_order(
+                context, ovsdb_identifier, batch_size)
+            # The deletion and the insertion a MAC is coalesced to may be
+            # replayed in consecutive batches.
+            failed_deletes = set()
+            batch = []
+            for pending_mac in pending_recs:
+                batch.append(pending_mac)
+                if len(batch) == batch_size:
+                    self._replay_pending_batch(context, ovsdb_identifier,
+                                               batch, failed_deletes)
+                    if rate > 0:
+                        eventlet.sleep(float(len(batch)) / rate)
+                    batch = []
+            if batch:
+                self._replay_pending_batch(context, ovsdb_identifier, batch,
+                                           failed_deletes)
+
+    def _replay_pending_batch(self, context, ovsdb_identifier, batch,
+                              failed_deletes=None):
+        """Replay a batch of pending changes with bulk agent RPCs.
+
+        The changes of a batch are grouped by operation and logical switch,
+        the deletions are replayed first as a MAC coalesced to a deletion
+        followed by an insertion has to be removed from the gateway before
+        being added again. The records of the replayed changes are then
+        deleted at once, the failed ones are kept to be retried. The MACs
+        whose deletion failed are added to failed_deletes, and their
+        insertions are kept pending.
+        """
+        deletes = collections.defaultdict(list)
+        inserts = collections.defaultdict(list)
+        updates = []
+        for pending_mac in batch:
+            operation = pending_mac['operation']
+            if operation == 'insert':
+                inserts[pending_mac['logical_switch_uuid']].append(
+                    pending_mac)
+            elif operation == 'update':
+                updates.append(pending_mac)
+            else:
+                deletes[pending_mac['logical_switch_uuid']].append(
+                    pending_mac)
+
+        done_ids = []
+        if failed_deletes is None:
+            failed_deletes = set()
+        for logical_switch_uuid, pending_macs in deletes.items():
+            try:
+                self.agent_rpc.delete_vif_from_gateway(
+                    context, ovsdb_identifier, logical_switch_uuid,
+                    [pending_mac['mac'] for pending_mac in pending_macs])
+            except Exception as ex:
+                LOG.exception(_LE("Exception occurred = %s"), str(ex))
+                failed_deletes.update(
+                    (logical_switch_uuid, pending_mac['mac'])
+                    for pending_mac in pending_macs)
+                continue
+            done_ids.extend(pending_mac['id'] for pending_mac in pending_macs)
+
+        logical_switch_vifs = []
+        insert_macs = []
+        for logical_switch_uuid, pending_macs in inserts.items():
+            pending_macs = [pending_mac for pending_mac in pending_macs
+                            if (logical_switch_uuid, pending_mac['mac'])
+                            not in failed_deletes]
+            if not pending_macs:
+                continue
+            l_switch = ovsdb_schema.LogicalSwitch(logical_switch_uuid,
+                                                  None, None, None)
+            logical_switch_vifs.append(
+                {'logical_switch_dict': l_switch.__dict__,
+                 'vifs': [self._get_pending_vif(pending_mac)
+                          for pending_mac in pending_macs]})
+            insert_macs.extend(pending_macs)
+        if logical_switch_vifs:
+            done_ids.extend(self._replay_vifs(
+                self.agent_rpc.add_vifs_to_gateway, context,
+                ovsdb_identifier, logical_switch_vifs, insert_macs))
+
+        if updates:
+            done_ids.extend(self._replay_vifs(
+                self.agent_rpc.update_vifs_to_gateway, context,
+                ovsdb_identifier,
+                [self._get_pending_vif(pending_mac)
+                 for pending_mac in updates],
+                updates))
+
+        # As the pending operations are over, delete the records from the
+        # pending_ucast_mac_remote table
+        db.delete_pending_ucast_mac_remotes(context, done_ids)
+
+    def _replay_vifs(self, rpc_method, context, ovsdb_identifier, vifs,
+                     pending_macs):
+        """Send the vifs with a bulk RPC, return the ids replayed."""
+        try:
+            errors = rpc_method(context, ovsdb_identifier, vifs)
+        except Exception as ex:
+            LOG.exception(_LE("Exception occurred = %s"), str(ex))
+            return []
+        errors = errors or [None] * len(pending_macs)
+        done_ids = []
+        for pending_mac, error in zip(pending_macs, errors):
+            if error:
+                LOG.error(_LE("Failed to replay the pending %(operation)s "
+                              "of MAC %(mac)s: %(error)s"),
+                          {'operation': pending_mac['operation'],
+                           'mac': pending_mac['mac'], 'error': error})
+                continue
+            done_ids.append(pending_mac['id'])
+        return done_ids
+
+    def _get_pending_vif(self, pending_mac):
+        locator_uuid = pending_mac.get('locator_uuid', None)
+        locator = ovsdb_schema.PhysicalLocator(
+            locator_uuid, pending_mac.get('dst_ip', None))
+        mac_remote = ovsdb_schema.UcastMacsRemote(
+            pending_mac.get('uuid', None),
+            pending_mac['mac'],
+            pending_mac['logical_switch_uuid'],
+            locator_uuid,
+            pending_mac['vm_ip'])
+        return {'locator_dict': locator.__dict__,
+                'mac_dict': mac_remote.__dict__}
 
     def _setup_entry_table(self):
         self.entry_table = {'new_logical_switches':
@@ -172,18 +377,26 @@ class OVSDBData(object):
                             'modified_physical_switches':
                             self._process_modified_physical_switches,
                             }
+        # The handlers sending RPCs to the agents or invalidating the
+        # caches, which are deferred after the commit of the update.
+        self.post_commit_handlers = set([
+            self._process_new_logical_switches,
+            self._process_deleted_logical_switches,
+            self._process_deleted_physical_ports,
+            self._process_deleted_physical_switches,
+            self._process_deleted_physical_locators])
 
         return
 
     def _process_new_logical_switches(self,
                                       context,
-                                      new_logical_switches):
+                                      new_logical_switches,
+                                      post_commit=None):
         for logical_switch in new_logical_switches:
-            ls_dict = logical_switch
-            ls_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
-            l_switch = db.get_logical_switch(context, ls_dict)
-            if not l_switch:
-                db.add_logical_switch(context, ls_dict)
+            logical_switch[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
+        db.bulk_add_logical_switches(context, new_logical_switches)
+        self._defer(post_commit,
+                    connected_networks.get_cache().invalidate_logical_switches)
 
     def _process_new_physical_switches(self,
                                        context,
@@ -193,37 +406,30 @@ class OVSDBData(object):
             ps_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
             if (ps_dict.get('tunnel_ip'))[0] == 'set':
                 ps_dict['tunnel_ip'] = None
-            p_switch = db.get_physical_switch(context, ps_dict)
-            if not p_switch:
-                db.add_physical_switch(context, ps_dict)
+        db.bulk_add_physical_switches(context, new_physical_switches)
 
     def _process_new_physical_ports(self,
                                     context,
                                     new_physical_ports):
+        vlan_bindings = []
         for physical_port in new_physical_ports:
             pp_dict = physical_port
             pp_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
-            p_port = db.get_physical_port(context, pp_dict)
-            if not p_port:
-                db.add_physical_port(context, pp_dict)
-            if pp_dict.get('vlan_bindings'):
-                for vlan_binding in pp_dict.get('vlan_bindings'):
-                    vlan_binding[
-                        n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
-                    vlan_binding['port_uuid'] = pp_dict.get('uuid')
-                    v_binding = db.get_vlan_binding(context, vlan_binding)
-                    if not v_binding:
-                        db.add_vlan_binding(context, vlan_binding)
+            for vlan_binding in pp_dict.get('vlan_bindings') or []:
+                vlan_binding[
+                    n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
+                vlan_binding['port_uuid'] = pp_dict.get('uuid')
+                vlan_bindings.append(vlan_binding)
+        db.bulk_add_physical_ports(context, new_physical_ports)
+        db.bulk_add_vlan_bindings(context, vlan_bindings)
 
     def _process_new_physical_locators(self,
                                        context,
                                        new_physical_locators):
         for physical_locator in new_physical_locators:
-            pl_dict = physical_locator
-            pl_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
-            p_locator = db.get_physical_locator(context, pl_dict)
-            if not p_locator:
-                db.add_physical_locator(context, pl_dict)
+            physical_locator[
+                n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
+        db.bulk_add_physical_locators(context, new_physical_locators)
 
     def _process_new_local_macs(self,
                                 context,
@@ -232,19 +438,14 @@ class OVSDBData(object):
             lm_dict = local_mac
             lm_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
             lm_dict['logical_switch_uuid'] = local_mac.get('logical_switch_id')
-            l_mac = db.get_ucast_mac_local(context, lm_dict)
-            if not l_mac:
-                db.add_ucast_mac_local(context, lm_dict)
+        db.bulk_add_ucast_macs_locals(context, new_local_macs)
 
     def _process_new_remote_macs(self,
                                  context,
                                  new_remote_macs):
         for remote_mac in new_remote_macs:
-            rm_dict = remote_mac
-            rm_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
-            r_mac = db.get_ucast_mac_remote(context, rm_dict)
-            if not r_mac:
-                db.add_ucast_mac_remote(context, rm_dict)
+            remote_mac[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
+        db.bulk_add_ucast_macs_remotes(context, new_remote_macs)
 
     def _process_modified_remote_macs(self,
                                       context,
@@ -259,20 +460,40 @@ class OVSDBData(object):
         vlan_bindings = db.get_all_vlan_bindings_by_logical_switch(
             context, mac)
         for vlan_binding in vlan_bindings:
+            # The chunks of the initial records are processed in any
+            # order, the port or switch of a binding may not be stored
+            # yet.
             record_dict['uuid'] = vlan_binding.get('port_uuid')
             physical_port = db.get_physical_port(context, record_dict)
+            if not physical_port:
+                LOG.debug("Physical port %s not found", record_dict['uuid'])
+                continue
             record_dict['uuid'] = physical_port.get('physical_switch_id')
             physical_switch = db.get_physical_switch(context, record_dict)
+            if not physical_switch:
+                LOG.debug("Physical switch %s not found", record_dict['uuid'])
+                continue
             physical_switch_ips.add(physical_switch.get('tunnel_ip'))
         return list(physical_switch_ips)
 
     def _handle_l2pop(self, context, new_remote_macs):
+        # The flooding entries of all the MACs are sent in a single
+        # message, each logical switch being looked up only once.
+        fdb_entries = {}
+        logical_switch_ids = set()
         for mac in new_remote_macs:
+            logical_switch_id = mac.get('logical_switch_id')
+            if logical_switch_id in logical_switch_ids:
+                continue
+            logical_switch_ids.add(logical_switch_id)
             agent_ips = self._get_physical_switch_ips(context, mac)
             for agent_ip in agent_ips:
-                other_fdb_entries = self._get_fdb_entries(
-                    context, agent_ip, mac.get('logical_switch_id'))
-                self._trigger_l2pop_sync(context, other_fdb_entries)
+                self._merge_fdb_entries(
+                    fdb_entries,
+                    self._get_fdb_entries(context, agent_ip,
+                                          logical_switch_id))
+        if fdb_entries:
+            self._trigger_l2pop_sync(context, fdb_entries)
 
     def _process_modified_physical_ports(self,
                                          context,
@@ -303,19 +524,23 @@ class OVSDBData(object):
 
     def _process_deleted_logical_switches(self,
                                           context,
-                                          deleted_logical_switches):
-        for logical_switch in deleted_logical_switches:
-            ls_dict = logical_switch
-            ls_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
-            db.delete_logical_switch(context, ls_dict)
+                                          deleted_logical_switches,
+                                          post_commit=None):
+        db.bulk_delete_logical_switches(
+            context, self.ovsdb_identifier,
+            [logical_switch.get('uuid')
+             for logical_switch in deleted_logical_switches])
+        self._defer(post_commit,
+                    connected_networks.get_cache().invalidate_logical_switches)
 
     def _process_deleted_physical_switches(self,
                                            context,
-                                           deleted_physical_switches):
-        for physical_switch in deleted_physical_switches:
-            ps_dict = physical_switch
-            ps_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
-            db.delete_physical_switch(context, ps_dict)
+                                           deleted_physical_switches,
+                                           post_commit=None):
+        db.bulk_delete_physical_switches(
+            context, self.ovsdb_identifier,
+            [physical_switch.get('uuid')
+             for physical_switch in deleted_physical_switches])
         physical_switches = db.get_all_physical_switches_by_ovsdb_id(
             context, self.ovsdb_identifier)
         if not physical_switches:
@@ -323,29 +548,38 @@ class OVSDBData(object):
                 context, self.ovsdb_identifier)
             if logical_switches:
                 for logical_switch in logical_switches:
-                    self.agent_rpc.delete_network(
-                        context, self.ovsdb_identifier,
-                        logical_switch.get('uuid'))
+                    self._defer(post_commit, self.agent_rpc.delete_network,
+                                context, self.ovsdb_identifier,
+                                logical_switch.get('uuid'))
 
     def _process_deleted_physical_ports(self,
                                         context,
-                                        deleted_physical_ports):
+                                        deleted_physical_ports,
+                                        post_commit=None):
         for physical_port in deleted_physical_ports:
             pp_dict = physical_port
             pp_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
             port_name = pp_dict['name']
             p_port = db.get_physical_port(context, pp_dict)
             if not p_port:
-                raise l2gw_exc.L2GatewayInterfaceNotFound(
-                    interface_id=port_name)
+                # Only the row is skipped, the other changes of the
+                # update are still committed.
+                LOG.error(_LE("The deleted physical port %(port)s of the "
+                              "OVSDB server %(ovsdb)s is not found"),
+                          {'port': port_name,
+                           'ovsdb': self.ovsdb_identifier})
+                continue
             p_switch_id = p_port.get('physical_switch_id')
             switch_dict = {}
             switch_dict['uuid'] = p_switch_id
             switch_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
             switch_db = db.get_physical_switch(context, switch_dict)
             if not switch_db:
-                raise l2gw_exc.L2GatewayDeviceNotFound(
-                    device_id=p_switch_id)
+                LOG.error(_LE("The physical switch %(switch)s of the "
+                              "deleted physical port %(port)s is not "
+                              "found"),
+                          {'switch': p_switch_id, 'port': port_name})
+                continue
             switch_name = switch_db.get('name')
             l2gw_id_list = self.l2gw_mixin._get_l2gw_ids_by_interface_switch(
                 context, port_name, switch_name)
@@ -368,7 +602,7 @@ class OVSDBData(object):
                     self._delete_macs_from_ovsdb(
                         context,
                         vlan_binding.get('logical_switch_uuid'),
-                        self.ovsdb_identifier)
+                        self.ovsdb_identifier, post_commit)
                 elif bindings and len(bindings) > 1:
                     flag = True
                     for binding in bindings:
@@ -380,26 +614,26 @@ class OVSDBData(object):
                         self._delete_macs_from_ovsdb(
                             context,
                             vlan_binding.get('logical_switch_uuid'),
-                            self.ovsdb_identifier)
+                            self.ovsdb_identifier, post_commit)
                 ls_set.add(vlan_binding.get('logical_switch_uuid'))
                 db.delete_vlan_binding(context, vlan_binding)
             db.delete_physical_port(context, pp_dict)
 
     def _delete_macs_from_ovsdb(self, context, logical_switch_id,
-                                ovsdb_identifier):
+                                ovsdb_identifier, post_commit=None):
         mac_list = []
         ls_dict = {'logical_switch_id': logical_switch_id,
                    'ovsdb_identifier': ovsdb_identifier}
         macs = db.get_all_ucast_mac_remote_by_ls(context, ls_dict)
         for mac in macs:
             mac_list.append(mac.get('mac'))
-        self.agent_rpc.delete_vif_from_gateway(
-            context, ovsdb_identifier,
-            logical_switch_id, mac_list)
+        self._defer(post_commit, self.agent_rpc.delete_vif_from_gateway,
+                    context, ovsdb_identifier, logical_switch_id, mac_list)
 
     def _process_deleted_physical_locators(self,
                                            context,
-                                           deleted_physical_locators):
+                                           deleted_physical_locators,
+                                           post_commit=None):
         physical_switch_ips = []
         logical_switch_ids = self._get_logical_switch_ids(context)
         physical_switches = db.get_all_physical_switches_by_ovsdb_id(
@@ -408,41 +642,52 @@ class OVSDBData(object):
             physical_switch_ips.append(
                 physical_switch.get('tunnel_ip'))
         tunneling_ip_dict = self._get_agent_ips(context)
+        # The entries removed from an agent are merged in a message sent
+        # to its host, the other ones in a single fanout message.
+        host_fdb_entries = {}
+        fdb_entries = {}
         for physical_locator in deleted_physical_locators:
-            pl_dict = physical_locator
-            pl_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
             agent_ip = physical_locator.get('dst_ip')
-            if agent_ip in tunneling_ip_dict.keys():
+            if agent_ip in tunneling_ip_dict:
+                agent_host = tunneling_ip_dict.get(agent_ip)
                 for logical_switch_id in logical_switch_ids:
                     for physical_switch_ip in physical_switch_ips:
-                        other_fdb_entries = self._get_fdb_entries(
-                            context, physical_switch_ip, logical_switch_id)
-                        agent_host = tunneling_ip_dict.get(agent_ip)
-                        self._trigger_l2pop_delete(
-                            context, other_fdb_entries, agent_host)
+                        self._merge_fdb_entries(
+                            host_fdb_entries.setdefault(agent_host, {}),
+                            self._get_fdb_entries(
+                                context, physical_switch_ip,
+                                logical_switch_id))
             else:
                 for logical_switch_id in logical_switch_ids:
-                    other_fdb_entries = self._get_fdb_entries(
-                        context, agent_ip, logical_switch_id)
-                    self._trigger_l2pop_delete(
-                        context, other_fdb_entries)
-            db.delete_physical_locator(context, pl_dict)
+                    self._merge_fdb_entries(
+                        fdb_entries,
+                        self._get_fdb_entries(context, agent_ip,
+                                              logical_switch_id))
+        for agent_host, other_fdb_entries in host_fdb_entries.items():
+            if other_fdb_entries:
+                self._defer(post_commit, self._trigger_l2pop_delete,
+                            context, other_fdb_entries, agent_host)
+        if fdb_entries:
+            self._defer(post_commit, self._trigger_l2pop_delete,
+                        context, fdb_entries)
+        db.bulk_delete_physical_locators(
+            context, self.ovsdb_identifier,
+            [physical_locator.get('uuid')
+             for physical_locator in deleted_physical_locators])
 
     def _process_deleted_local_macs(self,
                                     context,
                                     deleted_local_macs):
-        for local_mac in deleted_local_macs:
-            lm_dict = local_mac
-            lm_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
-            db.delete_ucast_mac_local(context, lm_dict)
+        db.bulk_delete_ucast_macs_locals(
+            context, self.ovsdb_identifier,
+            [local_mac.get('uuid') for local_mac in deleted_local_macs])
 
     def _process_deleted_remote_macs(self,
                                      context,
                                      deleted_remote_macs):
-        for remote_mac in deleted_remote_macs:
-            rm_dict = remote_mac
-            rm_dict[n_const.OVSDB_IDENTIFIER] = self.ovsdb_identifier
-            db.delete_ucast_mac_remote(context, rm_dict)
+        db.bulk_delete_ucast_macs_remotes(
+            context, self.ovsdb_identifier,
+            [remote_mac.get('uuid') for remote_mac in deleted_remote_macs])
 
     def _get_logical_switch_ids(self, context):
         logical_switch_ids = set()
@@ -453,20 +698,16 @@ class OVSDBData(object):
         return list(logical_switch_ids)
 
     def _get_agent_ips(self, context):
-        agent_ip_dict = {}
         ml2plugin = manager.NeutronManager.get_plugin()
-        agents = ml2plugin.get_agents(
-            context, filters={'agent_type': [constants.AGENT_TYPE_OVS]})
-        for agent in agents:
-            conf_dict = agent.get('configurations')
-            tunnel_ip = conf_dict.get('tunneling_ip')
-            agent_ip_dict[tunnel_ip] = agent.get('host')
-        return agent_ip_dict
+        return agent_tunnel_ips.get_cache().get_agent_ips(context, ml2plugin)
 
     def _get_fdb_entries(self, context, agent_ip, logical_switch_uuid):
         ls_dict = {'uuid': logical_switch_uuid,
                    n_const.OVSDB_IDENTIFIER: self.ovsdb_identifier}
         logical_switch = db.get_logical_switch(context, ls_dict)
+        if not logical_switch:
+            LOG.debug("Logical switch %s not found", logical_switch_uuid)
+            return {}
         network_id = logical_switch.get('name')
         segment_id = logical_switch.get('key')
         port_fdb_entries = constants.FLOODING_ENTRY
@@ -477,12 +718,25 @@ class OVSDBData(object):
                                                     }}}
         return other_fdb_entries
 
+    def _merge_fdb_entries(self, fdb_entries, other_fdb_entries):
+        """Merge the FDB entries of other_fdb_entries in fdb_entries."""
+        for network_id, network_entries in other_fdb_entries.items():
+            merged = fdb_entries.setdefault(
+                network_id, {'segment_id': network_entries['segment_id'],
+                             'network_type': network_entries['network_type'],
+                             'ports': {}})
+            for agent_ip, ports in network_entries['ports'].items():
+                merged_ports = merged['ports'].setdefault(agent_ip, [])
+                for port in ports:
+                    if port not in merged_ports:
+                        merged_ports.append(port)
+        return fdb_entries
+
     def _trigger_l2pop_sync(self, context, other_fdb_entries):
         """Sends L2pop ADD RPC message to the neutron L2 agent."""
-        l2pop_rpc.L2populationAgentNotifyAPI(
-            ).add_fdb_entries(context, other_fdb_entries)
+        self.l2pop_notifier.add_fdb_entries(context, other_fdb_entries)
 
     def _trigger_l2pop_delete(self, context, other_fdb_entries, host=None):
         """Sends L2pop DELETE RPC message to the neutron L2 agent."""
-        l2pop_rpc.L2populationAgentNotifyAPI(
-            ).remove_fdb_entries(context, other_fdb_entries, host)
+        self.l2pop_notifier.remove_fdb_entries(context, other_fdb_entries,
+                                               host)
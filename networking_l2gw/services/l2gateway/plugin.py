@@ -23,7 +23,9 @@ from networking_l2gw._i18n import _LE
 from networking_l2gw.db.l2gateway import l2gateway_db
 from networking_l2gw.services.l2gateway.common import config
 from networking_l2gw.services.l2gateway.common import constants
+from networking_l2gw.services.l2gateway import port_mac_worker
 
+from oslo_config import cfg
 from oslo_log import log as logging
 
 LOG = logging.getLogger(__name__)
@@ -52,6 +54,9 @@ class L2GatewayPlugin(l2gateway_db.L2GatewayMixin):
         add_provider_configuration(self.service_type_manager, constants.L2GW)
         self._load_drivers()
         super(L2GatewayPlugin, self).__init__()
+        self.port_mac_worker = port_mac_worker.PortMacWorker(
+            self, cfg.CONF.port_event_queue_size,
+            cfg.CONF.port_event_batch_size)
         l2gateway_db.subscribe()
 
     def _load_drivers(self):
@@ -83,8 +88,7 @@ class L2GatewayPlugin(l2gateway_db.L2GatewayMixin):
 
         to add to the gateway.
         """
-        self._get_driver_for_provider(constants.l2gw
-                                      ).add_port_mac(context, port_dict)
+        self.port_mac_worker.add_port_mac(context, port_dict)
 
     def delete_port_mac(self, context, port):
         """Process the deleted port and trigger the RPC
@@ -95,8 +99,11 @@ class L2GatewayPlugin(l2gateway_db.L2GatewayMixin):
         a single port dict, whereas the L2gateway service plugin
         sends it as a list of port dicts.
         """
-        self._get_driver_for_provider(constants.l2gw
-                                      ).delete_port_mac(context, port)
+        if isinstance(port, list):
+            self._get_driver_for_provider(constants.l2gw
+                                          ).delete_port_mac(context, port)
+        else:
+            self.port_mac_worker.delete_port_mac(context, port)
 
     def create_l2_gateway_connection(self, context, l2_gateway_connection):
         """Process the call from the CLI and trigger the RPC,
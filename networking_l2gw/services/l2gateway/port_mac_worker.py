@@ -0,0 +1,160 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+
+import eventlet
+from eventlet import queue
+
+from neutron import context as neutron_context
+
+from networking_l2gw._i18n import _LE, _LI, _LW
+from networking_l2gw.services.l2gateway.common import constants
+
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+ADD_PORT_MAC = 'add'
+DELETE_PORT_MAC = 'delete'
+
+STATS = ('received', 'coalesced', 'processed', 'overflowed', 'max_queued')
+
+
+class PortMacWorker(object):
+    """Program the MACs of the port events on the gateways.
+
+    The port events are queued and processed in batches by a background
+    thread, so that the API requests updating the ports do not wait for
+    the gateways. A port queued several times is processed once, with
+    its last event, and when the queue is full the events are processed
+    synchronously, slowing the API requests down. With a queue_size of 0
+    all the events are processed synchronously. The counters of the
+    worker are logged after the batches during which events were
+    coalesced or overflowed.
+    """
+
+    def __init__(self, plugin, queue_size, batch_size):
+        self.plugin = plugin
+        self.queue_size = queue_size
+        self.batch_size = max(batch_size, 1)
+        # port_id -> (operation, port_dict)
+        self.pending = {}
+        self.port_ids = queue.LightQueue(maxsize=max(queue_size, 0))
+        self.thread = None
+        self.stats = collections.Counter()
+        # The coalesced and overflowed counts last logged.
+        self.logged_stats = (0, 0)
+
+    @property
+    def synchronous(self):
+        return self.queue_size <= 0
+
+    def get_stats(self):
+        """Return the backpressure counters of the worker."""
+        stats = dict((name, self.stats[name]) for name in STATS)
+        stats['queued'] = len(self.pending)
+        return stats
+
+    def add_port_mac(self, context, port_dict):
+        self._enqueue(context, ADD_PORT_MAC, port_dict)
+
+    def delete_port_mac(self, context, port_dict):
+        self._enqueue(context, DELETE_PORT_MAC, port_dict)
+
+    def _enqueue(self, context, operation, port_dict):
+        self.stats['received'] += 1
+        if self.synchronous:
+            driver = self.plugin._get_driver_for_provider(constants.l2gw)
+            if operation == DELETE_PORT_MAC:
+                driver.delete_port_mac(context, port_dict)
+            else:
+                driver.add_port_mac(context, port_dict)
+            self.stats['processed'] += 1
+            return
+        port_id = port_dict.get('id')
+        if port_id in self.pending:
+            # Only the last event of a port is processed.
+            self.pending[port_id] = (operation, port_dict)
+            self.stats['coalesced'] += 1
+            return
+        if self.port_ids.full():
+            if not self.stats['overflowed']:
+                LOG.warning(_LW("The port MAC queue is full, the port "
+                                "events are processed synchronously"))
+            self.stats['overflowed'] += 1
+            self._process(context, [(operation, port_dict)])
+            return
+        self.pending[port_id] = (operation, port_dict)
+        self.port_ids.put_nowait(port_id)
+        self.stats['max_queued'] = max(self.stats['max_queued'],
+                                       len(self.pending))
+        if self.thread is None:
+            self.thread = eventlet.spawn_n(self._run)
+
+    def _run(self):
+        while True:
+            try:
+                self.process_queued()
+            except Exception:
+                LOG.exception(_LE("Failed to process the queued port "
+                                  "events"))
+
+    def process_queued(self, block=True):
+        """Process a batch of the queued port events."""
+        port_ids = []
+        try:
+            port_ids.append(self.port_ids.get(block=block))
+            while len(port_ids) < self.batch_size:
+                port_ids.append(self.port_ids.get_nowait())
+        except queue.Empty:
+            pass
+        events = [self.pending.pop(port_id) for port_id in port_ids]
+        if events:
+            self._process(neutron_context.get_admin_context(), events)
+            self._log_stats()
+
+    def _log_stats(self):
+        """Log the counters when events were coalesced or overflowed."""
+        stats = (self.stats['coalesced'], self.stats['overflowed'])
+        if stats == self.logged_stats:
+            return
+        self.logged_stats = stats
+        LOG.info(_LI("Port MAC worker: %(received)d events received, "
+                     "%(coalesced)d coalesced, %(overflowed)d overflowed, "
+                     "%(processed)d processed, %(queued)d queued, at most "
+                     "%(max_queued)d queued"),
+                 self.get_stats())
+
+    def _process(self, context, events):
+        """Process the events of distinct ports.
+
+        The deleted ports are processed first, then the MACs of the other
+        ports are added with one call grouped by network and gateway.
+        """
+        driver = self.plugin._get_driver_for_provider(constants.l2gw)
+        ports_to_add = []
+        for operation, port_dict in events:
+            if operation == DELETE_PORT_MAC:
+                try:
+                    driver.delete_port_mac(context, port_dict)
+                except Exception:
+                    LOG.exception(_LE("Failed to delete the MAC of the "
+                                      "port %s"), port_dict.get('id'))
+            else:
+                ports_to_add.append(port_dict)
+        if ports_to_add:
+            driver.add_port_macs(context, ports_to_add)
+        self.stats['processed'] += len(events)
@@ -36,6 +36,10 @@ class L2gwDriver(object):
     def add_port_mac(self, context, port_dict):
         pass
 
+    def add_port_macs(self, context, port_dicts):
+        for port_dict in port_dicts:
+            self.add_port_mac(context, port_dict)
+
     @abc.abstractmethod
     def delete_port_mac(self, context, port):
         pass
@@ -24,7 +24,18 @@ LOG = logging.getLogger(__name__)
 
 
 class L2gatewayAgentApi(object):
-    """L2gateway plugin to agent RPC API."""
+    """L2gateway plugin to agent RPC API.
+
+    API version history:
+        1.0 - Initial version.
+        1.1 - Added add_vifs_to_gateway and update_vifs_to_gateway.
+        1.2 - Added op_id to add_vifs_to_gateway, update_vifs_to_gateway
+              and delete_vif_from_gateway to cast them, the agent then
+              acknowledges them with ack_vif_operation.
+
+    The bulk RPCs fall back to the RPCs of version 1.0 for the agents
+    that do not support version 1.1 yet, during a rolling upgrade.
+    """
 
     API_VERSION = '1.0'
 
@@ -62,9 +73,102 @@ class L2gatewayAgentApi(object):
                           locator_dict=physical_locator,
                           mac_dict=mac_remote)
 
+    def can_cast_vif_operations(self):
+        """Return whether the MAC changes can be cast with an op_id."""
+        return self.client.can_send_version('1.2')
+
+    def _call_bulk(self, context, method, fallback, **kwargs):
+        if self.client.can_send_version('1.1'):
+            cctxt = self.client.prepare(version='1.1')
+            try:
+                return cctxt.call(context, method, **kwargs)
+            except messaging.RemoteError as ex:
+                if ex.exc_type != 'UnsupportedVersion':
+                    raise
+        LOG.debug("The L2 gateway agent does not support %s, falling "
+                  "back to the RPCs of version 1.0", method)
+        return fallback()
+
+    def _call_each(self, rpc_method, vifs_args):
+        # The error of each VM is returned as the bulk RPCs do.
+        errors = []
+        for args in vifs_args:
+            try:
+                rpc_method(*args)
+            except Exception as ex:
+                errors.append(str(ex))
+            else:
+                errors.append(None)
+        return errors
+
+    def add_vifs_to_gateway(self, context, ovsdb_identifier,
+                            logical_switch_vifs, op_id=None):
+        """RPC to enter the MAC details of several VMs to gateway.
+
+        logical_switch_vifs is a list of dicts holding a logical switch
+        (logical_switch_dict) and the list of locator and MAC dicts to be
+        added to it (vifs). Returns the error for each VM, None for the
+        VMs that have been added. With an op_id, the RPC is cast and
+        the errors are sent back with ack_vif_operation instead.
+        """
+        if op_id:
+            cctxt = self.client.prepare(version='1.2')
+            return cctxt.cast(context,
+                              'add_vifs_to_gateway',
+                              ovsdb_identifier=ovsdb_identifier,
+                              logical_switch_vifs=logical_switch_vifs,
+                              op_id=op_id)
+        return self._call_bulk(
+            context, 'add_vifs_to_gateway',
+            lambda: self._call_each(
+                self.add_vif_to_gateway,
+                [(context, ovsdb_identifier, ls_vifs['logical_switch_dict'],
+                  vif['locator_dict'], vif['mac_dict'])
+                 for ls_vifs in logical_switch_vifs
+                 for vif in ls_vifs['vifs']]),
+            ovsdb_identifier=ovsdb_identifier,
+            logical_switch_vifs=logical_switch_vifs)
+
+    def update_vifs_to_gateway(self, context, ovsdb_identifier, vifs,
+                               op_id=None):
+        """RPC to update the MAC details of several VMs to gateway.
+
+        vifs is a list of dicts holding a locator (locator_dict) and a
+        MAC (mac_dict). Returns the error for each VM, None for the VMs
+        that have been updated. With an op_id, the RPC is cast and the
+        errors are sent back with ack_vif_operation instead.
+        """
+        if op_id:
+            cctxt = self.client.prepare(version='1.2')
+            return cctxt.cast(context,
+                              'update_vifs_to_gateway',
+                              ovsdb_identifier=ovsdb_identifier,
+                              vifs=vifs,
+                              op_id=op_id)
+        return self._call_bulk(
+            context, 'update_vifs_to_gateway',
+            lambda: self._call_each(
+                self.update_vif_to_gateway,
+                [(context, ovsdb_identifier, vif['locator_dict'],
+                  vif['mac_dict']) for vif in vifs]),
+            ovsdb_identifier=ovsdb_identifier,
+            vifs=vifs)
+
     def delete_vif_from_gateway(self, context, ovsdb_identifier,
-                                logical_switch_uuid, macs):
-        """RPC to delete the VM MAC details from gateway."""
+                                logical_switch_uuid, macs, op_id=None):
+        """RPC to delete the VM MAC details from gateway.
+
+        With an op_id, the RPC is cast and the agent acknowledges it
+        with ack_vif_operation.
+        """
+        if op_id:
+            cctxt = self.client.prepare(version='1.2')
+            return cctxt.cast(context,
+                              'delete_vif_from_gateway',
+                              ovsdb_identifier=ovsdb_identifier,
+                              logical_switch_uuid=logical_switch_uuid,
+                              mac=macs,
+                              op_id=op_id)
         cctxt = self.client.prepare()
         return cctxt.call(context,
                           'delete_vif_from_gateway',
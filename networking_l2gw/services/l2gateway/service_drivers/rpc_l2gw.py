@@ -14,14 +14,17 @@
 #    under the License.
 
 import abc
+import collections
 from neutron.common import exceptions
 from neutron.common import rpc as n_rpc
 from neutron.db import agents_db
 from neutron.extensions import portbindings
 
-from networking_l2gw._i18n import _LE
+from networking_l2gw._i18n import _LE, _LW
 from networking_l2gw.db.l2gateway.ovsdb import lib as db
 from networking_l2gw.services.l2gateway import agent_scheduler
+from networking_l2gw.services.l2gateway.common import agent_tunnel_ips
+from networking_l2gw.services.l2gateway.common import connected_networks
 from networking_l2gw.services.l2gateway.common import constants
 from networking_l2gw.services.l2gateway.common import l2gw_validators
 from networking_l2gw.services.l2gateway.common import ovsdb_schema
@@ -30,11 +33,11 @@ from networking_l2gw.services.l2gateway import exceptions as l2gw_exc
 from networking_l2gw.services.l2gateway import service_drivers
 from networking_l2gw.services.l2gateway.service_drivers import agent_api
 
-from neutron_lib import constants as n_const
 from oslo_config import cfg
 from oslo_log import log as logging
 import oslo_messaging as messaging
 from oslo_utils import importutils
+from oslo_utils import uuidutils
 import six
 
 LOG = logging.getLogger(__name__)
@@ -85,21 +88,51 @@ class L2gwRpcDriver(service_drivers.L2gwDriver):
 
         to add to the gateway.
         """
-        port_id = port_dict.get("id")
-        port = self.service_plugin._core_plugin.get_port(context, port_id)
-        if port['device_owner']:
+        self.add_port_macs(context, [port_dict])
+
+    def add_port_macs(self, context, port_dicts):
+        """Process the created ports and trigger the RPCs
+
+        to add them to the gateways, the MACs of all the ports are sent
+        to each OVSDB server in one RPC, grouped by logical switch.
+        """
+        vifs_to_add = {}
+        vifs_to_update = {}
+        existing_macs = {}
+        networks = {}
+        for port_dict in port_dicts:
+            # The port of the port update events is used as is, the port
+            # is only read again when the caller did not supply its
+            # binding.
+            if portbindings.HOST_ID in port_dict:
+                port = port_dict
+            else:
+                port = self.service_plugin._core_plugin.get_port(
+                    context, port_dict.get("id"))
+            if not port['device_owner']:
+                continue
             network_id = port.get("network_id")
-            dst_ip, ip_address = self._get_ip_details(context, port)
-            network = self._get_network_details(context, network_id)
-            l2gateway_connections = (
-                self.service_plugin.get_l2_gateway_connections(
-                    context, filters={'network_id': [network_id]}))
-            if not l2gateway_connections:
-                return
-            logical_switches = db.get_all_logical_switches_by_name(context,
-                                                                   network_id)
+            # Most of the networks have no L2 gateway connection, their
+            # ports are skipped before any other lookup.
+            logical_switches = (
+                connected_networks.get_cache().get_logical_switches(
+                    context, self.service_plugin, network_id))
             if not logical_switches:
-                return
+                continue
+            try:
+                dst_ip, ip_address = self._get_ip_details(context, port)
+            except l2gw_exc.OvsAgentNotFound as e:
+                # A port of a batch does not prevent the others from
+                # being added.
+                if len(port_dicts) == 1:
+                    raise
+                LOG.warning(_LW("Skipping the port %(port)s: %(error)s"),
+                            {'port': port.get('id'), 'error': e})
+                continue
+            if network_id not in networks:
+                networks[network_id] = self._get_network_details(
+                    context, network_id)
+            network = networks[network_id]
             for logical_switch in logical_switches:
                 logical_switch['description'] = network.get('name')
                 ovsdb_identifier = logical_switch.get('ovsdb_identifier')
@@ -125,57 +158,131 @@ class L2gwRpcDriver(service_drivers.L2gwDriver):
                     if ucast_mac_remote['physical_locator_id'
                                         ] != physical_locator['uuid']:
                         mac_remote['uuid'] = ucast_mac_remote['uuid']
-                        try:
-                            self.agent_rpc.update_vif_to_gateway(
-                                context, ovsdb_identifier,
-                                physical_locator, mac_remote)
-                            LOG.debug(
-                                "VM migrated from %s to %s. Update"
-                                "locator in Ucast_Macs_Remote",
-                                ucast_mac_remote['physical_locator_id'],
-                                physical_locator['uuid'])
-                        except messaging.MessagingTimeout:
-                            # If RPC is timed out, then the RabbitMQ
-                            # will retry the operation.
-                            LOG.exception(_LE("Communication error with "
-                                              "the L2 gateway agent"))
-                        except Exception:
-                            # The remote OVSDB server may be down.
-                            # We need to retry this operation later.
-                            db.add_pending_ucast_mac_remote(
-                                context, 'update',
-                                ovsdb_identifier,
-                                logical_switch_uuid,
-                                physical_locator,
-                                [mac_remote])
+                        vifs_to_update.setdefault(ovsdb_identifier, []).append(
+                            {'locator_dict': physical_locator,
+                             'mac_dict': mac_remote})
+                        LOG.debug("VM migrated from %s to %s. Update"
+                                  "locator in Ucast_Macs_Remote",
+                                  ucast_mac_remote['physical_locator_id'],
+                                  physical_locator['uuid'])
                     else:
                         LOG.debug("add_port_mac: MAC %s exists "
                                   "in Gateway", mac_dict['mac'])
-                        ovsdb_data_handler = (
-                            self.ovsdb_callback.get_ovsdbdata_object(
-                                ovsdb_identifier))
-                        ovsdb_data_handler._handle_l2pop(
-                            context, [ucast_mac_remote])
+                        existing_macs.setdefault(ovsdb_identifier, []).append(
+                            ucast_mac_remote)
                     continue
                 # else it is a new port created
-                try:
-                    self.agent_rpc.add_vif_to_gateway(
-                        context, ovsdb_identifier, logical_switch,
-                        physical_locator, mac_remote)
-                except messaging.MessagingTimeout:
-                    # If RPC is timed out, then the RabbitMQ
-                    # will retry the operation.
-                    LOG.exception(_LE("Communication error with "
-                                      "the L2 gateway agent"))
-                except Exception:
-                    # The remote OVSDB server may be down.
-                    # We need to retry this operation later.
-                    LOG.debug("The remote OVSDB server may be down")
-                    db.add_pending_ucast_mac_remote(
-                        context, 'insert', ovsdb_identifier,
+                ls_vifs = vifs_to_add.setdefault(
+                    ovsdb_identifier, collections.OrderedDict()).setdefault(
                         logical_switch_uuid,
-                        physical_locator,
-                        [mac_remote])
+                        {'logical_switch_dict': logical_switch, 'vifs': []})
+                ls_vifs['vifs'].append({'locator_dict': physical_locator,
+                                        'mac_dict': mac_remote})
+        for ovsdb_identifier, ucast_mac_remotes in existing_macs.items():
+            ovsdb_data_handler = self.ovsdb_callback.get_ovsdbdata_object(
+                ovsdb_identifier)
+            ovsdb_data_handler._handle_l2pop(context, ucast_mac_remotes)
+        for ovsdb_identifier, ls_vifs in vifs_to_update.items():
+            self._update_vifs_to_gateway(context, ovsdb_identifier,
+                                         ls_vifs)
+        for ovsdb_identifier, ls_vifs in vifs_to_add.items():
+            self._add_vifs_to_gateway(context, ovsdb_identifier,
+                                      list(ls_vifs.values()))
+
+    def _add_vifs_to_gateway(self, context, ovsdb_identifier,
+                             logical_switch_vifs):
+        vifs = [(ls_vifs['logical_switch_dict'], vif)
+                for ls_vifs in logical_switch_vifs
+                for vif in ls_vifs['vifs']]
+        if cfg.CONF.async_mac_programming:
+            self._cast_vif_operation(
+                context, 'insert', ovsdb_identifier,
+                [(logical_switch.get('uuid'), vif['locator_dict'],
+                  vif['mac_dict']) for logical_switch, vif in vifs],
+                self.agent_rpc.add_vifs_to_gateway, logical_switch_vifs)
+            return
+        try:
+            errors = self.agent_rpc.add_vifs_to_gateway(
+                context, ovsdb_identifier, logical_switch_vifs)
+        except messaging.MessagingTimeout:
+            # If RPC is timed out, then the RabbitMQ
+            # will retry the operation.
+            LOG.exception(_LE("Communication error with "
+                              "the L2 gateway agent"))
+            return
+        except Exception:
+            # The remote OVSDB server may be down.
+            # We need to retry this operation later.
+            LOG.debug("The remote OVSDB server may be down")
+            errors = [True] * len(vifs)
+        for (logical_switch, vif), error in zip(vifs, errors or []):
+            if error:
+                LOG.debug("Could not add MAC %(mac)s to the OVSDB server "
+                          "%(ovsdb)s: %(error)s",
+                          {'mac': vif['mac_dict']['mac'],
+                           'ovsdb': ovsdb_identifier, 'error': error})
+                db.add_pending_ucast_mac_remote(
+                    context, 'insert', ovsdb_identifier,
+                    logical_switch.get('uuid'),
+                    vif['locator_dict'],
+                    [vif['mac_dict']])
+
+    def _update_vifs_to_gateway(self, context, ovsdb_identifier, vifs):
+        if cfg.CONF.async_mac_programming:
+            self._cast_vif_operation(
+                context, 'update', ovsdb_identifier,
+                [(vif['mac_dict']['logical_switch_uuid'],
+                  vif['locator_dict'], vif['mac_dict']) for vif in vifs],
+                self.agent_rpc.update_vifs_to_gateway, vifs)
+            return
+        try:
+            errors = self.agent_rpc.update_vifs_to_gateway(
+                context, ovsdb_identifier, vifs)
+        except messaging.MessagingTimeout:
+            # If RPC is timed out, then the RabbitMQ
+            # will retry the operation.
+            LOG.exception(_LE("Communication error with "
+                              "the L2 gateway agent"))
+            return
+        except Exception:
+            # The remote OVSDB server may be down.
+            # We need to retry this operation later.
+            LOG.debug("The remote OVSDB server may be down")
+            errors = [True] * len(vifs)
+        for vif, error in zip(vifs, errors or []):
+            if error:
+                db.add_pending_ucast_mac_remote(
+                    context, 'update', ovsdb_identifier,
+                    vif['mac_dict']['logical_switch_uuid'],
+                    vif['locator_dict'],
+                    [vif['mac_dict']])
+
+    def _cast_vif_operation(self, context, operation, ovsdb_identifier,
+                            entries, rpc_method, *args):
+        # The changes are kept in the outbox until the agent acknowledges
+        # them, so that the port update does not wait for the OVSDB server
+        # and the changes that fail are retried later.
+        op_id = uuidutils.generate_uuid()
+        db.add_outbox_ucast_mac_remotes(context, op_id, operation,
+                                        ovsdb_identifier, entries)
+        if not self.agent_rpc.can_cast_vif_operations():
+            # The agents not upgraded yet are called instead.
+            try:
+                errors = rpc_method(context, ovsdb_identifier, *args)
+            except Exception:
+                LOG.exception(_LE("Could not send the remote MAC changes "
+                                  "to the L2 gateway agent"))
+                errors = None
+            else:
+                errors = errors or [None] * len(entries)
+            db.complete_outbox_ucast_mac_remotes(context, op_id, errors)
+            return
+        try:
+            rpc_method(context, ovsdb_identifier, *args, op_id=op_id)
+        except Exception:
+            LOG.exception(_LE("Could not send the remote MAC changes to "
+                              "the L2 gateway agent"))
+            db.complete_outbox_ucast_mac_remotes(context, op_id)
 
     def _form_physical_locator_schema(self, context, pl_dict):
         locator_uuid = None
@@ -198,7 +305,6 @@ class L2gwRpcDriver(service_drivers.L2gwDriver):
         sends it as a list of port dicts.
         """
         ls_dict = {}
-        mac_list = []
         logical_switches = []
         ovsdb_identifier = None
         if isinstance(port, list):
@@ -214,14 +320,12 @@ class L2gwRpcDriver(service_drivers.L2gwDriver):
         else:
             from_l2gw_plugin = False
             network_id = port.get('network_id')
-            logical_switches = (
-                db.get_all_logical_switches_by_name(
-                    context, network_id))
-            l2gateway_connections = (
-                self.service_plugin.get_l2_gateway_connections(
-                    context, filters={'network_id': [network_id]}))
-            if not l2gateway_connections:
+            cache = connected_networks.get_cache()
+            if not cache.is_connected(context, self.service_plugin,
+                                      network_id):
                 return
+            logical_switches = cache.get_logical_switches(
+                context, self.service_plugin, network_id)
             port_list = [port]
         for port_dict in port_list:
             if port_dict['device_owner']:
@@ -269,14 +373,24 @@ class L2gwRpcDriver(service_drivers.L2gwDriver):
                                 logical_switch_uuid,
                                 mac)
                         if not del_count:
-                            mac_list = ls_dict.get(logical_switch_uuid, [])
-                            mac_list.append(mac)
-                            ls_dict[logical_switch_uuid] = mac_list
+                            # The MACs are kept with the OVSDB server of
+                            # their logical switch.
+                            ls_dict.setdefault(
+                                logical_switch_uuid,
+                                (ovsdb_identifier, []))[1].append(mac)
                 else:
                     LOG.debug("delete_port_mac:Logical Switch %s "
                               "does not exist ", port_dict.get('network_id'))
                     return
-        for logical_switch_uuid, mac_list in ls_dict.items():
+        for logical_switch_uuid, (ovsdb_identifier,
+                                  mac_list) in ls_dict.items():
+            if mac_list and cfg.CONF.async_mac_programming:
+                self._cast_vif_operation(
+                    context, 'delete', ovsdb_identifier,
+                    [(logical_switch_uuid, None, mac) for mac in mac_list],
+                    self.agent_rpc.delete_vif_from_gateway,
+                    logical_switch_uuid, mac_list)
+                continue
             try:
                 if mac_list:
                     self.agent_rpc.delete_vif_from_gateway(context,
@@ -469,10 +583,9 @@ class L2gwRpcDriver(service_drivers.L2gwDriver):
 
     def _get_ip_details(self, context, port):
         host = port[portbindings.HOST_ID]
-        agent = self._get_agent_details(context, host)
-        if agent:
-            conf_dict = agent[0].get("configurations")
-            dst_ip = conf_dict.get("tunneling_ip")
+        dst_ip = agent_tunnel_ips.get_cache().get_tunneling_ip(
+            context, self.service_plugin._core_plugin, host)
+        if dst_ip:
             fixed_ip_list = port.get('fixed_ips')
             fixed_ip_list = fixed_ip_list[0]
             return dst_ip, fixed_ip_list.get('ip_address')
@@ -489,13 +602,6 @@ class L2gwRpcDriver(service_drivers.L2gwDriver):
             context, filters={'network_id': [network_id]})
         return ports
 
-    def _get_agent_details(self, context, host):
-        agent = self.service_plugin._core_plugin.get_agents(
-            context,
-            filters={'agent_type': [n_const.AGENT_TYPE_OVS],
-                     'host': [host]})
-        return agent
-
     def _get_logical_switch_dict(self, context, logical_switch, gw_connection):
         if logical_switch:
             uuid = logical_switch.get('uuid')
@@ -538,30 +644,53 @@ class L2gwRpcDriver(service_drivers.L2gwDriver):
             pl_dict['macs'] = []
         return pl_dict
 
-    def _get_locator_list(self, context, dst_ip, ovsdb_identifier,
-                          mac_list, locator_list):
-        locator_uuid = None
-        locator_dict = self._get_physical_locator_dict(
-            dst_ip, None, None, ovsdb_identifier)
-        locator = db.get_physical_locator_by_dst_ip(
-            context, locator_dict)
-        if locator:
-            locator_uuid = locator.get('uuid')
-        for locator in locator_list:
-            if(locator.get('dst_ip') == dst_ip):
-                (locator.get('macs')).extend(mac_list)
-                return locator_list
-        pl_dict = self._get_physical_locator_dict(
-            dst_ip, locator_uuid, mac_list)
-        locator_list.append(pl_dict)
-        return locator_list
+    def _get_connection_locator_list(self, context, ovsdb_identifier,
+                                     logical_switch, ports):
+        """Return the locators of the ports to add to a new connection.
+
+        Each locator holds the MACs of its ports missing from the logical
+        switch. The existing MACs and locators are loaded at once, so that
+        the number of queries does not depend on the number of ports.
+        """
+        existing_macs = set()
+        if logical_switch:
+            existing_macs = set(
+                ucast_mac_remote.get('mac') for ucast_mac_remote in
+                db.get_all_ucast_mac_remote_by_ls(
+                    context,
+                    {'ovsdb_identifier': ovsdb_identifier,
+                     'logical_switch_id': logical_switch.get('uuid')}))
+        locator_uuids = dict(
+            (locator.get('dst_ip'), locator.get('uuid')) for locator in
+            db.get_all_physical_locators_by_ovsdb_id(context,
+                                                     ovsdb_identifier))
+        ports = [port for port in ports if port['device_owner']]
+        macs_to_add = set(port.get('mac_address')
+                          for port in ports) - existing_macs
+        # The tunneling IPs of all the OVS agents are read at once.
+        agent_tunnel_ips.get_cache().get_agent_ips(
+            context, self.service_plugin._core_plugin)
+        locators = collections.OrderedDict()
+        for port in ports:
+            dst_ip, ip_address = self._get_ip_details(context, port)
+            if dst_ip not in locators:
+                locators[dst_ip] = self._get_physical_locator_dict(
+                    dst_ip, locator_uuids.get(dst_ip))
+            if port.get('mac_address') in macs_to_add:
+                locators[dst_ip]['macs'].append(self._get_dict(
+                    ovsdb_schema.UcastMacsRemote(
+                        uuid=None,
+                        mac=port.get('mac_address'),
+                        logical_switch_id=None,
+                        physical_locator_id=None,
+                        ip_address=ip_address)))
+        return list(locators.values())
 
     def create_l2_gateway_connection(self, context, l2_gateway_connection):
         """Process the call from the CLI and trigger the RPC,
 
         to update the connection to the gateway.
         """
-        u_mac_dict = {}
         ls_dict = {}
         mac_dict = {}
         is_mac = False
@@ -584,33 +713,8 @@ class L2gwRpcDriver(service_drivers.L2gwDriver):
                                            gw_connection.get('network_id'))
             if not is_mac:
                 is_mac = True
-                for port in ports:
-                    mac_list = []
-                    if port['device_owner']:
-                        dst_ip, ip_address = self._get_ip_details(context,
-                                                                  port)
-                        mac_remote = self._get_dict(
-                            ovsdb_schema.UcastMacsRemote(
-                                uuid=None,
-                                mac=port.get('mac_address'),
-                                logical_switch_id=None,
-                                physical_locator_id=None,
-                                ip_address=ip_address))
-                        if logical_switch:
-                            u_mac_dict['mac'] = port.get('mac_address')
-                            u_mac_dict['ovsdb_identifier'] = ovsdb_identifier
-                            u_mac_dict['logical_switch_uuid'] = (
-                                logical_switch.get('uuid'))
-                            ucast_mac_remote = (
-                                db.get_ucast_mac_remote_by_mac_and_ls(
-                                    context, u_mac_dict))
-                            if not ucast_mac_remote:
-                                mac_list.append(mac_remote)
-                        else:
-                            mac_list.append(mac_remote)
-                        locator_list = self._get_locator_list(
-                            context, dst_ip, ovsdb_identifier, mac_list,
-                            locator_list)
+                locator_list = self._get_connection_locator_list(
+                    context, ovsdb_identifier, logical_switch, ports)
             for locator in locator_list:
                 mac_dict[locator.get('dst_ip')] = locator.pop('macs')
                 locator.pop('ovsdb_identifier')
@@ -13,6 +13,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
+
+import mock
 from oslo_db import exception as d_exc
 from oslo_utils import timeutils
 from oslo_utils import uuidutils
@@ -382,6 +385,49 @@ class OvsdbLibTestCase(testlib_api.SqlTestCase):
         count = self.ctx.session.query(models.VlanBindings).count()
         self.assertEqual(count, 0)
 
+    def test_bulk_add_vlan_bindings(self):
+        existing_dict = self._get_vlan_binding_dict()
+        self._create_vlan_binding(existing_dict)
+        other_vlan_dict = dict(existing_dict, vlan=300)
+        new_dict = self._get_vlan_binding_dict()
+        added = lib.bulk_add_vlan_bindings(
+            self.ctx, [existing_dict, other_vlan_dict, new_dict, new_dict])
+        self.assertEqual(2, len(added))
+        count = self.ctx.session.query(models.VlanBindings).count()
+        self.assertEqual(3, count)
+
+    def test_bulk_add_ucast_macs_remotes(self):
+        existing_dict = self._get_ucast_mac_remote_dict()
+        self._create_ucast_mac_remote(existing_dict)
+        other_ovsdb_dict = dict(existing_dict, ovsdb_identifier='host2')
+        new_dict = self._get_ucast_mac_remote_dict()
+        added = lib.bulk_add_ucast_macs_remotes(
+            self.ctx, [existing_dict, other_ovsdb_dict, new_dict])
+        self.assertEqual([other_ovsdb_dict['uuid'], new_dict['uuid']],
+                         [row['uuid'] for row in added])
+        count = self.ctx.session.query(models.UcastMacsRemotes).count()
+        self.assertEqual(3, count)
+
+    def test_bulk_add_without_records(self):
+        self.assertEqual([], lib.bulk_add_logical_switches(self.ctx, []))
+
+    def test_bulk_delete_ucast_macs_remotes(self):
+        uuids = []
+        for ovsdb_identifier in ('host1', 'host1', 'host2'):
+            record_dict = self._get_ucast_mac_remote_dict()
+            record_dict['ovsdb_identifier'] = ovsdb_identifier
+            self._create_ucast_mac_remote(record_dict)
+            uuids.append(record_dict['uuid'])
+        deleted = lib.bulk_delete_ucast_macs_remotes(self.ctx, 'host1',
+                                                     uuids + [None])
+        self.assertEqual(2, deleted)
+        remaining = self.ctx.session.query(models.UcastMacsRemotes).all()
+        self.assertEqual([uuids[2]], [mac.uuid for mac in remaining])
+
+    def test_bulk_delete_without_uuids(self):
+        self.assertEqual(0, lib.bulk_delete_logical_switches(
+            self.ctx, 'host1', []))
+
     def test_get_logical_switch_by_name(self):
         record_dict = self._get_logical_switch_dict()
         with self.ctx.session.begin(subtransactions=True):
@@ -409,6 +455,18 @@ class OvsdbLibTestCase(testlib_api.SqlTestCase):
         result = lib.get_physical_locator_by_dst_ip(self.ctx, record_dict)
         self.assertEqual(entry, result)
 
+    def test_get_all_physical_locators_by_ovsdb_id(self):
+        record_dict = self._get_physical_locator_dict()
+        entry1 = self._create_physical_locator(record_dict, '20.0.0.1')
+        record_dict = self._get_physical_locator_dict()
+        entry2 = self._create_physical_locator(record_dict, '20.0.0.2')
+        record_dict = self._get_physical_locator_dict()
+        record_dict['ovsdb_identifier'] = 'host2'
+        self._create_physical_locator(record_dict)
+        result = lib.get_all_physical_locators_by_ovsdb_id(self.ctx, 'host1')
+        self.assertEqual(set([entry1.uuid, entry2.uuid]),
+                         set(locator.uuid for locator in result))
+
     def test_get_physical_switch_by_name(self):
         record_dict = self._get_physical_switch_dict()
         with self.ctx.session.begin(subtransactions=True):
@@ -521,6 +579,92 @@ class OvsdbLibTestCase(testlib_api.SqlTestCase):
         self.assertEqual(result[0], entry1)
         self.assertEqual(result[1], entry2)
 
+    def test_iter_pending_remote_macs_in_asc_order(self):
+        timestamp = timeutils.utcnow()
+        entries = []
+        with self.ctx.session.begin(subtransactions=True):
+            for i in range(5):
+                # Three of the pending macs share the same timestamp
+                entries.append(self._create_pending_mac(
+                    self._get_pending_mac_dict(
+                        timestamp + datetime.timedelta(seconds=i // 3))))
+        expected = sorted(entries, key=lambda entry: (entry.timestamp,
+                                                      entry.id))
+        with mock.patch.object(
+                lib, 'get_pending_remote_macs_in_asc_order',
+                side_effect=lib.get_pending_remote_macs_in_asc_order) as page:
+            result = list(lib.iter_pending_remote_macs_in_asc_order(
+                self.ctx, 'ovsdb1', page_size=2))
+        self.assertEqual(expected, result)
+        self.assertEqual(3, page.call_count)
+
+    def _add_pending_macs(self, operations):
+        locator = {'uuid': _uuid(), 'dst_ip': '1.1.1.1'}
+        for operation in operations:
+            if operation == 'delete':
+                mac = 'aa:aa:aa:aa:aa:aa'
+            else:
+                mac = {'mac': 'aa:aa:aa:aa:aa:aa', 'ip_address': '2.2.2.2'}
+            lib.add_pending_ucast_mac_remote(
+                self.ctx, operation, 'ovsdb1', 'fake_ls_id',
+                locator if operation != 'delete' else None, [mac])
+        return [pending_mac.operation for pending_mac in
+                lib.get_all_pending_remote_macs_in_asc_order(self.ctx,
+                                                             'ovsdb1')]
+
+    def test_add_pending_ucast_mac_remote_coalesces_changes(self):
+        self.assertEqual([], self._add_pending_macs(
+            ['insert', 'update', 'delete']))
+        self.assertEqual(['insert'], self._add_pending_macs(
+            ['insert', 'update']))
+
+    def test_add_pending_ucast_mac_remote_keeps_net_change(self):
+        self.assertEqual(['delete'], self._add_pending_macs(
+            ['update', 'update', 'delete']))
+
+    def test_add_pending_ucast_mac_remote_deleted_and_added_back(self):
+        self.assertEqual(['delete', 'insert'], self._add_pending_macs(
+            ['delete', 'insert', 'update']))
+
+    def test_add_pending_ucast_mac_remote_updated_keeps_uuid(self):
+        mac_uuid = _uuid()
+        locator = {'uuid': _uuid(), 'dst_ip': '1.1.1.1'}
+        mac = {'mac': 'aa:aa:aa:aa:aa:aa', 'ip_address': '2.2.2.2'}
+        lib.add_pending_ucast_mac_remote(
+            self.ctx, 'update', 'ovsdb1', 'fake_ls_id', locator,
+            [dict(mac, uuid=mac_uuid)])
+        lib.add_pending_ucast_mac_remote(
+            self.ctx, 'delete', 'ovsdb1', 'fake_ls_id', None,
+            [mac['mac']])
+        lib.add_pending_ucast_mac_remote(
+            self.ctx, 'insert', 'ovsdb1', 'fake_ls_id', locator, [mac])
+        pending = lib.get_all_pending_remote_macs_in_asc_order(self.ctx,
+                                                              'ovsdb1')
+        self.assertEqual([('update', mac_uuid)],
+                         [(pending_mac.operation, pending_mac.uuid)
+                          for pending_mac in pending])
+
+    def test_coalesce_pending_ucast_mac_remotes(self):
+        timestamp = timeutils.utcnow()
+        for i, operation in enumerate(['insert', 'update', 'update']):
+            record_dict = self._get_pending_mac_dict(
+                timestamp + datetime.timedelta(seconds=i))
+            record_dict['operation'] = operation
+            self._create_pending_mac(record_dict)
+        other_mac_dict = self._get_pending_mac_dict(timestamp)
+        other_mac_dict['mac'] = 'bb:bb:bb:bb:bb:bb'
+        self._create_pending_mac(other_mac_dict)
+        self.assertEqual(2, lib.coalesce_pending_ucast_mac_remotes(
+            self.ctx, 'ovsdb1'))
+        pending = lib.get_all_pending_remote_macs_in_asc_order(self.ctx,
+                                                              'ovsdb1')
+        self.assertEqual(
+            [('bb:bb:bb:bb:bb:bb', 'insert'), ('aa:aa:aa:aa:aa:aa', 'insert')],
+            [(pending_mac.mac, pending_mac.operation)
+             for pending_mac in pending])
+        self.assertEqual(timestamp + datetime.timedelta(seconds=2),
+                         pending[1].timestamp)
+
     def test_delete_pending_ucast_mac_remote(self):
         timestamp = timeutils.utcnow()
         record_dict = self._get_pending_mac_dict(timestamp)
@@ -533,6 +677,23 @@ class OvsdbLibTestCase(testlib_api.SqlTestCase):
         count = self.ctx.session.query(models.UcastMacsRemotes).count()
         self.assertEqual(count, 0)
 
+    def test_delete_pending_ucast_mac_remotes(self):
+        timestamp = timeutils.utcnow()
+        pending_ids = []
+        for mac in ['aa:aa:aa:aa:aa:aa', 'bb:bb:bb:bb:bb:bb',
+                    'cc:cc:cc:cc:cc:cc']:
+            record_dict = self._get_pending_mac_dict(timestamp)
+            record_dict['mac'] = mac
+            pending_ids.append(self._create_pending_mac(record_dict).id)
+        count = lib.delete_pending_ucast_mac_remotes(self.ctx,
+                                                     pending_ids[:2])
+        self.assertEqual(2, count)
+        remaining = self.ctx.session.query(
+            models.PendingUcastMacsRemote).all()
+        self.assertEqual([pending_ids[2]], [rec.id for rec in remaining])
+        self.assertEqual(0, lib.delete_pending_ucast_mac_remotes(self.ctx,
+                                                                 []))
+
     def test_get_all_ucast_mac_remote_by_ls(self):
         record_dict = self._get_ucast_mac_remote_dict()
         record_dict1 = self._create_ucast_mac_remote(record_dict)
@@ -543,3 +704,56 @@ class OvsdbLibTestCase(testlib_api.SqlTestCase):
         self._create_ucast_mac_remote(record_dict)
         mac_list = lib.get_all_ucast_mac_remote_by_ls(self.ctx, record_dict)
         self.assertEqual(2, len(mac_list))
+
+    def _add_outbox_macs(self, op_id, ovsdb_identifier='ovsdb1'):
+        locator = {'uuid': _uuid(), 'dst_ip': '1.1.1.1'}
+        macs = [{'uuid': None, 'mac': 'aa:aa:aa:aa:aa:aa',
+                 'ip_address': '2.2.2.2'},
+                {'uuid': None, 'mac': 'bb:bb:bb:bb:bb:bb',
+                 'ip_address': '2.2.2.3'}]
+        lib.add_outbox_ucast_mac_remotes(
+            self.ctx, op_id, 'insert', ovsdb_identifier,
+            [('fake_ls_id', locator, mac) for mac in macs])
+
+    def test_add_outbox_ucast_mac_remotes(self):
+        self._add_outbox_macs('op1')
+        lib.add_outbox_ucast_mac_remotes(
+            self.ctx, 'op2', 'delete', 'ovsdb1',
+            [('fake_ls_id', None, 'cc:cc:cc:cc:cc:cc')])
+        count = self.ctx.session.query(models.UcastMacsRemoteOutbox).count()
+        self.assertEqual(3, count)
+
+    def test_complete_outbox_ucast_mac_remotes(self):
+        self._add_outbox_macs('op1')
+        failed = lib.complete_outbox_ucast_mac_remotes(
+            self.ctx, 'op1', [None, 'fake_error'])
+        self.assertEqual(1, failed)
+        count = self.ctx.session.query(models.UcastMacsRemoteOutbox).count()
+        self.assertEqual(0, count)
+        pending = lib.get_all_pending_remote_macs_in_asc_order(self.ctx,
+                                                              'ovsdb1')
+        self.assertEqual(['bb:bb:bb:bb:bb:bb'],
+                         [pending_mac.mac for pending_mac in pending])
+        self.assertEqual('insert', pending[0].operation)
+        self.assertEqual('1.1.1.1', pending[0].dst_ip)
+
+    def test_complete_outbox_ucast_mac_remotes_without_errors(self):
+        self._add_outbox_macs('op1')
+        failed = lib.complete_outbox_ucast_mac_remotes(self.ctx, 'op1')
+        self.assertEqual(2, failed)
+        count = self.ctx.session.query(
+            models.PendingUcastMacsRemote).count()
+        self.assertEqual(2, count)
+
+    def test_requeue_stale_outbox_ucast_mac_remotes(self):
+        self._add_outbox_macs('op1')
+        self._add_outbox_macs('op2', 'ovsdb2')
+        self.assertEqual(0, lib.requeue_stale_outbox_ucast_mac_remotes(
+            self.ctx, 'ovsdb1', 300))
+        self.assertEqual(2, lib.requeue_stale_outbox_ucast_mac_remotes(
+            self.ctx, 'ovsdb1', -1))
+        count = self.ctx.session.query(models.UcastMacsRemoteOutbox).count()
+        self.assertEqual(2, count)
+        count = self.ctx.session.query(
+            models.PendingUcastMacsRemote).count()
+        self.assertEqual(2, count)
@@ -337,6 +337,49 @@ class L2GWTestCase(testlib_api.SqlTestCase):
             self.assertTrue(service_plugins[constants.L2GW].
                             delete_port_mac.called)
 
+    def _get_port(self, **kwargs):
+        port = {'id': 'fake_port_id',
+                'network_id': 'fake_network_id',
+                'device_owner': 'compute:nova',
+                'mac_address': 'fa:16:3e:00:00:01',
+                'fixed_ips': [{'ip_address': '10.0.0.3'}],
+                'binding:host_id': 'fake_host'}
+        port.update(kwargs)
+        return port
+
+    def _port_callback(self, event, **kwargs):
+        service_plugins = {constants.L2GW: mock.Mock()}
+        with mock.patch.object(manager.NeutronManager,
+                               'get_service_plugins',
+                               return_value=service_plugins):
+            l2gateway_db.l2gw_callback(resources.PORT, event, mock.Mock(),
+                                       context=mock.Mock(), **kwargs)
+        return service_plugins[constants.L2GW]
+
+    def test_l2gw_callback_update_port_binding(self):
+        l2gwservice = self._port_callback(
+            events.AFTER_UPDATE, port=self._get_port(),
+            original_port=self._get_port(**{'binding:host_id': ''}))
+        self.assertTrue(l2gwservice.add_port_mac.called)
+
+    def test_l2gw_callback_ignores_unchanged_port(self):
+        l2gwservice = self._port_callback(
+            events.AFTER_UPDATE, port=self._get_port(name='new_name'),
+            original_port=self._get_port())
+        self.assertFalse(l2gwservice.add_port_mac.called)
+
+    def test_l2gw_callback_ignores_unbound_port(self):
+        l2gwservice = self._port_callback(
+            events.AFTER_UPDATE,
+            port=self._get_port(**{'binding:host_id': ''}),
+            original_port=self._get_port())
+        self.assertFalse(l2gwservice.add_port_mac.called)
+
+    def test_l2gw_callback_ignores_port_without_owner(self):
+        l2gwservice = self._port_callback(
+            events.AFTER_DELETE, port=self._get_port(device_owner=''))
+        self.assertFalse(l2gwservice.delete_port_mac.called)
+
     def test_l2_gateway_create_output_aligned_with_input(self):
         """Test l2 gateway create output that is aligned with input dict."""
         name = "l2gw_1"
@@ -95,7 +95,8 @@ class TestBaseConnection(base.BaseTestCase):
         self.fake_message = {'id': self.op_id,
                              'fake_key': 'fake_value'}
 
-        self.l2gw_ovsdb.responses = [self.fake_message]
+        self.l2gw_ovsdb._register_request(self.op_id)
+        self.l2gw_ovsdb._complete_request(self.fake_message)
 
     def test_init(self):
         """Test case to test __init__."""
@@ -152,6 +153,47 @@ class TestBaseConnection(base.BaseTestCase):
         self.assertIsNotNone(response)
         self.assertEqual(response, self.fake_message)
 
+    def test_response_with_unknown_id(self):
+        """Test case to test _response for an unknown request."""
+        self.assertIsNone(self.l2gw_ovsdb._response('unknown'))
+
+    def test_response_with_timeout(self):
+        """Test case to test _response when the server does not respond."""
+        cfg.CONF.set_override('response_timeout', 0, 'ovsdb')
+        self.l2gw_ovsdb._register_request('pending_id')
+        self.assertIsNone(self.l2gw_ovsdb._response('pending_id'))
+        self.assertNotIn('pending_id', self.l2gw_ovsdb.pending_requests)
+
+    def test_complete_request(self):
+        """Test case to test _complete_request."""
+        self.l2gw_ovsdb._register_request('new_id')
+        message = {'id': 'new_id', 'result': 'fake_result'}
+        self.assertTrue(self.l2gw_ovsdb._complete_request(message))
+        self.assertFalse(self.l2gw_ovsdb._complete_request(message))
+        self.assertFalse(self.l2gw_ovsdb._complete_request(
+            {'id': 'unknown', 'result': None}))
+        self.assertEqual(message, self.l2gw_ovsdb._response('new_id'))
+        self.assertEqual({}, self.l2gw_ovsdb.pending_requests)
+
+    def test_send_registers_request(self):
+        """Test case to test send registers requests only."""
+        with mock.patch.object(self.l2gw_ovsdb.socket, 'send',
+                               return_value=1):
+            self.l2gw_ovsdb.send({'id': 'req_id', 'method': 'transact',
+                                  'params': []})
+            self.l2gw_ovsdb.send({'id': 'echo_id', 'result': [],
+                                  'error': None})
+        self.assertIn('req_id', self.l2gw_ovsdb.pending_requests)
+        self.assertNotIn('echo_id', self.l2gw_ovsdb.pending_requests)
+
+    def test_send_without_rcv_required(self):
+        """Test case to test send does not keep unawaited requests."""
+        with mock.patch.object(self.l2gw_ovsdb.socket, 'send',
+                               return_value=1):
+            self.l2gw_ovsdb.send({'id': 'req_id', 'method': 'transact',
+                                  'params': []}, rcv_required=False)
+        self.assertNotIn('req_id', self.l2gw_ovsdb.pending_requests)
+
     def test_send(self):
         """Test case to test send."""
         with mock.patch.object(self.l2gw_ovsdb.socket, 'send',
@@ -37,6 +37,7 @@ from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_monitor
 from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_writer
 from networking_l2gw.services.l2gateway.common import config
 from networking_l2gw.services.l2gateway.common import constants as n_const
+from networking_l2gw.services.l2gateway import exceptions
 
 
 class TestManager(base.BaseTestCase):
@@ -131,7 +132,8 @@ class TestManager(base.BaseTestCase):
             self.assertTrue(event_spawn.called)
             self.assertTrue(ovsdb_connection.called)
             ovsdb_connection.assert_called_with(
-                self.conf.ovsdb, gateway, call_back)
+                self.conf.ovsdb, gateway, call_back,
+                self.l2gw_agent_manager.replicas[ovsdb_ident])
             notify.assert_called_once_with(mock.ANY, mock.ANY)
 
     def test_connect_to_ovsdb_server_with_exc(self):
@@ -206,6 +208,116 @@ class TestManager(base.BaseTestCase):
                     self.assertEqual(0, logger_call.call_count)
                     self.assertTrue(ovsdb_connection.called)
 
+    def test_open_connection_reuses_connection(self):
+        self.l2gw_agent_manager.gateways = {}
+        gateway = l2gateway_config.L2GatewayConfig(self.fake_config_json)
+        self.l2gw_agent_manager.gateways['fake_ovsdb_identifier'] = gateway
+        with mock.patch.object(ovsdb_writer,
+                               'OVSDBWriter') as ovsdb_connection:
+            for i in range(2):
+                with self.l2gw_agent_manager._open_connection(
+                        'fake_ovsdb_identifier') as ovsdb_fd:
+                    self.assertEqual(ovsdb_connection.return_value,
+                                     ovsdb_fd)
+            self.assertEqual(1, ovsdb_connection.call_count)
+            self.assertFalse(ovsdb_fd.disconnect.called)
+
+    def test_disconnect_all_ovsdb_servers_closes_writer_pools(self):
+        fake_pool = mock.Mock()
+        self.l2gw_agent_manager.gateways = {}
+        self.l2gw_agent_manager.writer_pools = {'fake_ovsdb_id': fake_pool}
+        self.l2gw_agent_manager._disconnect_all_ovsdb_servers()
+        self.assertTrue(fake_pool.close.called)
+        self.assertEqual({}, self.l2gw_agent_manager.writer_pools)
+
+    def test_keepalive_writer_connections(self):
+        fake_pool = mock.Mock()
+        self.l2gw_agent_manager.writer_pools = {'fake_ovsdb_id': fake_pool}
+        self.l2gw_agent_manager._keepalive_writer_connections()
+        self.assertTrue(fake_pool.keepalive.called)
+
+    def test_add_vif_to_gateway_is_batched(self):
+        cfg.CONF.set_override('mac_batch_window', 0.05, 'ovsdb')
+        self.l2gw_agent_manager.gateways = {'fake_ovsdb_id': mock.Mock()}
+        with mock.patch.object(manager.OVSDBManager,
+                               '_commit_mac_requests',
+                               return_value=[None]) as commit:
+            self.l2gw_agent_manager.add_vif_to_gateway(
+                self.context, 'fake_ovsdb_id', mock.sentinel.ls,
+                mock.sentinel.locator, mock.sentinel.mac)
+            commit.assert_called_once_with(
+                'fake_ovsdb_id',
+                [('insert', (mock.sentinel.ls, mock.sentinel.locator,
+                             mock.sentinel.mac))])
+            self.assertIn('fake_ovsdb_id',
+                          self.l2gw_agent_manager.mac_batchers)
+
+    def test_transact_mac_request_without_batching(self):
+        cfg.CONF.set_override('mac_batch_window', 0, 'ovsdb')
+        with mock.patch.object(manager.OVSDBManager,
+                               '_commit_mac_requests',
+                               return_value=[exceptions.OVSDBError(
+                                   message='fake_error')]) as commit:
+            self.assertRaises(exceptions.OVSDBError,
+                              self.l2gw_agent_manager._transact_mac_request,
+                              'fake_ovsdb_id',
+                              ('delete', ('fake_ls_uuid', ['fake_mac'])))
+            commit.assert_called_once_with(
+                'fake_ovsdb_id', [('delete', ('fake_ls_uuid', ['fake_mac']))])
+            self.assertEqual({}, self.l2gw_agent_manager.mac_batchers)
+
+    def test_add_vifs_to_gateway(self):
+        self.l2gw_agent_manager.gateways = {'fake_ovsdb_id': mock.Mock()}
+        ls_vifs = [{'logical_switch_dict': 'ls1',
+                    'vifs': [{'locator_dict': 'loc1', 'mac_dict': 'mac1'},
+                             {'locator_dict': 'loc1', 'mac_dict': 'mac2'}]},
+                   {'logical_switch_dict': 'ls2',
+                    'vifs': [{'locator_dict': 'loc1', 'mac_dict': 'mac3'}]}]
+        with mock.patch.object(manager.OVSDBManager,
+                               '_commit_mac_requests',
+                               return_value=[None, exceptions.OVSDBError(
+                                   message='fake_error'), None]) as commit:
+            errors = self.l2gw_agent_manager.add_vifs_to_gateway(
+                self.context, 'fake_ovsdb_id', ls_vifs)
+            commit.assert_called_once_with(
+                'fake_ovsdb_id',
+                [('insert', ('ls1', 'loc1', 'mac1')),
+                 ('insert', ('ls1', 'loc1', 'mac2')),
+                 ('insert', ('ls2', 'loc1', 'mac3'))])
+            self.assertEqual([None, 'fake_error', None], errors)
+
+    def test_delete_vif_from_gateway_with_op_id(self):
+        self.l2gw_agent_manager.gateways = {'fake_ovsdb_id': mock.Mock()}
+        with mock.patch.object(manager.OVSDBManager,
+                               '_commit_mac_requests',
+                               side_effect=exceptions.OVSDBError(
+                                   message='fake_error')) as commit:
+            self.l2gw_agent_manager.delete_vif_from_gateway(
+                self.context, 'fake_ovsdb_id', 'fake_ls_uuid',
+                ['mac1', 'mac2'], op_id='fake_op_id')
+            commit.assert_called_once_with(
+                'fake_ovsdb_id',
+                [('delete', ('fake_ls_uuid', ['mac1'])),
+                 ('delete', ('fake_ls_uuid', ['mac2']))])
+            self.plugin_rpc.ack_vif_operation.assert_called_once_with(
+                mock.ANY, 'fake_op_id', ['fake_error', 'fake_error'])
+
+    def test_update_vifs_to_gateway_for_monitor_agent(self):
+        cfg.CONF.set_override('enable_manager', True, 'ovsdb')
+        self.l2gw_agent_manager.enable_manager = True
+        self.l2gw_agent_manager.l2gw_agent_type = n_const.MONITOR
+        self.l2gw_agent_manager.ovsdb_fd = mock.Mock()
+        vifs = [{'locator_dict': 'loc1', 'mac_dict': 'mac1'},
+                {'locator_dict': 'loc2', 'mac_dict': 'mac2'}]
+        errors = self.l2gw_agent_manager.update_vifs_to_gateway(
+            self.context, 'fake_ovsdb_id', vifs)
+        self.assertEqual([None, None], errors)
+        self.assertEqual(
+            [mock.call('loc1', 'mac1', 'fake_ovsdb_id', False),
+             mock.call('loc2', 'mac2', 'fake_ovsdb_id', False)],
+            (self.l2gw_agent_manager.ovsdb_fd.update_ucast_macs_remote.
+             call_args_list))
+
     def test_open_connection_with_socket_error(self):
         self.l2gw_agent_manager.gateways = {}
         gateway = l2gateway_config.L2GatewayConfig(self.fake_config_json)
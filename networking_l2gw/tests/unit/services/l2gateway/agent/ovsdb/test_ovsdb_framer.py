@@ -0,0 +1,73 @@
+# Copyright (c) 2015 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.tests import base
+from oslo_serialization import jsonutils
+
+from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_framer
+
+
+class TestJSONRPCFramer(base.BaseTestCase):
+    def setUp(self):
+        super(TestJSONRPCFramer, self).setUp()
+        self.framer = ovsdb_framer.JSONRPCFramer()
+        self.msg1 = {'id': 'abcd', 'result': [{'rows': [{'MAC': 'a'}]}]}
+        self.msg2 = {'method': 'update',
+                     'params': [None, {'Logical_Switch': {
+                         'uuid': {'new': {'description': 'a } { " \\'}}}}]}
+        self.data = (jsonutils.dumps(self.msg1) + '\n' +
+                     jsonutils.dumps(self.msg2)).encode('utf8')
+
+    def test_feed_complete_messages(self):
+        """Test case to test feed with complete messages."""
+        messages = self.framer.feed(self.data)
+        self.assertEqual([self.msg1, self.msg2],
+                         [jsonutils.loads(m) for m in messages])
+
+    def test_feed_byte_by_byte(self):
+        """Test case to test feed with one byte at a time."""
+        messages = []
+        for i in range(len(self.data)):
+            messages.extend(self.framer.feed(self.data[i:i + 1]))
+        self.assertEqual([self.msg1, self.msg2],
+                         [jsonutils.loads(m) for m in messages])
+
+    def test_feed_partial_message(self):
+        """Test case to test feed keeps a partial message buffered."""
+        data = jsonutils.dumps(self.msg1).encode('utf8')
+        self.assertEqual([], self.framer.feed(data[:-1]))
+        messages = self.framer.feed(data[-1:])
+        self.assertEqual([self.msg1], [jsonutils.loads(m) for m in messages])
+
+    def test_feed_multibyte_character_split(self):
+        """Test case to test feed with a character split across reads."""
+        msg = {'id': 'abcd', 'result': u'\xe9\u4e2d'}
+        data = jsonutils.dumps(msg, ensure_ascii=False).encode('utf8')
+        split = data.index(b'\xc3') + 1
+        messages = self.framer.feed(data[:split])
+        messages.extend(self.framer.feed(data[split:]))
+        self.assertEqual([msg], [jsonutils.loads(m) for m in messages])
+
+    def test_feed_invalid_json(self):
+        """Test case to test feed with an unbalanced closing brace."""
+        self.assertRaises(ValueError, self.framer.feed, b'}{}')
+        self.assertEqual([], self.framer.feed(b' '))
+
+    def test_reset(self):
+        """Test case to test reset discards a partial message."""
+        self.framer.feed(b'{"id": "a')
+        self.framer.reset()
+        messages = self.framer.feed(b'{"id": "b"}')
+        self.assertEqual([{'id': 'b'}], [jsonutils.loads(m) for m in messages])
@@ -24,6 +24,7 @@ from neutron.tests import base
 
 from networking_l2gw.services.l2gateway.agent import l2gateway_config as conf
 from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_monitor
+from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_replica
 from networking_l2gw.services.l2gateway.common import config
 from networking_l2gw.services.l2gateway.common import constants as n_const
 from networking_l2gw.services.l2gateway.common import ovsdb_schema
@@ -85,7 +86,6 @@ class TestOVSDBMonitor(base.BaseTestCase):
         self.msg1 = {'result': fake_message}
         self.msg2 = {'method': 'update',
                      'params': ['', fake_message]}
-        self.l2gw_ovsdb.responses = [self.monitor_message]
 
     def test_init(self):
         """Test case to test __init__."""
@@ -163,6 +163,137 @@ class TestOVSDBMonitor(base.BaseTestCase):
             self.assertFalse(process_resp.called)
             self.assertFalse(process_monitor_msg.called)
 
+    def test_set_monitor_response_handler_projects_columns(self):
+        """Test case to test only the processed columns are monitored."""
+        self.l2gw_ovsdb.connected = True
+        with contextlib.nested(
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              'send', return_value=True),
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              '_process_response'),
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              '_process_monitor_msg')) as (
+                send, process_resp, process_monitor_msg):
+            self.l2gw_ovsdb.set_monitor_response_handler()
+            message = send.call_args[0][0]
+            self.assertEqual('monitor', message['method'])
+            requests = message['params'][2]
+            self.assertEqual(sorted(self.monitor_message['params'][2]),
+                             sorted(requests))
+            self.assertEqual(
+                ['name', 'ports', 'switch_fault_status', 'tunnel_ips'],
+                requests['Physical_Switch'][0]['columns'])
+            self.assertEqual(['dst_ip'],
+                             requests['Physical_Locator'][0]['columns'])
+
+    def test_set_monitor_response_handler_with_monitor_cond(self):
+        """Test case to test the monitor_cond request is used if possible."""
+        self.l2gw_ovsdb.connected = True
+        self.l2gw_ovsdb.replica = ovsdb_replica.OVSDBReplica()
+        with contextlib.nested(
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              'send', return_value=True),
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              '_response',
+                              return_value={'result': {}}),
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              '_process_monitor_cond_msg'),
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              '_process_monitor_msg')) as (
+                send, process_resp, process_cond_msg, process_monitor_msg):
+            self.l2gw_ovsdb.set_monitor_response_handler()
+            message = send.call_args[0][0]
+            self.assertEqual('monitor_cond', message['method'])
+            self.assertEqual(
+                ['MAC', 'ipaddr', 'locator', 'logical_switch'],
+                message['params'][2]['Ucast_Macs_Remote'][0]['columns'])
+            process_cond_msg.assert_called_once_with({'result': {}}, None)
+            self.assertFalse(process_monitor_msg.called)
+            self.assertIn('update2', self.l2gw_ovsdb.handlers)
+
+    def test_set_monitor_response_handler_falls_back_to_monitor(self):
+        """Test case to test the monitor request is used as a fallback."""
+        self.l2gw_ovsdb.connected = True
+        self.l2gw_ovsdb.replica = ovsdb_replica.OVSDBReplica()
+        with contextlib.nested(
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              'send', return_value=True),
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              '_response',
+                              side_effect=[{'error': 'unknown method',
+                                            'result': None},
+                                           {'result': {}}]),
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              '_process_monitor_cond_msg'),
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              '_process_monitor_msg')) as (
+                send, process_resp, process_cond_msg, process_monitor_msg):
+            self.l2gw_ovsdb.set_monitor_response_handler()
+            self.assertEqual(['monitor_cond', 'monitor'],
+                             [call[0][0]['method']
+                              for call in send.call_args_list])
+            self.assertFalse(process_cond_msg.called)
+            process_monitor_msg.assert_called_once_with({'result': {}},
+                                                        None)
+
+    def test_set_monitor_response_handler_monitor_cond_timeout(self):
+        """Test case to test a timeout does not fall back to monitor."""
+        self.l2gw_ovsdb.connected = True
+        self.l2gw_ovsdb.replica = ovsdb_replica.OVSDBReplica()
+        with contextlib.nested(
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              'send', return_value=True),
+            mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                              '_response', return_value=None),
+            mock.patch.object(ovsdb_monitor.LOG, 'exception')) as (
+                send, response, log_exc):
+            self.assertRaises(exceptions.OVSDBError,
+                              self.l2gw_ovsdb.set_monitor_response_handler)
+            self.assertEqual(['monitor_cond'],
+                             [call[0][0]['method']
+                              for call in send.call_args_list])
+
+    def test_process_update2_event(self):
+        """Test case to test update2 diffs are merged into the rows."""
+        replica = self.l2gw_ovsdb.replica = ovsdb_replica.OVSDBReplica()
+        self.l2gw_ovsdb._process_monitor_cond_msg(
+            {'result': {'Physical_Port': {'port_uuid': {'initial': {
+                'name': 'port1'}}}}})
+        binding = [100, ['uuid', 'ls_uuid']]
+        with mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                               '_process_physical_port') as process_port:
+            self.l2gw_ovsdb._process_update2_event(
+                {'method': 'update2',
+                 'params': [None, {'Physical_Port': {'port_uuid': {
+                     'modify': {'vlan_bindings': ['map', [binding]]}}}}]},
+                None)
+            row_update = process_port.call_args[0][1]
+        self.assertEqual(['map', []], row_update['old']['vlan_bindings'])
+        self.assertEqual({'name': 'port1',
+                          'vlan_bindings': ['map', [binding]],
+                          'port_fault_status': ['set', []]},
+                         row_update['new'])
+        self.assertEqual(row_update['new'],
+                         replica.get_row('Physical_Port', 'port_uuid'))
+        self.assertEqual(1, self.callback.call_count)
+
+    def test_process_update2_event_before_monitor_cond_reply(self):
+        """Test case to test early update2 events are processed later."""
+        replica = self.l2gw_ovsdb.replica = ovsdb_replica.OVSDBReplica()
+        update = {'method': 'update2',
+                  'params': [None, {'Physical_Locator': {'loc_uuid': {
+                      'delete': None}}}]}
+        self.l2gw_ovsdb._process_update2_event(update, None)
+        self.assertFalse(self.callback.called)
+        self.l2gw_ovsdb._process_monitor_cond_msg(
+            {'result': {'Physical_Locator': {'loc_uuid': {'initial': {
+                'dst_ip': '1.1.1.1'}}}}})
+        self.assertIsNone(replica.get_physical_locator_uuid('1.1.1.1'))
+        self.assertEqual(2, self.callback.call_count)
+        deleted = self.callback.call_args[0][0]['deleted_physical_locators']
+        self.assertEqual([{'uuid': 'loc_uuid', 'dst_ip': '1.1.1.1'}],
+                         deleted)
+
     def test_update_event_handler(self):
         """Test case to test _update_event_handler."""
         with mock.patch.object(ovsdb_monitor.OVSDBMonitor,
@@ -198,6 +329,10 @@ class TestOVSDBMonitor(base.BaseTestCase):
               proc_ucast_mac_remote,
               proc_mcast_mac_local,
               proc_phys_loc_set):
+                proc_phy_loc.side_effect = (
+                    lambda uuid, uuid_dict, data_dict:
+                    data_dict['new_physical_locators'].append(
+                        ovsdb_schema.PhysicalLocator(uuid, '1.1.1.1')))
                 self.l2gw_ovsdb._setup_dispatch_table()
                 self.l2gw_ovsdb._process_update_event(self.msg2, mock.ANY)
                 self.assertTrue(proc_phy_port.called)
@@ -210,6 +345,37 @@ class TestOVSDBMonitor(base.BaseTestCase):
                 self.assertTrue(proc_phys_loc_set.called)
                 self.assertTrue(self.callback.called)
 
+    def test_process_monitor_msg_loads_replica(self):
+        """Test case to test the initial records are kept in the replica."""
+        self.l2gw_ovsdb.replica = ovsdb_replica.OVSDBReplica()
+        locators = {'Physical_Locator': {
+            'loc_uuid': {'new': {'dst_ip': '1.1.1.1'}}}}
+        with mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                               '_process_tables'):
+            self.l2gw_ovsdb._process_monitor_msg({'result': locators})
+        self.assertEqual('loc_uuid',
+                         self.l2gw_ovsdb.replica.get_physical_locator_uuid(
+                             '1.1.1.1'))
+
+    def test_process_update_event_updates_replica(self):
+        """Test case to test the update events are applied to the replica."""
+        self.l2gw_ovsdb.replica = ovsdb_replica.OVSDBReplica()
+        self.l2gw_ovsdb.replica.reset({})
+        switches = {'Logical_Switch': {'ls_uuid': {'new': {'name': 'ls1'}}}}
+        with mock.patch.object(ovsdb_monitor.OVSDBMonitor,
+                               '_process_tables'):
+            self.l2gw_ovsdb._process_update_event(
+                {'method': 'update', 'params': ['', switches]}, None)
+        self.assertEqual('ls_uuid',
+                         self.l2gw_ovsdb.replica.get_logical_switch_uuid(
+                             'ls1'))
+
+    def test_disconnect_invalidates_replica(self):
+        """Test case to test the replica is dropped on disconnection."""
+        self.l2gw_ovsdb.replica = mock.Mock()
+        self.l2gw_ovsdb.disconnect()
+        self.assertTrue(self.l2gw_ovsdb.replica.invalidate.called)
+
     def test_process_response_raise_exception(self):
         """Test case to test _process_response with exception."""
         with mock.patch.object(ovsdb_monitor.OVSDBMonitor,
@@ -231,6 +397,14 @@ class TestOVSDBMonitor(base.BaseTestCase):
                 self.l2gw_ovsdb._process_response(self.op_id)
                 resp.assert_called_once_with(self.op_id)
 
+    def test_on_remote_message_with_response(self):
+        """Test case to test _on_remote_message completes a request."""
+        self.l2gw_ovsdb._register_request(self.op_id)
+        response = {'id': self.op_id, 'result': {}, 'error': None}
+        self.l2gw_ovsdb._on_remote_message(jsonutils.dumps(response))
+        self.assertEqual(response,
+                         self.l2gw_ovsdb._process_response(self.op_id))
+
     def test_default_echo_handler(self):
         """Test case to test _default_echo_handler."""
         dummy_msg = {'params': 'fake_params',
@@ -289,6 +463,21 @@ class TestOVSDBMonitor(base.BaseTestCase):
                 self.assertFalse(self.l2gw_ovsdb.read_on)
                 self.assertTrue(sock_close.called)
 
+    def test_rcv_thread_with_split_messages(self):
+        """Test case to test _rcv_thread with messages split across reads."""
+        data = jsonutils.dumps({'id': 'abcd', 'result': '}{'}).encode('utf8')
+        chunks = [data[:5], data[5:] + data[:3], data[3:], None]
+        with contextlib.nested(
+            mock.patch.object(self.l2gw_ovsdb.socket, 'recv',
+                              side_effect=chunks),
+            mock.patch.object(self.l2gw_ovsdb.socket, 'close')
+        ) as (sock_recv, sock_close):
+                self.l2gw_ovsdb._rcv_thread()
+                self.assertEqual(2, self.greenthread.call_count)
+                self.greenthread.assert_called_with(
+                    self.l2gw_ovsdb._on_remote_message, data.decode('utf8'))
+                self.assertFalse(self.l2gw_ovsdb.read_on)
+
     def test_form_ovsdb_data(self):
         some_value = mock.Mock()
         expect = {n_const.OVSDB_IDENTIFIER: self.conf.ovsdb_identifier,
@@ -298,24 +487,15 @@ class TestOVSDBMonitor(base.BaseTestCase):
                   'new_physical_locators': some_value,
                   'new_local_macs': some_value,
                   'new_remote_macs': some_value,
-                  'new_mlocal_macs': some_value,
-                  'new_locator_sets': some_value,
                   'deleted_logical_switches': some_value,
                   'deleted_physical_switches': some_value,
                   'deleted_physical_ports': some_value,
                   'deleted_physical_locators': some_value,
                   'deleted_local_macs': some_value,
                   'deleted_remote_macs': some_value,
-                  'deleted_mlocal_macs': some_value,
-                  'deleted_locator_sets': some_value,
-                  'modified_logical_switches': some_value,
                   'modified_physical_switches': some_value,
                   'modified_physical_ports': some_value,
-                  'modified_physical_locators': some_value,
-                  'modified_local_macs': some_value,
-                  'modified_remote_macs': some_value,
-                  'modified_mlocal_macs': some_value,
-                  'modified_locator_sets': some_value}
+                  'modified_remote_macs': some_value}
         with mock.patch.object(ovsdb_monitor.OVSDBMonitor,
                                '_get_list',
                                return_value=some_value
@@ -323,6 +503,60 @@ class TestOVSDBMonitor(base.BaseTestCase):
             result = self.l2gw_ovsdb._form_ovsdb_data(mock.Mock(), mock.ANY)
             self.assertEqual(expect, result)
 
+    def test_form_ovsdb_data_leaves_out_empty_changes(self):
+        """Test case to test only the non-empty changes are sent."""
+        data_dict = self.l2gw_ovsdb._initialize_data_dict()
+        data_dict['new_physical_locators'].append(
+            ovsdb_schema.PhysicalLocator('loc_uuid', '1.1.1.1'))
+        data_dict['new_mlocal_macs'].append(
+            ovsdb_schema.McastMacsLocal('mcast_uuid', 'unknown-dst',
+                                        'ls_uuid', 'set_uuid', ''))
+        result = self.l2gw_ovsdb._form_ovsdb_data(data_dict, mock.ANY)
+        self.assertEqual(
+            {n_const.OVSDB_IDENTIFIER: self.conf.ovsdb_identifier,
+             'new_physical_locators': [{'uuid': 'loc_uuid',
+                                        'dst_ip': '1.1.1.1'}]},
+            result)
+
+    def test_stream_initial_records(self):
+        """Test case to test the initial records are sent in chunks."""
+        cfg.CONF.set_override('initial_sync_chunk_size', 2, 'ovsdb')
+        data_dict = self.l2gw_ovsdb._initialize_data_dict()
+        data_dict['new_logical_switches'].append(
+            ovsdb_schema.LogicalSwitch('ls_uuid', 'ls1', 100, 'ls1'))
+        for i in range(3):
+            data_dict['new_physical_locators'].append(
+                ovsdb_schema.PhysicalLocator('loc%d' % i, '1.1.1.%d' % i))
+        self.l2gw_ovsdb._stream_initial_records(data_dict, mock.ANY)
+        chunks = [call[0][0] for call in self.callback.call_args_list]
+        self.assertEqual([0, 1], [chunk[n_const.OVSDB_SYNC_SEQ]
+                                  for chunk in chunks])
+        self.assertEqual(1, len(chunks[0]['new_logical_switches']))
+        self.assertEqual(1, len(chunks[0]['new_physical_locators']))
+        self.assertNotIn(n_const.OVSDB_SYNC_COMPLETE, chunks[0])
+        self.assertEqual(['loc1', 'loc2'],
+                         [loc['uuid']
+                          for loc in chunks[1]['new_physical_locators']])
+        self.assertTrue(chunks[1][n_const.OVSDB_SYNC_COMPLETE])
+
+    def test_stream_initial_records_without_records(self):
+        """Test case to test the sync is completed without records."""
+        self.l2gw_ovsdb._stream_initial_records(
+            self.l2gw_ovsdb._initialize_data_dict(), mock.ANY)
+        self.callback.assert_called_once_with(
+            {n_const.OVSDB_IDENTIFIER: self.conf.ovsdb_identifier,
+             n_const.OVSDB_SYNC_SEQ: 0,
+             n_const.OVSDB_SYNC_COMPLETE: True})
+
+    def test_notify_plugin_without_changes(self):
+        """Test case to test nothing is sent without plugin changes."""
+        data_dict = self.l2gw_ovsdb._initialize_data_dict()
+        data_dict['new_mlocal_macs'].append(
+            ovsdb_schema.McastMacsLocal('mcast_uuid', 'unknown-dst',
+                                        'ls_uuid', 'set_uuid', ''))
+        self.l2gw_ovsdb._notify_plugin(data_dict, mock.ANY)
+        self.assertFalse(self.callback.called)
+
     def test_process_physical_port(self):
         """Test case to process new physical_port."""
         fake_id = 'fake_id'
@@ -394,6 +628,18 @@ class TestOVSDBMonitor(base.BaseTestCase):
                 self.assertIn(phy_port.return_value,
                               data_dict.get('new_physical_ports'))
 
+    def test_process_physical_port_keeps_row(self):
+        """Test case to test the processed row is not modified."""
+        bindings = ['map', [[100, ['uuid', 'ls_uuid']]]]
+        add = {'new': {'name': 'fake_name',
+                       'port_fault_status': ['set', []],
+                       'vlan_bindings': list(bindings)}}
+        data_dict = {'new_physical_ports': []}
+        self.l2gw_ovsdb._process_physical_port('fake_id', add, {}, data_dict)
+        self.assertEqual(bindings, add['new']['vlan_bindings'])
+        self.assertEqual([{'vlan': 100, 'logical_switch_uuid': 'ls_uuid'}],
+                         data_dict['new_physical_ports'][0].vlan_bindings)
+
     def test_process_physical_switch(self):
         """Test case to process new physical_switch."""
         port_map = {'fake_id': 'fake_switch_id'}
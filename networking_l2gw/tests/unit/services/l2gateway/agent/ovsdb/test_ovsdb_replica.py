@@ -0,0 +1,83 @@
+# Copyright (c) 2015 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from neutron.tests import base
+
+from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_replica
+
+
+class TestOVSDBReplica(base.BaseTestCase):
+    def setUp(self):
+        super(TestOVSDBReplica, self).setUp()
+        self.replica = ovsdb_replica.OVSDBReplica()
+        self.mac_row = {'MAC': 'aa:aa:aa:aa:aa:aa',
+                        'logical_switch': ['uuid', 'ls_uuid'],
+                        'locator': ['uuid', 'loc_uuid'],
+                        'ipaddr': '10.0.0.1'}
+        self.initial = {'Logical_Switch': {
+                            'ls_uuid': {'new': {'name': 'ls1'}}},
+                        'Physical_Locator': {
+                            'loc_uuid': {'new': {'dst_ip': '1.1.1.1'}}},
+                        'Ucast_Macs_Remote': {
+                            'mac_uuid': {'new': self.mac_row}}}
+
+    def test_reset(self):
+        """Test case to test the rows are indexed by their natural keys."""
+        self.replica.reset(self.initial)
+        self.assertTrue(self.replica.synced)
+        self.assertEqual('ls_uuid',
+                         self.replica.get_logical_switch_uuid('ls1'))
+        self.assertEqual('loc_uuid',
+                         self.replica.get_physical_locator_uuid('1.1.1.1'))
+        self.assertEqual('mac_uuid',
+                         self.replica.get_ucast_mac_remote_uuid(
+                             'aa:aa:aa:aa:aa:aa', 'ls_uuid'))
+        self.assertEqual(self.mac_row,
+                         self.replica.get_row('Ucast_Macs_Remote',
+                                              'mac_uuid'))
+
+    def test_update_modify_and_delete(self):
+        """Test case to test the indexes follow the modified rows."""
+        self.replica.reset(self.initial)
+        self.replica.update({'Physical_Locator': {
+            'loc_uuid': {'old': {'dst_ip': '1.1.1.1'},
+                         'new': {'dst_ip': '2.2.2.2'}}}})
+        self.assertIsNone(self.replica.get_physical_locator_uuid('1.1.1.1'))
+        self.assertEqual('loc_uuid',
+                         self.replica.get_physical_locator_uuid('2.2.2.2'))
+        self.replica.update({'Ucast_Macs_Remote': {
+            'mac_uuid': {'old': self.mac_row}}})
+        self.assertIsNone(self.replica.get_ucast_mac_remote_uuid(
+            'aa:aa:aa:aa:aa:aa', 'ls_uuid'))
+        self.assertEqual({}, self.replica.get_rows('Ucast_Macs_Remote'))
+
+    def test_update_before_reset_is_applied_after_it(self):
+        """Test case to test updates received before the dump are kept."""
+        self.replica.update({'Logical_Switch': {
+            'ls2_uuid': {'new': {'name': 'ls2'}}}})
+        self.assertIsNone(self.replica.get_logical_switch_uuid('ls2'))
+        self.replica.reset(self.initial)
+        self.assertEqual('ls2_uuid',
+                         self.replica.get_logical_switch_uuid('ls2'))
+        self.assertEqual('ls_uuid',
+                         self.replica.get_logical_switch_uuid('ls1'))
+
+    def test_invalidate(self):
+        """Test case to test the lookups miss once the replica is stale."""
+        self.replica.reset(self.initial)
+        self.replica.invalidate()
+        self.assertFalse(self.replica.synced)
+        self.assertIsNone(self.replica.get_logical_switch_uuid('ls1'))
+        self.assertIsNone(self.replica.get_row('Logical_Switch', 'ls_uuid'))
@@ -25,6 +25,7 @@ from neutron.tests import base
 from networking_l2gw._i18n import _LW
 from networking_l2gw.services.l2gateway.agent import l2gateway_config as conf
 from networking_l2gw.services.l2gateway.agent.ovsdb import base_connection
+from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_replica
 from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_writer
 from networking_l2gw.services.l2gateway.common import config
 from networking_l2gw.services.l2gateway.common import constants as n_const
@@ -55,8 +56,6 @@ class TestOVSDBWriter(base.BaseTestCase):
         self.fake_message = {'id': self.op_id,
                              'fake_key': 'fake_value'}
 
-        self.l2gw_ovsdb.responses = [self.fake_message]
-
     def test_process_response(self):
         """Test case to test _process_response."""
         expected_result = {'fake_key': 'fake_value'}
@@ -110,13 +109,13 @@ class TestOVSDBWriter(base.BaseTestCase):
 
     def test_get_reply(self):
         """Test case to test _get_reply."""
-        ret_value = jsonutils.dumps({self.op_id:
-                                     'foo_value'})
+        ret_value = jsonutils.dumps({'id': self.op_id,
+                                     'result': 'foo_value'})
+        self.l2gw_ovsdb._register_request(self.op_id)
         with contextlib.nested(
             mock.patch.object(ovsdb_writer.OVSDBWriter,
                               '_recv_data',
-                              return_value=jsonutils.dumps({self.op_id:
-                                                            'foo_value'})),
+                              return_value=ret_value),
             mock.patch.object(ovsdb_writer.OVSDBWriter,
                               '_process_response',
                               return_value=(ret_value, None)),
@@ -136,7 +135,8 @@ class TestOVSDBWriter(base.BaseTestCase):
                                    '_get_reply') as mock_reply:
                 self.l2gw_ovsdb._send_and_receive('some_query',
                                                   self.op_id, mock.ANY, True)
-                mock_send.assert_called_with('some_query', addr=mock.ANY)
+                mock_send.assert_called_with('some_query', addr=mock.ANY,
+                                             rcv_required=True)
                 mock_reply.assert_called_with(self.op_id, mock.ANY)
 
     def test_send_and_receive_with_rcv_required_false(self):
@@ -148,9 +148,45 @@ class TestOVSDBWriter(base.BaseTestCase):
                                    '_get_reply') as mock_reply:
                 self.l2gw_ovsdb._send_and_receive('some_query',
                                                   self.op_id, mock.ANY, False)
-                mock_send.assert_called_with('some_query', addr=mock.ANY)
+                mock_send.assert_called_with('some_query', addr=mock.ANY,
+                                             rcv_required=False)
                 mock_reply.assert_not_called()
 
+    def test_get_reply_with_echo(self):
+        """Test case to test _get_reply answers an echo request."""
+        echo = jsonutils.dumps({'method': 'echo', 'params': [],
+                                'id': 'echo'})
+        reply = jsonutils.dumps({'id': self.op_id, 'result': [],
+                                 'error': None})
+        self.l2gw_ovsdb._register_request(self.op_id)
+        with contextlib.nested(
+            mock.patch.object(ovsdb_writer.OVSDBWriter,
+                              '_recv_data', side_effect=[echo, reply]),
+            mock.patch.object(base_connection.BaseConnection,
+                              'send', return_value=True)
+        ) as (recv_data, send):
+            self.assertTrue(self.l2gw_ovsdb._get_reply(self.op_id,
+                                                       mock.ANY))
+            send.assert_called_once_with({'result': [], 'error': None,
+                                          'id': 'echo'})
+
+    def test_echo(self):
+        """Test case to test echo."""
+        with mock.patch.object(ovsdb_writer.OVSDBWriter,
+                               '_send_and_receive') as send_and_receive:
+            self.l2gw_ovsdb.echo(mock.ANY)
+            query = send_and_receive.call_args[0][0]
+            self.assertEqual('echo', query['method'])
+            self.assertTrue(send_and_receive.call_args[0][3])
+
+    def test_echo_with_closed_connection(self):
+        """Test case to test echo on a connection closed by the server."""
+        with mock.patch.object(ovsdb_writer.OVSDBWriter,
+                               '_send_and_receive'):
+            self.l2gw_ovsdb.connected = False
+            self.assertRaises(exceptions.OVSDBError,
+                              self.l2gw_ovsdb.echo, mock.ANY)
+
     def test_delete_logical_switch(self):
         """Test case to test delete_logical_switch."""
         commit_dict = {"op": "commit", "durable": True}
@@ -344,6 +380,117 @@ class TestOVSDBWriter(base.BaseTestCase):
                 send_n_receive.assert_called_with(mock.ANY,
                                                   self.op_id, mock.ANY, True)
 
+    def _get_mac_requests(self):
+        ls_dict = {'uuid': None, 'name': 'ls1', 'key': 100,
+                   'description': 'ls1'}
+        locator_dict = {'uuid': None, 'dst_ip': '1.1.1.1'}
+        requests = []
+        for mac in ('aa:aa:aa:aa:aa:aa', 'bb:bb:bb:bb:bb:bb'):
+            mac_dict = {'uuid': None, 'mac': mac,
+                        'logical_switch_id': None,
+                        'physical_locator_id': None,
+                        'ip_address': '10.0.0.1'}
+            requests.append(('insert', (ls_dict, locator_dict, mac_dict)))
+        requests.append(('delete', ('ls_uuid', ['cc:cc:cc:cc:cc:cc'])))
+        return requests
+
+    def test_transact_ucast_macs_remote(self):
+        """Test case to test several MAC requests in one transaction."""
+        with contextlib.nested(
+            mock.patch.object(ovsdb_writer.OVSDBWriter, 'send',
+                              return_value=True),
+            mock.patch.object(ovsdb_writer.OVSDBWriter, '_get_reply',
+                              return_value={'result': [{}] * 6}),
+        ) as (send, get_reply):
+            errors = self.l2gw_ovsdb.transact_ucast_macs_remote(
+                self._get_mac_requests(), mock.ANY)
+            self.assertEqual([None, None, None], errors)
+            self.assertEqual(1, send.call_count)
+            params = send.call_args[0][0]['params']
+            # The locator and the logical switch are inserted only once.
+            self.assertEqual(
+                ['Physical_Locator', 'Logical_Switch', 'Ucast_Macs_Remote',
+                 'Ucast_Macs_Remote', 'Ucast_Macs_Remote'],
+                [op['table'] for op in params[1:-1]])
+            self.assertEqual(params[1]['uuid-name'],
+                             params[4]['row']['locator'][1])
+            self.assertEqual({"op": "commit", "durable": True}, params[-1])
+
+    def test_transact_ucast_macs_remote_with_replica(self):
+        """Test case to test existing rows are resolved from the replica."""
+        replica = ovsdb_replica.OVSDBReplica()
+        replica.reset({'Physical_Locator': {
+                           'loc_uuid': {'new': {'dst_ip': '1.1.1.1'}}},
+                       'Logical_Switch': {
+                           'ls_uuid': {'new': {'name': 'ls1'}}}})
+        self.l2gw_ovsdb.replica = replica
+        with contextlib.nested(
+            mock.patch.object(ovsdb_writer.OVSDBWriter, 'send',
+                              return_value=True),
+            mock.patch.object(ovsdb_writer.OVSDBWriter, '_get_reply',
+                              return_value={'result': [{}] * 4}),
+        ) as (send, get_reply):
+            errors = self.l2gw_ovsdb.transact_ucast_macs_remote(
+                self._get_mac_requests(), mock.ANY)
+            self.assertEqual([None, None, None], errors)
+            params = send.call_args[0][0]['params']
+            self.assertEqual(
+                ['Ucast_Macs_Remote', 'Ucast_Macs_Remote',
+                 'Ucast_Macs_Remote'],
+                [op['table'] for op in params[1:-1]])
+            self.assertEqual(['uuid', 'loc_uuid'],
+                             params[1]['row']['locator'])
+            self.assertEqual(['uuid', 'ls_uuid'],
+                             params[1]['row']['logical_switch'])
+
+    def test_transact_ucast_macs_remote_with_error(self):
+        """Test case to test the failed request is left out of the batch."""
+        replies = [{'result': [{}, {}, {}, {'error': 'constraint'}]},
+                   {'result': [{}] * 4}]
+        with contextlib.nested(
+            mock.patch.object(ovsdb_writer.OVSDBWriter, 'send',
+                              return_value=True),
+            mock.patch.object(ovsdb_writer.OVSDBWriter, '_get_reply',
+                              side_effect=replies),
+        ) as (send, get_reply):
+            errors = self.l2gw_ovsdb.transact_ucast_macs_remote(
+                self._get_mac_requests(), mock.ANY)
+            self.assertIsNone(errors[0])
+            self.assertIsInstance(errors[1], exceptions.OVSDBError)
+            self.assertIsNone(errors[2])
+            self.assertEqual(2, send.call_count)
+
+    def test_transact_ucast_macs_remote_with_commit_error(self):
+        """Test case to test requests are retried alone on commit errors."""
+        replies = [{'result': [{}] * 6 + [{'error': 'referential'}]},
+                   {'result': [{}] * 4},
+                   {'result': [{}, {'error': 'referential'}]},
+                   {'result': [{}] * 2}]
+        with contextlib.nested(
+            mock.patch.object(ovsdb_writer.OVSDBWriter, 'send',
+                              return_value=True),
+            mock.patch.object(ovsdb_writer.OVSDBWriter, '_get_reply',
+                              side_effect=replies),
+        ) as (send, get_reply):
+            errors = self.l2gw_ovsdb.transact_ucast_macs_remote(
+                self._get_mac_requests(), mock.ANY)
+            self.assertIsNone(errors[0])
+            self.assertIsInstance(errors[1], exceptions.OVSDBError)
+            self.assertIsNone(errors[2])
+            self.assertEqual(4, send.call_count)
+
+    def test_transact_ucast_macs_remote_without_reply(self):
+        """Test case to test a missing reply is raised."""
+        with contextlib.nested(
+            mock.patch.object(ovsdb_writer.OVSDBWriter, 'send',
+                              return_value=True),
+            mock.patch.object(ovsdb_writer.OVSDBWriter, '_get_reply',
+                              return_value=None),
+        ) as (send, get_reply):
+            self.assertRaises(exceptions.OVSDBError,
+                              self.l2gw_ovsdb.transact_ucast_macs_remote,
+                              self._get_mac_requests(), mock.ANY)
+
     def test_update_connection_to_gateway(self):
         """Test case to test update_connection_to_gateway."""
         with contextlib.nested(
@@ -474,8 +621,8 @@ class TestOVSDBWriter(base.BaseTestCase):
         fake_socket = base_test.SocketClass(None,
                                             None,
                                             None,
-                                            base_test.FakeDecodeClass(
-                                                jsonutils.dumps(fake_data)))
+                                            jsonutils.dumps(
+                                                fake_data).encode('utf8'))
         with mock.patch.object(socket, 'socket', return_value=fake_socket):
                 ovsdb_conf = base_test.FakeConf()
                 l2gw_obj = ovsdb_writer.OVSDBWriter(
@@ -483,6 +630,26 @@ class TestOVSDBWriter(base.BaseTestCase):
                 result = l2gw_obj._recv_data(mock.ANY)
                 self.assertEqual(jsonutils.dumps(fake_data), result)
 
+    def test_recv_data_with_multiple_messages(self):
+        """Test case to test _recv_data with two messages in one read."""
+        fake_data1 = {"id": "1", "result": "{fake_value}"}
+        fake_data2 = {"id": "2", "result": None}
+        fake_socket = base_test.SocketClass(
+            None, None, None,
+            (jsonutils.dumps(fake_data1) +
+             jsonutils.dumps(fake_data2)).encode('utf8'))
+        with mock.patch.object(socket, 'socket', return_value=fake_socket):
+                ovsdb_conf = base_test.FakeConf()
+                l2gw_obj = ovsdb_writer.OVSDBWriter(
+                    cfg.CONF.ovsdb, ovsdb_conf)
+                with mock.patch.object(fake_socket, 'recv',
+                                       wraps=fake_socket.recv) as recv:
+                    first = l2gw_obj._recv_data(mock.ANY)
+                    second = l2gw_obj._recv_data(mock.ANY)
+                    self.assertEqual(1, recv.call_count)
+                self.assertEqual(fake_data1, jsonutils.loads(first))
+                self.assertEqual(fake_data2, jsonutils.loads(second))
+
     def test_recv_data_with_empty_data(self):
         """Test case to test _recv_data with empty data."""
         fake_socket = base_test.SocketClass(None,
@@ -499,6 +666,7 @@ class TestOVSDBWriter(base.BaseTestCase):
                     cfg.CONF.ovsdb, ovsdb_conf)
                 result = l2gw_obj._recv_data(mock.ANY)
                 self.assertEqual(None, result)
+                self.assertFalse(l2gw_obj.connected)
 
     def test_recv_data_with_socket_error(self):
         """Test case to test _recv_data with socket error."""
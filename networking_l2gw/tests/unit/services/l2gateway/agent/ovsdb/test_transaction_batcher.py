@@ -0,0 +1,65 @@
+# Copyright (c) 2015 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+import mock
+
+from neutron.tests import base
+
+from networking_l2gw.services.l2gateway.agent.ovsdb import transaction_batcher
+from networking_l2gw.services.l2gateway import exceptions
+
+
+class TestOVSDBTransactionBatcher(base.BaseTestCase):
+    def setUp(self):
+        super(TestOVSDBTransactionBatcher, self).setUp()
+        self.commit = mock.Mock(
+            side_effect=lambda requests: [None] * len(requests))
+        self.batcher = transaction_batcher.OVSDBTransactionBatcher(
+            self.commit, 0.01, 3)
+
+    def _submit_all(self, requests):
+        threads = [eventlet.spawn(self.batcher.submit, request)
+                   for request in requests]
+        return [thread.wait() for thread in threads]
+
+    def test_requests_in_window_are_committed_together(self):
+        """Test case to test the requests of a window share a commit."""
+        self._submit_all(['req1', 'req2'])
+        self.commit.assert_called_once_with(['req1', 'req2'])
+
+    def test_max_ops_flushes_the_batch(self):
+        """Test case to test a full batch is committed right away."""
+        self._submit_all(['req1', 'req2', 'req3', 'req4'])
+        self.assertEqual([mock.call(['req1', 'req2', 'req3']),
+                          mock.call(['req4'])],
+                         self.commit.call_args_list)
+
+    def test_error_is_raised_to_its_submitter(self):
+        """Test case to test a failed request only fails its submitter."""
+        error = exceptions.OVSDBError(message='fake_error')
+        self.commit.side_effect = lambda requests: [None, error]
+        first = eventlet.spawn(self.batcher.submit, 'req1')
+        second = eventlet.spawn(self.batcher.submit, 'req2')
+        self.assertIsNone(first.wait())
+        self.assertRaises(exceptions.OVSDBError, second.wait)
+
+    def test_commit_exception_is_raised_to_all(self):
+        """Test case to test a failed commit fails every submitter."""
+        self.commit.side_effect = exceptions.OVSDBError(message='fake_error')
+        first = eventlet.spawn(self.batcher.submit, 'req1')
+        second = eventlet.spawn(self.batcher.submit, 'req2')
+        self.assertRaises(exceptions.OVSDBError, first.wait)
+        self.assertRaises(exceptions.OVSDBError, second.wait)
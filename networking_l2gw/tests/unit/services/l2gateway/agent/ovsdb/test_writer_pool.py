@@ -0,0 +1,105 @@
+# Copyright (c) 2015 OpenStack Foundation.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.tests import base
+
+from networking_l2gw.services.l2gateway.agent.ovsdb import ovsdb_writer
+from networking_l2gw.services.l2gateway.agent.ovsdb import writer_pool
+from networking_l2gw.services.l2gateway.common import config
+from networking_l2gw.services.l2gateway import exceptions
+
+from oslo_config import cfg
+
+
+class TestOVSDBWriterPool(base.BaseTestCase):
+    def setUp(self):
+        super(TestOVSDBWriterPool, self).setUp()
+        config.register_ovsdb_opts_helper(cfg.CONF)
+        cfg.CONF.set_override('max_writer_connections', 2, 'ovsdb')
+        self.gateway = mock.Mock()
+        self.writer = mock.patch.object(ovsdb_writer,
+                                        'OVSDBWriter').start()
+        self.writer.side_effect = lambda conf, gw, replica: mock.Mock(
+            connected=True)
+        self.pool = writer_pool.OVSDBWriterPool(cfg.CONF.ovsdb,
+                                                self.gateway)
+
+    def test_connection_is_reused(self):
+        """Test case to test a connection is reused after a transaction."""
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(1, self.writer.call_count)
+        self.assertFalse(first.disconnect.called)
+
+    def test_connection_is_dropped_on_error(self):
+        """Test case to test a connection is closed when the use fails."""
+        def _transact():
+            with self.pool.connection():
+                raise exceptions.OVSDBError(message='fake_error')
+        self.assertRaises(exceptions.OVSDBError, _transact)
+        with self.pool.connection() as ovsdb_fd:
+            pass
+        self.assertEqual(2, self.writer.call_count)
+        self.assertTrue(ovsdb_fd.connected)
+
+    def test_disconnected_connection_is_not_reused(self):
+        """Test case to test a closed connection is not handed out."""
+        with self.pool.connection() as first:
+            first.connected = False
+        with self.pool.connection() as second:
+            pass
+        self.assertIsNot(first, second)
+        self.assertEqual(2, self.writer.call_count)
+
+    def test_keepalive(self):
+        """Test case to test keepalive drops the dead connections."""
+        with self.pool.connection() as alive:
+            with self.pool.connection() as dead:
+                dead.echo.side_effect = exceptions.OVSDBError(
+                    message='fake_error')
+        self.pool.keepalive()
+        alive.echo.assert_called_once_with(self.gateway.ovsdb_identifier)
+        self.assertTrue(dead.disconnect.called)
+        with self.pool.connection() as ovsdb_fd:
+            self.assertIs(alive, ovsdb_fd)
+
+    def test_keepalive_takes_a_slot(self):
+        """Test case to test a probed connection counts in the pool size."""
+        balances = []
+        with self.pool.connection() as ovsdb_fd:
+            ovsdb_fd.echo.side_effect = (
+                lambda ovsdb_identifier: balances.append(
+                    self.pool._semaphore.balance))
+        self.pool.keepalive()
+        self.assertEqual([1], balances)
+        self.assertEqual(2, self.pool._semaphore.balance)
+
+    def test_close(self):
+        """Test case to test close disconnects the idle connections."""
+        with self.pool.connection() as ovsdb_fd:
+            pass
+        self.pool.close()
+        self.assertTrue(ovsdb_fd.disconnect.called)
+
+    def test_close_with_connection_in_use(self):
+        """Test case to test a connection in use is closed on return."""
+        with self.pool.connection() as ovsdb_fd:
+            self.pool.close()
+        self.assertTrue(ovsdb_fd.disconnect.called)
@@ -47,3 +47,12 @@ class L2GatewayAgentApiTestCase(base.BaseTestCase):
         self.agent_rpc.notify_ovsdb_states(context, mock.ANY)
         cctxt.cast.assert_called_with(
             context, 'notify_ovsdb_states', ovsdb_states=mock.ANY)
+
+    def test_ack_vif_operation(self):
+        cctxt = mock.Mock()
+        context = mock.Mock()
+        self.agent_rpc.client.prepare.return_value = cctxt
+        self.agent_rpc.ack_vif_operation(context, 'fake_op_id', [None])
+        self.agent_rpc.client.prepare.assert_called_with(version='1.1')
+        cctxt.cast.assert_called_with(
+            context, 'ack_vif_operation', op_id='fake_op_id', errors=[None])
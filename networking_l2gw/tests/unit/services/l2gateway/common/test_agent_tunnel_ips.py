@@ -0,0 +1,107 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.callbacks import events
+from neutron.callbacks import resources
+from neutron.tests import base
+
+from networking_l2gw.services.l2gateway.common import agent_tunnel_ips
+
+from neutron_lib import constants as n_const
+from oslo_utils import timeutils
+
+
+def _get_agent(host, tunneling_ip):
+    return {'host': host,
+            'agent_type': n_const.AGENT_TYPE_OVS,
+            'configurations': {'tunneling_ip': tunneling_ip}}
+
+
+class TestAgentTunnelIpCache(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestAgentTunnelIpCache, self).setUp()
+        self.context = mock.Mock()
+        self.core_plugin = mock.Mock()
+        self.core_plugin.get_agents.return_value = [
+            _get_agent('host1', '1.1.1.1')]
+        self.cache = agent_tunnel_ips.AgentTunnelIpCache(60)
+        self.now = 1000
+        mock.patch.object(timeutils, 'utcnow_ts',
+                          side_effect=lambda: self.now).start()
+
+    def test_get_tunneling_ip(self):
+        self.assertEqual('1.1.1.1', self.cache.get_tunneling_ip(
+            self.context, self.core_plugin, 'host1'))
+        self.assertEqual('1.1.1.1', self.cache.get_tunneling_ip(
+            self.context, self.core_plugin, 'host1'))
+        self.core_plugin.get_agents.assert_called_once_with(
+            self.context,
+            filters={'agent_type': [n_const.AGENT_TYPE_OVS],
+                     'host': ['host1']})
+
+    def test_get_tunneling_ip_expired(self):
+        self.cache.get_tunneling_ip(self.context, self.core_plugin, 'host1')
+        self.now += 60
+        self.core_plugin.get_agents.return_value = [
+            _get_agent('host1', '2.2.2.2')]
+        self.assertEqual('2.2.2.2', self.cache.get_tunneling_ip(
+            self.context, self.core_plugin, 'host1'))
+        self.assertEqual(2, self.core_plugin.get_agents.call_count)
+
+    def test_get_tunneling_ip_without_agent(self):
+        self.core_plugin.get_agents.return_value = []
+        self.assertIsNone(self.cache.get_tunneling_ip(
+            self.context, self.core_plugin, 'host2'))
+
+    def test_get_agent_ips(self):
+        self.core_plugin.get_agents.return_value = [
+            _get_agent('host1', '1.1.1.1'), _get_agent('host2', '2.2.2.2')]
+        self.assertEqual({'1.1.1.1': 'host1', '2.2.2.2': 'host2'},
+                         self.cache.get_agent_ips(self.context,
+                                                  self.core_plugin))
+        self.cache.get_agent_ips(self.context, self.core_plugin)
+        self.core_plugin.get_agents.assert_called_once_with(
+            self.context, filters={'agent_type': [n_const.AGENT_TYPE_OVS]})
+        # The hosts are cached as well.
+        self.assertEqual('2.2.2.2', self.cache.get_tunneling_ip(
+            self.context, self.core_plugin, 'host2'))
+        self.assertEqual(1, self.core_plugin.get_agents.call_count)
+
+    def test_agent_updated(self):
+        self.cache.get_tunneling_ip(self.context, self.core_plugin, 'host1')
+        agent = _get_agent('host1', None)
+        agent['configurations'] = '{"tunneling_ip": "3.3.3.3"}'
+        self.cache._agent_updated(resources.AGENT, events.AFTER_UPDATE,
+                                  mock.Mock(), agent=agent)
+        self.assertEqual('3.3.3.3', self.cache.get_tunneling_ip(
+            self.context, self.core_plugin, 'host1'))
+        self.assertEqual(1, self.core_plugin.get_agents.call_count)
+
+    def test_agent_updated_ignores_other_agents(self):
+        agent = _get_agent('host1', '3.3.3.3')
+        agent['agent_type'] = n_const.AGENT_TYPE_DHCP
+        self.cache._agent_updated(resources.AGENT, events.AFTER_UPDATE,
+                                  mock.Mock(), agent=agent)
+        self.assertEqual({}, self.cache.tunnel_ips)
+
+    def test_agent_deleted(self):
+        self.cache.get_tunneling_ip(self.context, self.core_plugin, 'host1')
+        self.cache._agent_deleted(resources.AGENT, events.BEFORE_DELETE,
+                                  mock.Mock(),
+                                  agent=_get_agent('host1', '1.1.1.1'))
+        self.assertEqual({}, self.cache.tunnel_ips)
@@ -0,0 +1,130 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.tests import base
+
+from networking_l2gw.db.l2gateway.ovsdb import lib as db
+from networking_l2gw.services.l2gateway.common import connected_networks
+
+from oslo_utils import timeutils
+
+
+class TestConnectedNetworkCache(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestConnectedNetworkCache, self).setUp()
+        self.context = mock.Mock()
+        self.service_plugin = mock.Mock()
+        self.service_plugin.get_l2_gateway_connections.return_value = [
+            {'network_id': 'net1'}]
+        self.service_plugin.get_l2_gateway_connections_count.return_value = 1
+        self.get_ls = mock.patch.object(
+            db, 'get_all_logical_switches_by_name',
+            return_value=[{'uuid': 'ls1', 'name': 'net1'}]).start()
+        self.cache = connected_networks.ConnectedNetworkCache(30)
+        self.now = 1000
+        mock.patch.object(timeutils, 'utcnow_ts',
+                          side_effect=lambda: self.now).start()
+
+    def test_is_connected(self):
+        self.assertTrue(self.cache.is_connected(
+            self.context, self.service_plugin, 'net1'))
+        self.assertFalse(self.cache.is_connected(
+            self.context, self.service_plugin, 'net2'))
+        self.service_plugin.get_l2_gateway_connections.assert_called_once_with(
+            self.context, fields=['network_id'])
+
+    def test_is_connected_by_another_process(self):
+        self.assertFalse(self.cache.is_connected(
+            self.context, self.service_plugin, 'net2'))
+        self.service_plugin.get_l2_gateway_connections.return_value = [
+            {'network_id': 'net1'}, {'network_id': 'net2'}]
+        self.service_plugin.get_l2_gateway_connections_count.return_value = 2
+        self.assertTrue(self.cache.is_connected(
+            self.context, self.service_plugin, 'net2'))
+        self.assertEqual(
+            2, self.service_plugin.get_l2_gateway_connections.call_count)
+
+    def test_is_connected_without_cache(self):
+        self.cache = connected_networks.ConnectedNetworkCache(0)
+        self.assertTrue(self.cache.is_connected(
+            self.context, self.service_plugin, 'net1'))
+        self.service_plugin.get_l2_gateway_connections.return_value = []
+        self.assertFalse(self.cache.is_connected(
+            self.context, self.service_plugin, 'net2'))
+        self.service_plugin.get_l2_gateway_connections.assert_called_with(
+            self.context, filters={'network_id': ['net2']},
+            fields=['network_id'])
+
+    def test_get_logical_switches(self):
+        logical_switches = self.cache.get_logical_switches(
+            self.context, self.service_plugin, 'net1')
+        self.assertEqual([{'uuid': 'ls1', 'name': 'net1'}], logical_switches)
+        # The callers get copies of the cached logical switches.
+        logical_switches[0]['description'] = 'fake_name'
+        self.assertEqual([{'uuid': 'ls1', 'name': 'net1'}],
+                         self.cache.get_logical_switches(
+                             self.context, self.service_plugin, 'net1'))
+        self.get_ls.assert_called_once_with(self.context, 'net1')
+
+    def test_get_logical_switches_of_unconnected_network(self):
+        self.assertEqual([], self.cache.get_logical_switches(
+            self.context, self.service_plugin, 'net2'))
+        self.assertFalse(self.get_ls.called)
+
+    def test_get_logical_switches_not_reported_yet(self):
+        self.get_ls.return_value = []
+        self.assertEqual([], self.cache.get_logical_switches(
+            self.context, self.service_plugin, 'net1'))
+        # The logical switch reported by the agent is returned at once.
+        self.get_ls.return_value = [{'uuid': 'ls1', 'name': 'net1'}]
+        self.assertEqual([{'uuid': 'ls1', 'name': 'net1'}],
+                         self.cache.get_logical_switches(
+                             self.context, self.service_plugin, 'net1'))
+        self.assertEqual(2, self.get_ls.call_count)
+
+    def test_cache_expired(self):
+        self.cache.get_logical_switches(self.context, self.service_plugin,
+                                        'net1')
+        self.now += 30
+        self.cache.get_logical_switches(self.context, self.service_plugin,
+                                        'net1')
+        self.assertEqual(
+            2, self.service_plugin.get_l2_gateway_connections.call_count)
+        self.assertEqual(2, self.get_ls.call_count)
+
+    def test_invalidate(self):
+        self.cache.get_logical_switches(self.context, self.service_plugin,
+                                        'net1')
+        self.service_plugin.get_l2_gateway_connections.return_value = [
+            {'network_id': 'net1'}, {'network_id': 'net2'}]
+        self.cache.invalidate('net2')
+        self.assertTrue(self.cache.is_connected(
+            self.context, self.service_plugin, 'net2'))
+        self.cache.get_logical_switches(self.context, self.service_plugin,
+                                        'net1')
+        self.assertEqual(1, self.get_ls.call_count)
+
+    def test_invalidate_logical_switches(self):
+        self.cache.get_logical_switches(self.context, self.service_plugin,
+                                        'net1')
+        self.cache.invalidate_logical_switches()
+        self.cache.get_logical_switches(self.context, self.service_plugin,
+                                        'net1')
+        self.assertEqual(2, self.get_ls.call_count)
+        self.assertEqual(
+            1, self.service_plugin.get_l2_gateway_connections.call_count)
@@ -22,17 +22,25 @@ from neutron.tests import base
 
 from networking_l2gw.db.l2gateway import l2gateway_db
 from networking_l2gw.db.l2gateway.ovsdb import lib
+from networking_l2gw.services.l2gateway.common import config
+from networking_l2gw.services.l2gateway.common import connected_networks
 from networking_l2gw.services.l2gateway.common import constants as n_const
-from networking_l2gw.services.l2gateway.common import ovsdb_schema
 from networking_l2gw.services.l2gateway.ovsdb import data
 from networking_l2gw.services.l2gateway.service_drivers import agent_api
 
+from neutron_lib import constants
+from oslo_config import cfg
 
-class TestL2GatewayOVSDBCallbacks():
+
+class TestL2GatewayOVSDBCallbacks(base.BaseTestCase):
 
     def setUp(self):
         super(TestL2GatewayOVSDBCallbacks, self).setUp()
+        mock.patch.object(agent_api, 'L2gatewayAgentApi').start()
+        mock.patch.object(data.l2pop_rpc,
+                          'L2populationAgentNotifyAPI').start()
         self.context = context.get_admin_context()
+        self.l2gw_callbacks = data.L2GatewayOVSDBCallbacks(mock.Mock())
 
     def test_update_ovsdb_changes(self):
         fake_ovsdb_data = {n_const.OVSDB_IDENTIFIER: 'fake_id'}
@@ -43,6 +51,36 @@ class TestL2GatewayOVSDBCallbacks():
             ovsdb_return_value.update_ovsdb_changes.assert_called_with(
                 self.context, fake_ovsdb_data)
 
+    def test_update_ovsdb_changes_initial_sync(self):
+        chunks = [{n_const.OVSDB_IDENTIFIER: 'fake_id',
+                   n_const.OVSDB_SYNC_SEQ: 0},
+                  {n_const.OVSDB_IDENTIFIER: 'fake_id',
+                   n_const.OVSDB_SYNC_SEQ: 1,
+                   n_const.OVSDB_SYNC_COMPLETE: True}]
+        with contextlib.nested(
+            mock.patch.object(data, 'OVSDBData'),
+            mock.patch.object(data.LOG, 'debug')) as (ovs_data, log_debug):
+            self.l2gw_callbacks.update_ovsdb_changes(self.context,
+                                                     chunks[0])
+            self.assertEqual({'fake_id': 1}, self.l2gw_callbacks.sync_seqs)
+            self.l2gw_callbacks.update_ovsdb_changes(self.context,
+                                                     chunks[1])
+            self.assertEqual({}, self.l2gw_callbacks.sync_seqs)
+            self.assertFalse(log_debug.called)
+            self.assertEqual(
+                2, ovs_data.return_value.update_ovsdb_changes.call_count)
+
+    def test_update_ovsdb_changes_initial_sync_missing_chunk(self):
+        chunk = {n_const.OVSDB_IDENTIFIER: 'fake_id',
+                 n_const.OVSDB_SYNC_SEQ: 1}
+        with contextlib.nested(
+            mock.patch.object(data, 'OVSDBData'),
+            mock.patch.object(data.LOG, 'debug')) as (ovs_data, log_debug):
+            # The chunk 0 was received by another RPC worker.
+            self.l2gw_callbacks.update_ovsdb_changes(self.context, chunk)
+            self.assertTrue(log_debug.called)
+            self.assertEqual({'fake_id': 2}, self.l2gw_callbacks.sync_seqs)
+
     def test_notify_ovsdb_states(self):
         fake_ovsdb_states = {'ovsdb1': 'connected'}
         with mock.patch.object(data, 'OVSDBData') as ovs_data:
@@ -52,13 +90,29 @@ class TestL2GatewayOVSDBCallbacks():
             ovsdb_return_value.notify_ovsdb_states.assert_called_with(
                 self.context, fake_ovsdb_states)
 
+    def test_ack_vif_operation(self):
+        with mock.patch.object(lib, 'complete_outbox_ucast_mac_remotes',
+                               return_value=1) as complete:
+            self.l2gw_callbacks.ack_vif_operation(self.context, 'fake_op_id',
+                                                  [None, 'fake_error'])
+            complete.assert_called_with(self.context, 'fake_op_id',
+                                        [None, 'fake_error'])
+
     def test_get_ovsdbdata_object(self):
         fake_ovsdb_id = 'fake_ovsdb_id'
         with mock.patch.object(data, 'OVSDBData') as ovs_data:
             ret_value = self.l2gw_callbacks.get_ovsdbdata_object(
                 fake_ovsdb_id)
-            ret_value1 = ovs_data.assert_called_with(fake_ovsdb_id)
-            self.assertEqual(ret_value, ret_value1)
+            ovs_data.assert_called_once_with(
+                fake_ovsdb_id, agent_rpc=self.l2gw_callbacks.agent_rpc,
+                l2gw_mixin=self.l2gw_callbacks.l2gw_mixin,
+                l2pop_notifier=self.l2gw_callbacks.l2pop_notifier)
+            self.assertEqual(ovs_data.return_value, ret_value)
+            # The handler of an OVSDB server is reused by the next RPCs.
+            ret_value1 = self.l2gw_callbacks.get_ovsdbdata_object(
+                fake_ovsdb_id)
+            self.assertEqual(1, ovs_data.call_count)
+            self.assertIs(ret_value, ret_value1)
 
 
 class TestOVSDBData(base.BaseTestCase):
@@ -67,6 +121,7 @@ class TestOVSDBData(base.BaseTestCase):
         super(TestOVSDBData, self).setUp()
         self.context = context.get_admin_context()
         self.ovsdb_identifier = 'fake_ovsdb_id'
+        config.register_l2gw_opts_helper()
         self.ovsdb_data = data.OVSDBData(self.ovsdb_identifier)
 
     def test_init(self):
@@ -77,6 +132,11 @@ class TestOVSDBData(base.BaseTestCase):
                              'fake_ovsdb_id')
             self.assertTrue(setup_entry_table.called)
 
+    def test_entry_table_matches_plugin_changes(self):
+        """Test case to test the agent sends every processed change."""
+        self.assertEqual(set(n_const.OVSDB_PLUGIN_CHANGES),
+                         set(self.ovsdb_data.entry_table))
+
     def test_update_ovsdb_changes(self):
         fake_dict = {}
         fake_remote_mac = {'uuid': '123456',
@@ -206,120 +266,272 @@ class TestOVSDBData(base.BaseTestCase):
             process_deleted_remote_macs.assert_called_with(
                 self.context, fake_deleted_remote_macs)
 
+    def test_update_ovsdb_changes_in_batches(self):
+        cfg.CONF.set_override('ovsdb_update_batch_size', 2)
+        fake_context = mock.MagicMock()
+        new_ls = [{'uuid': 'ls1'}, {'uuid': 'ls2'}, {'uuid': 'ls3'}]
+        fake_ovsdb_data = {n_const.OVSDB_IDENTIFIER: 'fake_ovsdb_id',
+                           'new_logical_switches': new_ls,
+                           'deleted_local_macs': []}
+        process_new_ls = mock.Mock()
+        process_deleted_lm = mock.Mock()
+        self.ovsdb_data.entry_table = {
+            'new_logical_switches': process_new_ls,
+            'deleted_local_macs': process_deleted_lm}
+        self.ovsdb_data.update_ovsdb_changes(fake_context, fake_ovsdb_data)
+        self.assertEqual(2, fake_context.session.begin.call_count)
+        self.assertEqual([mock.call(fake_context, new_ls[:2]),
+                          mock.call(fake_context, new_ls[2:])],
+                         process_new_ls.call_args_list)
+        self.assertFalse(process_deleted_lm.called)
+
+    def test_update_ovsdb_changes_sends_rpcs_after_commit(self):
+        fake_context = mock.MagicMock()
+        calls = []
+        fake_context.session.begin.return_value.__exit__.side_effect = (
+            lambda *args: calls.append('commit'))
+        rpc = mock.Mock(side_effect=lambda: calls.append('rpc'))
+
+        def process_deleted_ps(context, rows, post_commit=None):
+            calls.append('process')
+            post_commit.append(rpc)
+
+        self.ovsdb_data.entry_table = {
+            'deleted_physical_switches': process_deleted_ps}
+        self.ovsdb_data.post_commit_handlers = set([process_deleted_ps])
+        self.ovsdb_data.update_ovsdb_changes(
+            fake_context, {'deleted_physical_switches': [{'uuid': 'ps'}]})
+        self.assertEqual(['process', 'commit', 'rpc'], calls)
+
+    def test_send_post_commit_continues_on_error(self):
+        rpc1 = mock.Mock(side_effect=Exception)
+        rpc2 = mock.Mock()
+        self.ovsdb_data._send_post_commit([rpc1, rpc2])
+        self.assertTrue(rpc1.called)
+        self.assertTrue(rpc2.called)
+
+    def test_get_update_batches_without_limit(self):
+        process_new_ls = mock.Mock()
+        process_new_pl = mock.Mock()
+        self.ovsdb_data.entry_table = {
+            'new_logical_switches': process_new_ls,
+            'new_physical_locators': process_new_pl}
+        fake_ovsdb_data = {'new_logical_switches': [{}, {}, {}],
+                           'new_physical_locators': [{}]}
+        batches = self.ovsdb_data._get_update_batches(fake_ovsdb_data)
+        self.assertEqual(1, len(batches))
+        self.assertEqual({process_new_ls: [{}, {}, {}],
+                          process_new_pl: [{}]},
+                         dict(batches[0]))
+
+    def _get_pending_mac(self, pending_id, operation, mac='fake_mac',
+                         logical_switch_uuid='fake_ls_id'):
+        return {'id': pending_id,
+                'operation': operation,
+                'logical_switch_uuid': logical_switch_uuid,
+                'mac': mac,
+                'locator_uuid': 'fake_loc_id',
+                'dst_ip': 'fake_dst_ip',
+                'vm_ip': 'fake_vm_ip'}
+
     def test_notify_ovsdb_states(self):
         fake_ovsdb_states = {'ovsdb1': 'connected'}
-        fake_dict = {'logical_switch_uuid': 'fake_ls_id',
-                     'mac': 'fake_mac',
-                     'locator_uuid': 'fake_loc_id',
-                     'dst_ip': 'fake_dst_ip',
-                     'vm_ip': 'fake_vm_ip'}
-        fake_insert_dict = {'operation': 'insert'}
-        fake_insert_dict.update(fake_dict)
-        fake_update_dict = {'operation': 'update'}
-        fake_update_dict.update(fake_dict)
-        fake_delete_dict = {'operation': 'delete'}
-        fake_delete_dict.update(fake_dict)
+        fake_insert = self._get_pending_mac(1, 'insert', mac='mac1')
+        fake_insert2 = self._get_pending_mac(2, 'insert', mac='mac2')
+        fake_update = self._get_pending_mac(3, 'update', mac='mac3')
+        fake_delete = self._get_pending_mac(4, 'delete', mac='mac4')
         with contextlib.nested(
             mock.patch.object(
-                lib, 'get_all_pending_remote_macs_in_asc_order'),
-            mock.patch.object(lib,
-                              'delete_pending_ucast_mac_remote'),
-            mock.patch.object(ovsdb_schema, 'LogicalSwitch'),
-            mock.patch.object(ovsdb_schema, 'PhysicalLocator'),
-            mock.patch.object(ovsdb_schema, 'UcastMacsRemote'),
+                lib, 'iter_pending_remote_macs_in_asc_order',
+                return_value=[fake_insert, fake_insert2, fake_update,
+                              fake_delete]),
+            mock.patch.object(lib, 'delete_pending_ucast_mac_remotes'),
             mock.patch.object(agent_api.L2gatewayAgentApi,
-                              'add_vif_to_gateway'),
+                              'add_vifs_to_gateway', return_value=[]),
             mock.patch.object(agent_api.L2gatewayAgentApi,
-                              'update_vif_to_gateway'),
+                              'update_vifs_to_gateway',
+                              return_value=['fake_error']),
             mock.patch.object(agent_api.L2gatewayAgentApi,
-                              'delete_vif_from_gateway')
-        ) as (mock_get_pend_recs, mock_del_pend_recs,
-              mock_ls, mock_pl, mock_ucmr, mock_add_vif,
-              mock_upd_vif, mock_del_vif):
-            mock_get_pend_recs.return_value = [fake_insert_dict]
+                              'delete_vif_from_gateway'),
+            mock.patch.object(lib,
+                              'requeue_stale_outbox_ucast_mac_remotes'),
+            mock.patch.object(lib, 'coalesce_pending_ucast_mac_remotes')
+        ) as (mock_get_pend_recs, mock_del_pend_recs, mock_add_vifs,
+              mock_upd_vifs, mock_del_vif, mock_requeue, mock_coalesce):
             self.ovsdb_data.notify_ovsdb_states(
                 self.context, fake_ovsdb_states)
-            self.assertTrue(mock_add_vif.called)
-            mock_get_pend_recs.return_value = [fake_update_dict]
+            mock_requeue.assert_called_with(
+                self.context, 'ovsdb1',
+                cfg.CONF.mac_programming_ack_timeout)
+            mock_coalesce.assert_called_with(self.context, 'ovsdb1')
+            mock_get_pend_recs.assert_called_with(
+                self.context, 'ovsdb1',
+                cfg.CONF.pending_macs_replay_batch_size)
+            mock_del_vif.assert_called_once_with(
+                self.context, 'ovsdb1', 'fake_ls_id', ['mac4'])
+            self.assertEqual(1, mock_add_vifs.call_count)
+            logical_switch_vifs = mock_add_vifs.call_args[0][2]
+            self.assertEqual(1, len(logical_switch_vifs))
+            self.assertEqual(
+                ['mac1', 'mac2'],
+                [vif['mac_dict']['mac']
+                 for vif in logical_switch_vifs[0]['vifs']])
+            self.assertEqual(1, mock_upd_vifs.call_count)
+            # The update failed on the agent, its record is kept.
+            mock_del_pend_recs.assert_called_once_with(self.context,
+                                                       [4, 1, 2])
+
+    def test_notify_ovsdb_states_failed_delete(self):
+        fake_ovsdb_states = {'ovsdb1': 'connected'}
+        fake_delete = self._get_pending_mac(1, 'delete')
+        fake_insert = self._get_pending_mac(2, 'insert')
+        with contextlib.nested(
+            mock.patch.object(
+                lib, 'iter_pending_remote_macs_in_asc_order',
+                return_value=[fake_delete, fake_insert]),
+            mock.patch.object(lib, 'delete_pending_ucast_mac_remotes'),
+            mock.patch.object(agent_api.L2gatewayAgentApi,
+                              'add_vifs_to_gateway'),
+            mock.patch.object(agent_api.L2gatewayAgentApi,
+                              'delete_vif_from_gateway',
+                              side_effect=Exception),
+            mock.patch.object(lib,
+                              'requeue_stale_outbox_ucast_mac_remotes'),
+            mock.patch.object(lib, 'coalesce_pending_ucast_mac_remotes'),
+            mock.patch.object(data.LOG, 'exception')
+        ) as (mock_get_pend_recs, mock_del_pend_recs, mock_add_vifs,
+              mock_del_vif, mock_requeue, mock_coalesce, mock_log):
             self.ovsdb_data.notify_ovsdb_states(
                 self.context, fake_ovsdb_states)
-            self.assertTrue(mock_upd_vif.called)
-            mock_get_pend_recs.return_value = [fake_delete_dict]
+            self.assertTrue(mock_log.called)
+            # The MAC is not added back until it is removed.
+            self.assertFalse(mock_add_vifs.called)
+            mock_del_pend_recs.assert_called_once_with(self.context, [])
+
+    def test_notify_ovsdb_states_failed_delete_in_previous_batch(self):
+        cfg.CONF.set_override('pending_macs_replay_batch_size', 1)
+        fake_ovsdb_states = {'ovsdb1': 'connected'}
+        fake_delete = self._get_pending_mac(1, 'delete')
+        fake_insert = self._get_pending_mac(2, 'insert')
+        with contextlib.nested(
+            mock.patch.object(
+                lib, 'iter_pending_remote_macs_in_asc_order',
+                return_value=[fake_delete, fake_insert]),
+            mock.patch.object(lib, 'delete_pending_ucast_mac_remotes'),
+            mock.patch.object(agent_api.L2gatewayAgentApi,
+                              'add_vifs_to_gateway'),
+            mock.patch.object(agent_api.L2gatewayAgentApi,
+                              'delete_vif_from_gateway',
+                              side_effect=Exception),
+            mock.patch.object(lib,
+                              'requeue_stale_outbox_ucast_mac_remotes'),
+            mock.patch.object(lib, 'coalesce_pending_ucast_mac_remotes'),
+            mock.patch.object(data.LOG, 'exception')
+        ) as (mock_get_pend_recs, mock_del_pend_recs, mock_add_vifs,
+              mock_del_vif, mock_requeue, mock_coalesce, mock_log):
             self.ovsdb_data.notify_ovsdb_states(
                 self.context, fake_ovsdb_states)
-            self.assertTrue(mock_del_vif.called)
+            # The MAC is not added back in the next batch either.
+            self.assertFalse(mock_add_vifs.called)
+            self.assertEqual([mock.call(self.context, []),
+                              mock.call(self.context, [])],
+                             mock_del_pend_recs.call_args_list)
+
+    def test_notify_ovsdb_states_in_batches(self):
+        cfg.CONF.set_override('pending_macs_replay_batch_size', 2)
+        cfg.CONF.set_override('pending_macs_replay_rate', 100)
+        fake_ovsdb_states = {'ovsdb1': 'connected'}
+        pending_macs = [self._get_pending_mac(i, 'insert', mac='mac%d' % i)
+                        for i in range(3)]
+        with contextlib.nested(
+            mock.patch.object(
+                lib, 'iter_pending_remote_macs_in_asc_order',
+                return_value=pending_macs),
+            mock.patch.object(lib, 'delete_pending_ucast_mac_remotes'),
+            mock.patch.object(agent_api.L2gatewayAgentApi,
+                              'add_vifs_to_gateway', return_value=None),
+            mock.patch.object(lib,
+                              'requeue_stale_outbox_ucast_mac_remotes'),
+            mock.patch.object(lib, 'coalesce_pending_ucast_mac_remotes'),
+            mock.patch.object(data.eventlet, 'sleep')
+        ) as (mock_get_pend_recs, mock_del_pend_recs, mock_add_vifs,
+              mock_requeue, mock_coalesce, mock_sleep):
+            self.ovsdb_data.notify_ovsdb_states(
+                self.context, fake_ovsdb_states)
+            self.assertEqual(2, mock_add_vifs.call_count)
+            mock_sleep.assert_called_once_with(0.02)
+            self.assertEqual([mock.call(self.context, [0, 1]),
+                              mock.call(self.context, [2])],
+                             mock_del_pend_recs.call_args_list)
 
     def test_process_new_logical_switches(self):
         fake_dict = {}
         fake_new_logical_switches = [fake_dict]
-        with mock.patch.object(lib, 'get_logical_switch',
-                               return_value=None) as get_ls:
-            with mock.patch.object(lib,
-                                   'add_logical_switch') as add_ls:
-                self.ovsdb_data._process_new_logical_switches(
-                    self.context, fake_new_logical_switches)
-                self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
-                self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
-                                 'fake_ovsdb_id')
-                get_ls.assert_called_with(self.context, fake_dict)
-                add_ls.assert_called_with(self.context, fake_dict)
+        with mock.patch.object(lib, 'bulk_add_logical_switches') as add_ls:
+            self.ovsdb_data._process_new_logical_switches(
+                self.context, fake_new_logical_switches)
+            self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
+            self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
+                             'fake_ovsdb_id')
+            add_ls.assert_called_with(self.context,
+                                      fake_new_logical_switches)
+
+    def test_process_new_logical_switches_post_commit(self):
+        post_commit = []
+        with contextlib.nested(
+            mock.patch.object(lib, 'bulk_add_logical_switches'),
+            mock.patch.object(connected_networks, 'get_cache')
+        ) as (add_ls, get_cache):
+            self.ovsdb_data._process_new_logical_switches(
+                self.context, [{}], post_commit=post_commit)
+            invalidate = get_cache.return_value.invalidate_logical_switches
+            self.assertFalse(invalidate.called)
+            post_commit[0]()
+            invalidate.assert_called_once_with()
 
     def test_process_new_physical_switches(self):
         fake_dict = {'tunnel_ip': ['set']}
         fake_new_physical_switches = [fake_dict]
-        with mock.patch.object(lib, 'get_physical_switch',
-                               return_value=None) as get_ps:
-            with mock.patch.object(lib,
-                                   'add_physical_switch') as add_ps:
-                self.ovsdb_data._process_new_physical_switches(
-                    self.context, fake_new_physical_switches)
-                self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
-                self.assertIsNone(fake_dict['tunnel_ip'])
-                self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
-                                 'fake_ovsdb_id')
-                get_ps.assert_called_with(self.context, fake_dict)
-                add_ps.assert_called_with(self.context, fake_dict)
+        with mock.patch.object(lib, 'bulk_add_physical_switches') as add_ps:
+            self.ovsdb_data._process_new_physical_switches(
+                self.context, fake_new_physical_switches)
+            self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
+            self.assertIsNone(fake_dict['tunnel_ip'])
+            self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
+                             'fake_ovsdb_id')
+            add_ps.assert_called_with(self.context,
+                                      fake_new_physical_switches)
 
     def test_process_new_physical_ports(self):
         fake_dict1 = {}
-        fake_dict2 = {'vlan_bindings': [fake_dict1]}
-        fake_new_physical_ports = [fake_dict2]
+        fake_dict2 = {'uuid': 'port_uuid', 'vlan_bindings': [fake_dict1]}
+        fake_dict3 = {'uuid': 'port2_uuid', 'vlan_bindings': []}
+        fake_new_physical_ports = [fake_dict2, fake_dict3]
         with contextlib.nested(
-            mock.patch.object(lib, 'get_physical_port',
-                              return_value=None),
-            mock.patch.object(lib,
-                              'add_physical_port'),
-            mock.patch.object(lib,
-                              'get_vlan_binding', return_value=None),
-            mock.patch.object(lib,
-                              'add_vlan_binding')) as (
-                get_pp, add_pp, get_vlan, add_vlan):
+            mock.patch.object(lib, 'bulk_add_physical_ports'),
+            mock.patch.object(lib, 'bulk_add_vlan_bindings')) as (
+                add_pp, add_vlan):
             self.ovsdb_data._process_new_physical_ports(
                 self.context, fake_new_physical_ports)
             self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict2)
             self.assertEqual(fake_dict2[n_const.OVSDB_IDENTIFIER],
                              'fake_ovsdb_id')
-            get_pp.assert_called_with(self.context, fake_dict2)
-            add_pp.assert_called_with(self.context, fake_dict2)
+            add_pp.assert_called_with(self.context, fake_new_physical_ports)
             self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict1)
-            self.assertIn('port_uuid', fake_dict1)
-            get_vlan.assert_called_with(self.context, fake_dict1)
-            add_vlan.assert_called_with(self.context, fake_dict1)
+            self.assertEqual('port_uuid', fake_dict1['port_uuid'])
+            add_vlan.assert_called_with(self.context, [fake_dict1])
 
     def test_process_new_physical_locators(self):
         fake_dict = {}
         fake_new_physical_locators = [fake_dict]
-        with mock.patch.object(lib, 'get_physical_locator',
-                               return_value=None) as get_pl:
-            with mock.patch.object(lib,
-                                   'add_physical_locator') as add_pl:
-                self.ovsdb_data._process_new_physical_locators(
-                    self.context, fake_new_physical_locators)
-                self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
-                self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
-                                 'fake_ovsdb_id')
-                get_pl.assert_called_with(self.context, fake_dict)
-                add_pl.assert_called_with(self.context, fake_dict)
+        with mock.patch.object(lib, 'bulk_add_physical_locators') as add_pl:
+            self.ovsdb_data._process_new_physical_locators(
+                self.context, fake_new_physical_locators)
+            self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
+            self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
+                             'fake_ovsdb_id')
+            add_pl.assert_called_with(self.context,
+                                      fake_new_physical_locators)
 
     def test_process_new_local_macs(self):
         fake_dict = {'uuid': '123456',
@@ -327,32 +539,25 @@ class TestOVSDBData(base.BaseTestCase):
                      'ovsdb_identifier': 'host1',
                      'logical_switch_id': 'ls123'}
         fake_new_local_macs = [fake_dict]
-        with contextlib.nested(
-            mock.patch.object(lib, 'get_ucast_mac_local', return_value=None),
-            mock.patch.object(lib, 'add_ucast_mac_local')) as (
-                get_lm, add_lm):
+        with mock.patch.object(lib, 'bulk_add_ucast_macs_locals') as add_lm:
             self.ovsdb_data._process_new_local_macs(
                 self.context, fake_new_local_macs)
             self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
             self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
                              'fake_ovsdb_id')
-            get_lm.assert_called_with(self.context, fake_dict)
-            add_lm.assert_called_with(self.context, fake_dict)
+            self.assertEqual('ls123', fake_dict['logical_switch_uuid'])
+            add_lm.assert_called_with(self.context, fake_new_local_macs)
 
     def test_process_new_remote_macs(self):
         fake_dict = {'logical_switch_id': 'ls123'}
         fake_new_remote_macs = [fake_dict]
-        with mock.patch.object(lib, 'get_ucast_mac_remote',
-                               return_value=None) as get_mr:
-            with mock.patch.object(lib,
-                                   'add_ucast_mac_remote') as add_mr:
-                self.ovsdb_data._process_new_remote_macs(
-                    self.context, fake_new_remote_macs)
-                self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
-                self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
-                                 'fake_ovsdb_id')
-                get_mr.assert_called_with(self.context, fake_dict)
-                add_mr.assert_called_with(self.context, fake_dict)
+        with mock.patch.object(lib, 'bulk_add_ucast_macs_remotes') as add_mr:
+            self.ovsdb_data._process_new_remote_macs(
+                self.context, fake_new_remote_macs)
+            self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
+            self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
+                             'fake_ovsdb_id')
+            add_mr.assert_called_with(self.context, fake_new_remote_macs)
 
     def test_process_modified_remote_macs(self):
         fake_dict = {'logical_switch_id': 'ls123'}
@@ -367,23 +572,22 @@ class TestOVSDBData(base.BaseTestCase):
             update_mr.assert_called_with(self.context, fake_dict)
 
     def test_process_deleted_logical_switches(self):
-        fake_dict = {}
+        fake_dict = {'uuid': 'ls_uuid'}
         fake_deleted_logical_switches = [fake_dict]
-        with mock.patch.object(lib, 'delete_logical_switch') as delete_ls:
+        with mock.patch.object(lib,
+                               'bulk_delete_logical_switches') as delete_ls:
             self.ovsdb_data._process_deleted_logical_switches(
                 self.context, fake_deleted_logical_switches)
-            self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
-            self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
-                             'fake_ovsdb_id')
-            delete_ls.assert_called_with(self.context, fake_dict)
+            delete_ls.assert_called_with(self.context, 'fake_ovsdb_id',
+                                         ['ls_uuid'])
 
     def test_process_deleted_physical_switches(self):
-        fake_dict = {}
+        fake_dict = {'uuid': 'ps-uuid'}
         fake_deleted_physical_switches = [fake_dict]
         fake_ls_dict = {'uuid': 'ls-uuid'}
         fake_ls_list = [fake_ls_dict]
         with contextlib.nested(
-            mock.patch.object(lib, 'delete_physical_switch'),
+            mock.patch.object(lib, 'bulk_delete_physical_switches'),
             mock.patch.object(lib, 'get_all_physical_switches_by_ovsdb_id',
                               return_value=False),
             mock.patch.object(lib, 'get_all_logical_switches_by_ovsdb_id',
@@ -393,10 +597,8 @@ class TestOVSDBData(base.BaseTestCase):
                 delete_ps, get_ps, get_ls, del_network):
             self.ovsdb_data._process_deleted_physical_switches(
                 self.context, fake_deleted_physical_switches)
-            self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
-            self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
-                             'fake_ovsdb_id')
-            delete_ps.assert_called_with(self.context, fake_dict)
+            delete_ps.assert_called_with(self.context, 'fake_ovsdb_id',
+                                         ['ps-uuid'])
             get_ps.assert_called_with(self.context, 'fake_ovsdb_id')
             get_ls.assert_called_with(self.context, 'fake_ovsdb_id')
             del_network.assert_called_with(self.context, 'fake_ovsdb_id',
@@ -432,6 +634,46 @@ class TestOVSDBData(base.BaseTestCase):
             l2gw_conn_del.assert_called_with(self.context, 'fake_uuid')
             delete_pp.assert_called_with(self.context, fake_dict)
 
+    def test_process_deleted_physical_ports_not_found(self):
+        fake_deleted_physical_ports = [{'name': 'fake_name1'},
+                                       {'name': 'fake_name2'}]
+        with contextlib.nested(
+            mock.patch.object(lib, 'delete_physical_port'),
+            mock.patch.object(lib, 'get_physical_port',
+                              side_effect=[None, {'uuid': 'fake_uuid'}]),
+            mock.patch.object(lib, 'get_physical_switch'),
+            mock.patch.object(l2gateway_db.L2GatewayMixin,
+                              '_get_l2gw_ids_by_interface_switch',
+                              return_value=[]),
+            mock.patch.object(lib,
+                              'get_all_vlan_bindings_by_physical_port',
+                              return_value=[])
+        ) as (delete_pp, get_pp, get_ps, get_l2gw, get_vlan_by_pp):
+            self.ovsdb_data._process_deleted_physical_ports(
+                self.context, fake_deleted_physical_ports)
+            # The missing port is skipped, the next one is deleted.
+            delete_pp.assert_called_once_with(
+                self.context, fake_deleted_physical_ports[1])
+
+    def test_process_deleted_physical_switches_post_commit(self):
+        post_commit = []
+        with contextlib.nested(
+            mock.patch.object(lib, 'bulk_delete_physical_switches'),
+            mock.patch.object(lib, 'get_all_physical_switches_by_ovsdb_id',
+                              return_value=[]),
+            mock.patch.object(lib, 'get_all_logical_switches_by_ovsdb_id',
+                              return_value=[{'uuid': 'ls-uuid'}]),
+            mock.patch.object(self.ovsdb_data.agent_rpc,
+                              'delete_network')) as (
+                delete_ps, get_ps, get_ls, del_network):
+            self.ovsdb_data._process_deleted_physical_switches(
+                self.context, [{'uuid': 'ps-uuid'}], post_commit=post_commit)
+            self.assertFalse(del_network.called)
+            self.assertEqual(1, len(post_commit))
+            post_commit[0]()
+            del_network.assert_called_once_with(self.context,
+                                                'fake_ovsdb_id', 'ls-uuid')
+
     def test_process_deleted_physical_ports_with_delete_macs(self):
         fake_dict = {'uuid': 'fake_uuid', 'name': 'fake_name',
                      'logical_switch_id': 'fake_ls_id',
@@ -483,17 +725,94 @@ class TestOVSDBData(base.BaseTestCase):
             del_vlan.assert_called_with(self.context, vlan_binding_dict)
             get_vlan_by_ls.assert_called_with(self.context, vlan_binding_dict)
             del_macs.assert_called_with(self.context,
-                                        'fake_ls_id', 'fake_ovsdb_id')
+                                        'fake_ls_id', 'fake_ovsdb_id', None)
             del_vlan.assert_called_with(self.context, vlan_binding_dict)
             delete_pp.assert_called_with(self.context, fake_dict)
 
+    def _get_fake_fdb_entries(self, context, agent_ip, logical_switch_uuid):
+        return {'net-' + logical_switch_uuid: {
+            'segment_id': 100, 'network_type': 'vxlan',
+            'ports': {agent_ip: [constants.FLOODING_ENTRY]}}}
+
+    def test_handle_l2pop(self):
+        fake_remote_macs = [{'mac': 'mac1', 'logical_switch_id': 'ls1'},
+                            {'mac': 'mac2', 'logical_switch_id': 'ls1'},
+                            {'mac': 'mac3', 'logical_switch_id': 'ls2'}]
+        with contextlib.nested(
+            mock.patch.object(data.OVSDBData, '_get_physical_switch_ips',
+                              return_value=['3.3.3.3', '4.4.4.4']),
+            mock.patch.object(data.OVSDBData, '_get_fdb_entries',
+                              side_effect=self._get_fake_fdb_entries),
+            mock.patch.object(data.OVSDBData, '_trigger_l2pop_sync')
+        ) as (get_ps_ips, get_fdb, trig_l2pop):
+            self.ovsdb_data._handle_l2pop(self.context, fake_remote_macs)
+            # Each logical switch is looked up once.
+            self.assertEqual(2, get_ps_ips.call_count)
+            trig_l2pop.assert_called_once_with(
+                self.context,
+                {'net-ls1': {'segment_id': 100, 'network_type': 'vxlan',
+                             'ports': {'3.3.3.3': [constants.FLOODING_ENTRY],
+                                       '4.4.4.4': [constants.FLOODING_ENTRY]
+                                       }},
+                 'net-ls2': {'segment_id': 100, 'network_type': 'vxlan',
+                             'ports': {'3.3.3.3': [constants.FLOODING_ENTRY],
+                                       '4.4.4.4': [constants.FLOODING_ENTRY]
+                                       }}})
+
+    def test_get_physical_switch_ips_skips_missing_rows(self):
+        fake_vlan_bindings = [{'port_uuid': 'port1'}, {'port_uuid': 'port2'},
+                              {'port_uuid': 'port3'}]
+        fake_ports = {'port1': {'physical_switch_id': 'ps1'},
+                      'port3': {'physical_switch_id': 'ps3'}}
+        fake_switches = {'ps1': {'tunnel_ip': '3.3.3.3'}}
+
+        def get_physical_port(context, record_dict):
+            return fake_ports.get(record_dict['uuid'])
+
+        def get_physical_switch(context, record_dict):
+            return fake_switches.get(record_dict['uuid'])
+
+        with contextlib.nested(
+            mock.patch.object(lib, 'get_all_vlan_bindings_by_logical_switch',
+                              return_value=fake_vlan_bindings),
+            mock.patch.object(lib, 'get_physical_port',
+                              side_effect=get_physical_port),
+            mock.patch.object(lib, 'get_physical_switch',
+                              side_effect=get_physical_switch)):
+            self.assertEqual(['3.3.3.3'],
+                             self.ovsdb_data._get_physical_switch_ips(
+                                 self.context, {'logical_switch_id': 'ls1'}))
+
+    def test_handle_l2pop_with_missing_logical_switch(self):
+        with contextlib.nested(
+            mock.patch.object(data.OVSDBData, '_get_physical_switch_ips',
+                              return_value=['3.3.3.3']),
+            mock.patch.object(lib, 'get_logical_switch', return_value=None),
+            mock.patch.object(data.OVSDBData, '_trigger_l2pop_sync')
+        ) as (get_ps_ips, get_ls, trig_l2pop):
+            self.ovsdb_data._handle_l2pop(
+                self.context, [{'mac': 'mac1', 'logical_switch_id': 'ls1'}])
+            self.assertFalse(trig_l2pop.called)
+
+    def test_merge_fdb_entries(self):
+        fdb_entries = self._get_fake_fdb_entries(None, '1.1.1.1', 'ls1')
+        self.ovsdb_data._merge_fdb_entries(
+            fdb_entries, self._get_fake_fdb_entries(None, '1.1.1.1', 'ls1'))
+        self.ovsdb_data._merge_fdb_entries(
+            fdb_entries, self._get_fake_fdb_entries(None, '2.2.2.2', 'ls1'))
+        self.assertEqual(
+            {'net-ls1': {'segment_id': 100, 'network_type': 'vxlan',
+                         'ports': {'1.1.1.1': [constants.FLOODING_ENTRY],
+                                   '2.2.2.2': [constants.FLOODING_ENTRY]}}},
+            fdb_entries)
+
     def test_process_deleted_physical_locators(self):
         """Test case to test _process_deleted_physical_locators.
 
         for unicast rpc to the L2 agent
         """
-        fake_dict1 = {'dst_ip': '1.1.1.1'}
-        fake_dict2 = {'dst_ip': '2.2.2.2'}
+        fake_dict1 = {'uuid': 'pl1_uuid', 'dst_ip': '1.1.1.1'}
+        fake_dict2 = {'uuid': 'pl2_uuid', 'dst_ip': '2.2.2.2'}
         fake_deleted_physical_locators = [fake_dict2, fake_dict1]
         mock.patch.object(manager, 'NeutronManager').start()
         with contextlib.nested(
@@ -504,9 +823,10 @@ class TestOVSDBData(base.BaseTestCase):
                               'get_all_physical_switches_by_ovsdb_id',
                               return_value=[{'tunnel_ip': '3.3.3.3'}]),
             mock.patch.object(data.OVSDBData,
-                              '_get_fdb_entries'),
+                              '_get_fdb_entries',
+                              side_effect=self._get_fake_fdb_entries),
             mock.patch.object(lib,
-                              'delete_physical_locator'),
+                              'bulk_delete_physical_locators'),
             mock.patch.object(data.OVSDBData, '_get_agent_ips',
                               return_value={'1.1.1.1': 'hostname'}),
             mock.patch.object(data.OVSDBData, '_trigger_l2pop_delete')
@@ -514,24 +834,26 @@ class TestOVSDBData(base.BaseTestCase):
               trig_l2pop):
             self.ovsdb_data._process_deleted_physical_locators(
                 self.context, fake_deleted_physical_locators)
-            self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict1)
             self.assertTrue(get_ls.called)
             self.assertTrue(get_all_ps.called)
             self.assertTrue(get_fdb.called)
-            self.assertEqual(fake_dict1[n_const.OVSDB_IDENTIFIER],
-                             'fake_ovsdb_id')
-            delete_pl.assert_called_with(self.context, fake_dict1)
+            delete_pl.assert_called_once_with(self.context, 'fake_ovsdb_id',
+                                              ['pl2_uuid', 'pl1_uuid'])
             self.assertTrue(get_agent_ips.called)
-            trig_l2pop.assert_called_with(self.context,
-                                          mock.ANY,
-                                          'hostname')
+            self.assertEqual(
+                [mock.call(self.context,
+                           self._get_fake_fdb_entries(None, '3.3.3.3', '1'),
+                           'hostname'),
+                 mock.call(self.context,
+                           self._get_fake_fdb_entries(None, '2.2.2.2', '1'))],
+                trig_l2pop.call_args_list)
 
     def test_process_deleted_physical_locators1(self):
         """Test case to test _process_deleted_physical_locators.
 
         for broadcast rpc to the L2 agents
         """
-        fake_dict1 = {'dst_ip': '1.1.1.1'}
+        fake_dict1 = {'uuid': 'pl1_uuid', 'dst_ip': '1.1.1.1'}
         fake_deleted_physical_locators = [fake_dict1]
         mock.patch.object(manager, 'NeutronManager').start()
         with contextlib.nested(
@@ -542,9 +864,10 @@ class TestOVSDBData(base.BaseTestCase):
                               'get_all_physical_switches_by_ovsdb_id',
                               return_value=[{'tunnel_ip': '3.3.3.3'}]),
             mock.patch.object(data.OVSDBData,
-                              '_get_fdb_entries'),
+                              '_get_fdb_entries',
+                              side_effect=self._get_fake_fdb_entries),
             mock.patch.object(lib,
-                              'delete_physical_locator'),
+                              'bulk_delete_physical_locators'),
             mock.patch.object(data.OVSDBData, '_get_agent_ips',
                               return_value={'2.2.2.2': 'hostname'}),
             mock.patch.object(data.OVSDBData, '_trigger_l2pop_delete')
@@ -552,13 +875,11 @@ class TestOVSDBData(base.BaseTestCase):
               trig_l2pop):
             self.ovsdb_data._process_deleted_physical_locators(
                 self.context, fake_deleted_physical_locators)
-            self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict1)
             self.assertTrue(get_ls.called)
             self.assertTrue(get_all_ps.called)
             self.assertTrue(get_fdb.called)
-            self.assertEqual(fake_dict1[n_const.OVSDB_IDENTIFIER],
-                             'fake_ovsdb_id')
-            delete_pl.assert_called_once_with(self.context, fake_dict1)
+            delete_pl.assert_called_once_with(self.context, 'fake_ovsdb_id',
+                                              ['pl1_uuid'])
             self.assertTrue(get_agent_ips.called)
             trig_l2pop.assert_called_with(self.context,
                                           mock.ANY)
@@ -569,27 +890,22 @@ class TestOVSDBData(base.BaseTestCase):
                      'ovsdb_identifier': 'host1',
                      'logical_switch_id': 'ls123'}
         fake_deleted_local_macs = [fake_dict]
-        with mock.patch.object(lib, 'delete_ucast_mac_local') as delete_ml:
-            with mock.patch.object(lib,
-                                   'get_ucast_mac_remote_by_mac_and_ls',
-                                   return_value=True):
-                self.ovsdb_data._process_deleted_local_macs(
-                    self.context, fake_deleted_local_macs)
-                self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
-                self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
-                                 'fake_ovsdb_id')
-                delete_ml.assert_called_with(self.context, fake_dict)
+        with mock.patch.object(lib,
+                               'bulk_delete_ucast_macs_locals') as delete_ml:
+            self.ovsdb_data._process_deleted_local_macs(
+                self.context, fake_deleted_local_macs)
+            delete_ml.assert_called_with(self.context, 'fake_ovsdb_id',
+                                         ['123456'])
 
     def test_process_deleted_remote_macs(self):
-        fake_dict = {}
+        fake_dict = {'uuid': 'mac_uuid'}
         fake_deleted_remote_macs = [fake_dict]
-        with mock.patch.object(lib, 'delete_ucast_mac_remote') as delete_mr:
+        with mock.patch.object(lib,
+                               'bulk_delete_ucast_macs_remotes') as delete_mr:
             self.ovsdb_data._process_deleted_remote_macs(
                 self.context, fake_deleted_remote_macs)
-            self.assertIn(n_const.OVSDB_IDENTIFIER, fake_dict)
-            self.assertEqual(fake_dict[n_const.OVSDB_IDENTIFIER],
-                             'fake_ovsdb_id')
-            delete_mr.assert_called_with(self.context, fake_dict)
+            delete_mr.assert_called_with(self.context, 'fake_ovsdb_id',
+                                         ['mac_uuid'])
 
     def test_process_modified_physical_ports(self):
         fake_dict1 = {}
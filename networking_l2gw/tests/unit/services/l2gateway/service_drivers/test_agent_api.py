@@ -63,6 +63,80 @@ class TestL2GatewayAgentApi(base.BaseTestCase):
             locator_dict=fake_physical_locator,
             mac_dict=fake_mac_remote)
 
+    def test_add_vifs_to_gateway(self):
+        cctxt = mock.Mock()
+        fake_ovsdb_identifier = 'fake_ovsdb_id'
+        fake_ls_vifs = [{'logical_switch_dict': {},
+                         'vifs': [{'locator_dict': {}, 'mac_dict': {}}]}]
+        self.plugin_rpc.client.prepare.return_value = cctxt
+        self.plugin_rpc.add_vifs_to_gateway(
+            self.context, fake_ovsdb_identifier, fake_ls_vifs)
+        self.plugin_rpc.client.prepare.assert_called_with(version='1.1')
+        cctxt.call.assert_called_with(
+            self.context, 'add_vifs_to_gateway',
+            ovsdb_identifier=fake_ovsdb_identifier,
+            logical_switch_vifs=fake_ls_vifs)
+
+    def test_add_vifs_to_gateway_without_version_1_1(self):
+        fake_ls_vifs = [{'logical_switch_dict': 'ls1',
+                         'vifs': [{'locator_dict': 'loc1', 'mac_dict': 'mac1'},
+                                  {'locator_dict': 'loc2',
+                                   'mac_dict': 'mac2'}]}]
+        self.plugin_rpc.client.can_send_version.return_value = False
+        with mock.patch.object(self.plugin_rpc, 'add_vif_to_gateway',
+                               side_effect=[None, Exception('fake_error')]
+                               ) as add_vif:
+            errors = self.plugin_rpc.add_vifs_to_gateway(
+                self.context, 'fake_ovsdb_id', fake_ls_vifs)
+            self.assertEqual([mock.call(self.context, 'fake_ovsdb_id', 'ls1',
+                                        'loc1', 'mac1'),
+                              mock.call(self.context, 'fake_ovsdb_id', 'ls1',
+                                        'loc2', 'mac2')],
+                             add_vif.call_args_list)
+            self.assertEqual([None, 'fake_error'], errors)
+
+    def test_update_vifs_to_gateway_with_unsupported_version(self):
+        cctxt = mock.Mock()
+        cctxt.call.side_effect = messaging.RemoteError(
+            exc_type='UnsupportedVersion')
+        self.plugin_rpc.client.prepare.return_value = cctxt
+        fake_vifs = [{'locator_dict': 'loc1', 'mac_dict': 'mac1'}]
+        with mock.patch.object(self.plugin_rpc,
+                               'update_vif_to_gateway') as update_vif:
+            errors = self.plugin_rpc.update_vifs_to_gateway(
+                self.context, 'fake_ovsdb_id', fake_vifs)
+            update_vif.assert_called_once_with(self.context, 'fake_ovsdb_id',
+                                               'loc1', 'mac1')
+            self.assertEqual([None], errors)
+
+    def test_add_vifs_to_gateway_with_op_id(self):
+        cctxt = mock.Mock()
+        fake_ovsdb_identifier = 'fake_ovsdb_id'
+        fake_ls_vifs = []
+        self.plugin_rpc.client.prepare.return_value = cctxt
+        self.plugin_rpc.add_vifs_to_gateway(
+            self.context, fake_ovsdb_identifier, fake_ls_vifs,
+            op_id='fake_op_id')
+        self.plugin_rpc.client.prepare.assert_called_with(version='1.2')
+        cctxt.cast.assert_called_with(
+            self.context, 'add_vifs_to_gateway',
+            ovsdb_identifier=fake_ovsdb_identifier,
+            logical_switch_vifs=fake_ls_vifs,
+            op_id='fake_op_id')
+
+    def test_update_vifs_to_gateway(self):
+        cctxt = mock.Mock()
+        fake_ovsdb_identifier = 'fake_ovsdb_id'
+        fake_vifs = [{'locator_dict': {}, 'mac_dict': {}}]
+        self.plugin_rpc.client.prepare.return_value = cctxt
+        self.plugin_rpc.update_vifs_to_gateway(
+            self.context, fake_ovsdb_identifier, fake_vifs)
+        self.plugin_rpc.client.prepare.assert_called_with(version='1.1')
+        cctxt.call.assert_called_with(
+            self.context, 'update_vifs_to_gateway',
+            ovsdb_identifier=fake_ovsdb_identifier,
+            vifs=fake_vifs)
+
     def test_update_vif_to_gateway(self):
         cctxt = mock.Mock()
         fake_ovsdb_identifier = 'fake_ovsdb_id'
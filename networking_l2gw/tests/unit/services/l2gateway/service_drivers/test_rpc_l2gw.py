@@ -21,6 +21,8 @@ from neutron.db import agents_db
 from neutron.tests import base
 
 from networking_l2gw.db.l2gateway.ovsdb import lib as db
+from networking_l2gw.services.l2gateway.common import agent_tunnel_ips
+from networking_l2gw.services.l2gateway.common import connected_networks
 from networking_l2gw.services.l2gateway.common import l2gw_validators
 from networking_l2gw.services.l2gateway.common import ovsdb_schema
 from networking_l2gw.services.l2gateway import exceptions as l2gw_exc
@@ -28,6 +30,7 @@ from networking_l2gw.services.l2gateway.ovsdb import data
 from networking_l2gw.services.l2gateway.service_drivers import agent_api
 from networking_l2gw.services.l2gateway.service_drivers import rpc_l2gw
 
+from oslo_config import cfg
 from oslo_utils import importutils
 
 
@@ -41,6 +44,8 @@ class TestL2gwRpcDriver(base.BaseTestCase):
         self.service_plugin._get_driver_for_provider.return_value = load_driver
         self.plugin = rpc_l2gw.L2gwRpcDriver(self.service_plugin)
         self.plugin.agent_rpc = mock.MagicMock()
+        mock.patch.object(agent_tunnel_ips, '_cache', None).start()
+        mock.patch.object(connected_networks, '_cache', None).start()
         self.ovsdb_identifier = 'fake_ovsdb_id'
         self.ovsdb_data = data.OVSDBData(self.ovsdb_identifier)
         self.context = mock.ANY
@@ -262,21 +267,22 @@ class TestL2gwRpcDriver(base.BaseTestCase):
     def test_get_ip_details(self):
         fake_port = {'binding:host_id': 'fake_host',
                      'fixed_ips': [{'ip_address': 'fake_ip'}]}
-        fake_agent = [{'configurations': {'tunneling_ip': 'fake_tun_ip'}}]
-        with mock.patch.object(self.plugin,
-                               '_get_agent_details',
-                               return_value=fake_agent) as get_agent:
+        with mock.patch.object(agent_tunnel_ips.AgentTunnelIpCache,
+                               'get_tunneling_ip',
+                               return_value='fake_tun_ip') as get_ip:
             (ret_dst_ip, ret_ip_add) = self.plugin._get_ip_details(
                 self.context, fake_port)
-            get_agent.assert_called_with(self.context, 'fake_host')
+            get_ip.assert_called_with(self.context,
+                                      self.service_plugin._core_plugin,
+                                      'fake_host')
             self.assertEqual(ret_dst_ip, 'fake_tun_ip')
             self.assertEqual(ret_ip_add, 'fake_ip')
 
     def test_get_ip_details_for_no_ovs_agent(self):
         fake_port = {'binding:host_id': 'fake_host',
                      'fixed_ips': [{'ip_address': 'fake_ip'}]}
-        with mock.patch.object(self.plugin,
-                               '_get_agent_details',
+        with mock.patch.object(agent_tunnel_ips.AgentTunnelIpCache,
+                               'get_tunneling_ip',
                                return_value=None):
             self.assertRaises(l2gw_exc.OvsAgentNotFound,
                               self.plugin._get_ip_details,
@@ -302,12 +308,6 @@ class TestL2gwRpcDriver(base.BaseTestCase):
         (self.service_plugin._core_plugin.get_ports.
          return_value) = fake_port_list
 
-    def test_get_agent_details(self):
-        fake_agent = [{'configurations': {'tunneling_ip': 'fake_tun_ip'}}]
-        core_plugin = mock.PropertyMock()
-        type(self.service_plugin)._core_plugin = core_plugin
-        (self.service_plugin._core_plugin.get_agents.return_value) = fake_agent
-
     def test_get_logical_switch_dict(self):
         fake_logical_switch = {'uuid': 'fake_uuid',
                                'name': 'fake_network_id'}
@@ -412,35 +412,6 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                               fake_connection)
             get_network.assert_called_with(self.context, 'fake_network_id')
 
-    def test_get_locator_list(self):
-        fake_dst_ip = 'fake_tun_ip'
-        fake_ovsdb_id = 'fake_ovsdb_id'
-        fake_mac_list = []
-        fake_locator_list = []
-        fake_locator_dict = {'uuid': 'fake_uuid',
-                             'dst_ip': 'fake_tun_ip',
-                             'ovsdb_identifier': 'fake_ovsdb_id',
-                             'macs': []}
-        fake_pl = {'uuid': 'fake_uuid',
-                   'dst_ip': 'fake_tun_ip'}
-        fale_pl_list = [fake_locator_dict]
-        with contextlib.nested(
-            mock.patch.object(db,
-                              'get_physical_locator_by_dst_ip',
-                              return_value=fake_pl),
-            mock.patch.object(self.plugin,
-                              '_get_physical_locator_dict',
-                              return_value=fake_locator_dict)) as (
-                get_pl_by_dst_ip, get_pl_dict):
-            ret_pl_list = self.plugin._get_locator_list(
-                self.context, fake_dst_ip, fake_ovsdb_id,
-                fake_mac_list, fake_locator_list)
-            get_pl_by_dst_ip.assert_called_with(self.context,
-                                                fake_locator_dict)
-            get_pl_dict.assert_called_with(fake_dst_ip,
-                                           'fake_uuid', fake_mac_list)
-            self.assertEqual(ret_pl_list, fale_pl_list)
-
     def test_get_identifer_list(self):
         fake_connection = {'l2_gateway_id': 'fake_l2gw_id',
                            'network_id': 'fake_network_id',
@@ -512,7 +483,8 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                              'name': 'fake_name',
                              'id': 'fake_network_id'}
         fake_conn_dict = {'id': 'fake_conn_id',
-                          'l2_gateway_id': 'fake_gateway_id'}
+                          'l2_gateway_id': 'fake_gateway_id',
+                          'network_id': 'fake_network_id'}
         fake_conn_list = [fake_conn_dict]
         fake_logical_switch = {'ovsdb_identifier': 'fake_ovsdb_id',
                                'uuid': 'fake_network_id',
@@ -559,9 +531,9 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                               'get_ucast_mac_remote_by_mac_and_ls',
                               return_value=False),
             mock.patch.object(self.plugin.agent_rpc,
-                              'add_vif_to_gateway'),
+                              'add_vifs_to_gateway'),
             mock.patch.object(self.plugin.agent_rpc,
-                              'update_vif_to_gateway'),
+                              'update_vifs_to_gateway'),
             mock.patch.object(db,
                               'get_all_logical_switches_by_name',
                               return_value=fake_logical_switch_list)) as (
@@ -576,7 +548,7 @@ class TestL2gwRpcDriver(base.BaseTestCase):
             self.plugin.add_port_mac(self.context, fake_dict)
             get_network.assert_called_with(self.context, 'fake_network_id')
             get_l2gw_conn.assert_called_with(
-                self.context, filters={'network_id': ['fake_network_id']})
+                self.context, fields=['network_id'])
             get_pl.assert_called_with(self.context, fake_pl_dict)
             get_ucast_mac.assert_called_with(self.context, fake_dict)
             get_dict.assert_called_with(remote_mac)
@@ -588,9 +560,78 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                 ip_address=fake_ip2)
             add_rpc.assert_called_with(
                 self.context, ovsdb_identifier,
-                fake_logical_switch, fake_locator_dict, fake_dict)
+                [{'logical_switch_dict': fake_logical_switch,
+                  'vifs': [{'locator_dict': fake_locator_dict,
+                            'mac_dict': fake_dict}]}])
             self.assertFalse(update_rpc.called)
 
+    def test_add_port_mac_of_unconnected_network(self):
+        fake_port = {'id': 'fake_port_id',
+                     'device_owner': 'fake_owner',
+                     'network_id': 'fake_network_id',
+                     'mac_address': 'fake_mac',
+                     'binding:host_id': 'fake_host'}
+        core_plugin = mock.PropertyMock()
+        type(self.service_plugin)._core_plugin = core_plugin
+        with contextlib.nested(
+            mock.patch.object(self.service_plugin,
+                              'get_l2_gateway_connections',
+                              return_value=[]),
+            mock.patch.object(self.plugin, '_get_ip_details')) as (
+                get_l2gw_conn, get_ip):
+            self.plugin.add_port_mac(self.context, fake_port)
+            # The port of the event is not read again.
+            self.assertFalse(
+                self.service_plugin._core_plugin.get_port.called)
+            self.assertTrue(get_l2gw_conn.called)
+            self.assertFalse(get_ip.called)
+            self.assertFalse(self.plugin.agent_rpc.add_vifs_to_gateway.called)
+
+    def test_add_port_macs(self):
+        fake_ports = [{'id': 'port%d' % i,
+                       'device_owner': 'fake_owner',
+                       'network_id': 'fake_network_id',
+                       'mac_address': 'fake_mac%d' % i,
+                       'binding:host_id': 'host%d' % i} for i in range(3)]
+        fake_logical_switch = {'ovsdb_identifier': 'fake_ovsdb_id',
+                               'uuid': 'fake_ls_id'}
+        fake_locator = {'uuid': 'fake_locator_id', 'dst_ip': 'fake_ip'}
+
+        def get_ip_details(context, port):
+            if port['id'] == 'port1':
+                raise l2gw_exc.OvsAgentNotFound(host=port['binding:host_id'])
+            return 'fake_ip', 'fake_vm_ip'
+
+        with contextlib.nested(
+            mock.patch.object(self.service_plugin,
+                              'get_l2_gateway_connections',
+                              return_value=[{'network_id':
+                                             'fake_network_id'}]),
+            mock.patch.object(db, 'get_all_logical_switches_by_name',
+                              return_value=[fake_logical_switch]),
+            mock.patch.object(self.plugin, '_get_ip_details',
+                              side_effect=get_ip_details),
+            mock.patch.object(self.plugin, '_get_network_details',
+                              return_value={'name': 'fake_name'}),
+            mock.patch.object(self.plugin, '_form_physical_locator_schema',
+                              return_value=fake_locator),
+            mock.patch.object(db, 'get_ucast_mac_remote_by_mac_and_ls',
+                              return_value=None),
+            mock.patch.object(self.plugin, '_add_vifs_to_gateway')) as (
+                get_l2gw_conn, get_all_ls, get_ip, get_network, get_pl,
+                get_ucast_mac, add_vifs):
+            self.plugin.add_port_macs(self.context, fake_ports)
+            # The network is read once for the ports of the batch.
+            self.assertEqual(1, get_network.call_count)
+            add_vifs.assert_called_once_with(self.context, 'fake_ovsdb_id',
+                                             mock.ANY)
+            logical_switch_vifs = add_vifs.call_args[0][2]
+            self.assertEqual(1, len(logical_switch_vifs))
+            self.assertEqual(
+                ['fake_mac0', 'fake_mac2'],
+                [vif['mac_dict']['mac']
+                 for vif in logical_switch_vifs[0]['vifs']])
+
     def test_delete_port_mac_for_multiple_vlan_bindings(self):
         fake_port_list = [{'network_id': 'fake_network_id',
                            'device_owner': 'fake_owner',
@@ -638,7 +679,8 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                              'name': 'fake_name',
                              'id': 'fake_network_id'}
         fake_conn_dict = {'id': 'fake_conn_id',
-                          'l2_gateway_id': 'fake_gateway_id'}
+                          'l2_gateway_id': 'fake_gateway_id',
+                          'network_id': 'fake_network_id'}
         fake_conn_list = [fake_conn_dict]
         fake_logical_switch = {'ovsdb_identifier': 'fake_ovsdb_id',
                                'uuid': 'fake_network_id',
@@ -685,10 +727,10 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                               'get_ucast_mac_remote_by_mac_and_ls',
                               return_value=False),
             mock.patch.object(self.plugin.agent_rpc,
-                              'add_vif_to_gateway',
+                              'add_vifs_to_gateway',
                               side_effect=RuntimeError),
             mock.patch.object(self.plugin.agent_rpc,
-                              'update_vif_to_gateway'),
+                              'update_vifs_to_gateway'),
             mock.patch.object(db, 'add_pending_ucast_mac_remote'),
             mock.patch.object(db, 'get_all_logical_switches_by_name',
                               return_value=fake_logical_switch_list)
@@ -703,13 +745,16 @@ class TestL2gwRpcDriver(base.BaseTestCase):
             self.plugin.add_port_mac(self.context, fake_dict)
             get_network.assert_called_with(mock.ANY, mock.ANY)
             self.service_plugin.get_l2_gateway_connections.assert_called_with(
-                mock.ANY, filters=mock.ANY)
+                mock.ANY, filters={'network_id': ['fake_network_id']},
+                fields=['network_id'])
             get_pl.assert_called_with(self.context, fake_pl_dict)
             get_dict.assert_called_with(remote_mac)
             get_ucast_mac.assert_called_with(self.context, fake_dict)
             add_rpc.assert_called_with(
                 self.context, ovsdb_identifier,
-                fake_logical_switch, fake_locator_dict, fake_dict)
+                [{'logical_switch_dict': fake_logical_switch,
+                  'vifs': [{'locator_dict': fake_locator_dict,
+                            'mac_dict': fake_dict}]}])
             self.assertFalse(update_rpc.called)
             self.assertTrue(add_pending_mac.called)
 
@@ -720,7 +765,8 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                              'name': 'fake_name',
                              'id': 'fake_network_id'}
         fake_conn_dict = {'id': 'fake_conn_id',
-                          'l2_gateway_id': 'fake_gateway_id'}
+                          'l2_gateway_id': 'fake_gateway_id',
+                          'network_id': 'fake_network_id'}
         fake_conn_list = [fake_conn_dict]
         fake_logical_switch = {'ovsdb_identifier': 'fake_ovsdb_id',
                                'uuid': 'fake_network_id',
@@ -767,9 +813,9 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                               'get_ucast_mac_remote_by_mac_and_ls',
                               return_value=fake_mac_dict),
             mock.patch.object(self.plugin.agent_rpc,
-                              'add_vif_to_gateway'),
+                              'add_vifs_to_gateway'),
             mock.patch.object(self.plugin.agent_rpc,
-                              'update_vif_to_gateway'),
+                              'update_vifs_to_gateway'),
             mock.patch.object(db,
                               'get_all_logical_switches_by_name',
                               return_value=fake_logical_switch_list)) as (
@@ -779,13 +825,13 @@ class TestL2gwRpcDriver(base.BaseTestCase):
             self.plugin.add_port_mac(self.context, fake_dict)
             get_network.assert_called_with(self.context, 'fake_network_id')
             get_l2gw_conn.assert_called_with(
-                self.context, filters={'network_id': ['fake_network_id']})
+                self.context, fields=['network_id'])
             get_pl.assert_called_with(self.context, fake_pl_dict)
             get_ucast_mac.assert_called_with(self.context, fake_dict)
             self.assertFalse(add_rpc.called)
             update_rpc.assert_called_with(
                 self.context, ovsdb_identifier,
-                fake_locator_dict, fake_dict)
+                [{'locator_dict': fake_locator_dict, 'mac_dict': fake_dict}])
 
     def test_add_port_mac_vm_migrate_with_ovsdb_server_down(self):
         "Test case to test update_port_mac when the OVSDB server is down."
@@ -795,7 +841,8 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                              'name': 'fake_name',
                              'id': 'fake_network_id'}
         fake_conn_dict = {'id': 'fake_conn_id',
-                          'l2_gateway_id': 'fake_gateway_id'}
+                          'l2_gateway_id': 'fake_gateway_id',
+                          'network_id': 'fake_network_id'}
         fake_conn_list = [fake_conn_dict]
         fake_logical_switch = {'ovsdb_identifier': 'fake_ovsdb_id',
                                'uuid': 'fake_network_id',
@@ -841,9 +888,9 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                               'get_ucast_mac_remote_by_mac_and_ls',
                               return_value=fake_mac_dict),
             mock.patch.object(self.plugin.agent_rpc,
-                              'add_vif_to_gateway'),
+                              'add_vifs_to_gateway'),
             mock.patch.object(self.plugin.agent_rpc,
-                              'update_vif_to_gateway',
+                              'update_vifs_to_gateway',
                               side_effect=RuntimeError),
             mock.patch.object(db, 'add_pending_ucast_mac_remote'),
             mock.patch.object(db, 'get_all_logical_switches_by_name',
@@ -854,13 +901,103 @@ class TestL2gwRpcDriver(base.BaseTestCase):
             self.plugin.add_port_mac(self.context, fake_dict)
             get_network.assert_called_with(self.context, 'fake_network_id')
             get_l2gw_conn.assert_called_with(
-                self.context, filters={'network_id': ['fake_network_id']})
+                self.context, fields=['network_id'])
             get_pl.assert_called_with(self.context, fake_pl_dict)
             get_ucast_mac.assert_called_with(self.context, fake_dict)
             self.assertFalse(add_rpc.called)
             self.assertTrue(update_rpc.called)
             self.assertTrue(add_pending_mac.called)
 
+    def test_add_vifs_to_gateway_with_partial_failure(self):
+        "Test case to test only the failed MACs are left pending."
+        fake_ls = {'uuid': 'fake_ls_uuid'}
+        fake_locator = {'uuid': 'fake_locator_id'}
+        fake_vifs = [{'locator_dict': fake_locator,
+                      'mac_dict': {'mac': 'fake_mac1'}},
+                     {'locator_dict': fake_locator,
+                      'mac_dict': {'mac': 'fake_mac2'}}]
+        ls_vifs = [{'logical_switch_dict': fake_ls, 'vifs': fake_vifs}]
+        with contextlib.nested(
+            mock.patch.object(self.plugin.agent_rpc,
+                              'add_vifs_to_gateway',
+                              return_value=[None, 'fake_error']),
+            mock.patch.object(db, 'add_pending_ucast_mac_remote')
+        ) as (add_rpc, add_pending_mac):
+            self.plugin._add_vifs_to_gateway(self.context, 'fake_ovsdb_id',
+                                             ls_vifs)
+            add_rpc.assert_called_with(self.context, 'fake_ovsdb_id',
+                                       ls_vifs)
+            add_pending_mac.assert_called_once_with(
+                self.context, 'insert', 'fake_ovsdb_id', 'fake_ls_uuid',
+                fake_locator, [{'mac': 'fake_mac2'}])
+
+    def test_add_vifs_to_gateway_async(self):
+        "Test case to test the MACs are cast and kept in the outbox."
+        cfg.CONF.set_override('async_mac_programming', True)
+        fake_ls = {'uuid': 'fake_ls_uuid'}
+        fake_locator = {'uuid': 'fake_locator_id'}
+        fake_mac = {'mac': 'fake_mac1'}
+        ls_vifs = [{'logical_switch_dict': fake_ls,
+                    'vifs': [{'locator_dict': fake_locator,
+                              'mac_dict': fake_mac}]}]
+        with contextlib.nested(
+            mock.patch.object(self.plugin.agent_rpc,
+                              'add_vifs_to_gateway'),
+            mock.patch.object(db, 'add_outbox_ucast_mac_remotes'),
+            mock.patch.object(db, 'complete_outbox_ucast_mac_remotes'),
+            mock.patch.object(db, 'add_pending_ucast_mac_remote')
+        ) as (add_rpc, add_outbox, complete_outbox, add_pending_mac):
+            self.plugin._add_vifs_to_gateway(self.context, 'fake_ovsdb_id',
+                                             ls_vifs)
+            add_outbox.assert_called_with(
+                self.context, mock.ANY, 'insert', 'fake_ovsdb_id',
+                [('fake_ls_uuid', fake_locator, fake_mac)])
+            op_id = add_outbox.call_args[0][1]
+            add_rpc.assert_called_with(self.context, 'fake_ovsdb_id',
+                                       ls_vifs, op_id=op_id)
+            self.assertFalse(complete_outbox.called)
+            self.assertFalse(add_pending_mac.called)
+
+    def test_cast_vif_operation_to_agent_not_upgraded(self):
+        "Test case to test the MAC changes are called on old agents."
+        self.plugin.agent_rpc.can_cast_vif_operations.return_value = False
+        with contextlib.nested(
+            mock.patch.object(self.plugin.agent_rpc,
+                              'delete_vif_from_gateway', return_value=None),
+            mock.patch.object(db, 'add_outbox_ucast_mac_remotes'),
+            mock.patch.object(db, 'complete_outbox_ucast_mac_remotes')
+        ) as (delete_rpc, add_outbox, complete_outbox):
+            self.plugin._cast_vif_operation(
+                self.context, 'delete', 'fake_ovsdb_id',
+                [('fake_ls_uuid', None, 'fake_mac')],
+                self.plugin.agent_rpc.delete_vif_from_gateway,
+                'fake_ls_uuid', ['fake_mac'])
+            op_id = add_outbox.call_args[0][1]
+            delete_rpc.assert_called_with(self.context, 'fake_ovsdb_id',
+                                          'fake_ls_uuid', ['fake_mac'])
+            complete_outbox.assert_called_with(self.context, op_id, [None])
+
+    def test_delete_vif_async_with_cast_failure(self):
+        "Test case to test a failed cast moves the MACs to pending."
+        cfg.CONF.set_override('async_mac_programming', True)
+        with contextlib.nested(
+            mock.patch.object(self.plugin.agent_rpc,
+                              'delete_vif_from_gateway',
+                              side_effect=RuntimeError),
+            mock.patch.object(db, 'add_outbox_ucast_mac_remotes'),
+            mock.patch.object(db, 'complete_outbox_ucast_mac_remotes')
+        ) as (delete_rpc, add_outbox, complete_outbox):
+            self.plugin._cast_vif_operation(
+                self.context, 'delete', 'fake_ovsdb_id',
+                [('fake_ls_uuid', None, 'fake_mac')],
+                self.plugin.agent_rpc.delete_vif_from_gateway,
+                'fake_ls_uuid', ['fake_mac'])
+            op_id = add_outbox.call_args[0][1]
+            delete_rpc.assert_called_with(self.context, 'fake_ovsdb_id',
+                                          'fake_ls_uuid', ['fake_mac'],
+                                          op_id=op_id)
+            complete_outbox.assert_called_with(self.context, op_id)
+
     def test_add_port_mac_tunnel_recreation(self):
         "Test case to test recreation of tunnels"
         "when the openvswitch agent is restarted."
@@ -870,7 +1007,8 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                              'name': 'fake_name',
                              'id': 'fake_network_id'}
         fake_conn_dict = {'id': 'fake_conn_id',
-                          'l2_gateway_id': 'fake_gateway_id'}
+                          'l2_gateway_id': 'fake_gateway_id',
+                          'network_id': 'fake_network_id'}
         fake_conn_list = [fake_conn_dict]
         fake_logical_switch = {'ovsdb_identifier': 'fake_ovsdb_id',
                                'uuid': 'fake_network_id',
@@ -916,7 +1054,7 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                               'get_ucast_mac_remote_by_mac_and_ls',
                               return_value=fake_mac_dict),
             mock.patch.object(agent_api.L2gatewayAgentApi,
-                              'add_vif_to_gateway'),
+                              'add_vifs_to_gateway'),
             mock.patch.object(data.L2GatewayOVSDBCallbacks,
                               'get_ovsdbdata_object'),
             mock.patch.object(db,
@@ -928,7 +1066,7 @@ class TestL2gwRpcDriver(base.BaseTestCase):
             self.plugin.add_port_mac(self.context, fake_dict)
             get_network.assert_called_with(self.context, 'fake_network_id')
             get_l2gw_conn.assert_called_with(
-                self.context, filters={'network_id': ['fake_network_id']})
+                self.context, fields=['network_id'])
             get_pl.assert_called_with(self.context, fake_pl_dict)
             get_ucast_mac.assert_called_with(self.context, fake_dict)
             self.assertFalse(add_rpc.called)
@@ -959,7 +1097,7 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                               'delete_vif_from_gateway'),
             mock.patch.object(self.service_plugin,
                               'get_l2_gateway_connections',
-                              return_value=True),
+                              return_value=[{'network_id': network_id}]),
             mock.patch.object(db,
                               'get_all_vlan_bindings_by_logical_switch',
                               return_value=[1])) as (
@@ -1009,6 +1147,31 @@ class TestL2gwRpcDriver(base.BaseTestCase):
             delete_rpc.assert_called_with(
                 self.context, 'fake_ovsdb_id', 'fake_uuid', ['fake_mac'])
 
+    def test_delete_port_mac_async_on_several_ovsdb_servers(self):
+        cfg.CONF.set_override('async_mac_programming', True)
+        fake_port = {'network_id': 'fake_network_id',
+                     'device_owner': 'fake_owner',
+                     'mac_address': 'fake_mac'}
+        fake_logical_switches = [{'uuid': 'ls1', 'ovsdb_identifier': 'ovsdb1'},
+                                 {'uuid': 'ls2', 'ovsdb_identifier': 'ovsdb2'}]
+        with contextlib.nested(
+            mock.patch.object(connected_networks, 'get_cache'),
+            mock.patch.object(db, 'get_all_vlan_bindings_by_logical_switch',
+                              return_value=[1]),
+            mock.patch.object(db, 'get_ucast_mac_remote_by_mac_and_ls',
+                              return_value=True),
+            mock.patch.object(self.plugin, '_cast_vif_operation')) as (
+                get_cache, get_vlan_binding, get_mac, cast_vif):
+            get_cache.return_value.get_logical_switches.return_value = (
+                fake_logical_switches)
+            self.plugin.delete_port_mac(self.context, fake_port)
+            # Each MAC is deleted from the OVSDB server of its logical
+            # switch.
+            self.assertEqual(
+                sorted([('ovsdb1', 'ls1'), ('ovsdb2', 'ls2')]),
+                sorted((call[0][2], call[0][5])
+                       for call in cast_vif.call_args_list))
+
     def test_delete_port_mac_with_ovsdb_server_down(self):
         "Test case to test delete_port_mac when the OVSDB server is down."
         fake_port_list = [{'network_id': 'fake_network_id',
@@ -1232,10 +1395,7 @@ class TestL2gwRpcDriver(base.BaseTestCase):
         fake_device_list = [fake_device_dict]
         fake_ls_dict = {'logical_switch_name': 'fake_network_id',
                         'ovsdb_identifier': 'fake_ovsdb_id'}
-        fake_pl_dict = {'uuid': 'fake_uuid', 'dst_ip': 'fake_ip1',
-                        'ovsdb_identifier': 'fake_ovsdb_id',
-                        'macs': [fake_port]}
-        fake_pl_list = [fake_pl_dict]
+        fake_locator = {'uuid': 'fake_uuid', 'dst_ip': 'fake_ip1'}
         with contextlib.nested(
             mock.patch.object(self.service_plugin,
                               '_admin_check',
@@ -1260,14 +1420,16 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                               '_get_ip_details',
                               return_value=('fake_ip1', 'fake_ip2')),
             mock.patch.object(self.plugin, '_get_dict', return_value=mock.ANY),
-            mock.patch.object(db, 'get_ucast_mac_remote_by_mac_and_ls'),
-            mock.patch.object(self.plugin,
-                              '_get_locator_list',
-                              return_value=fake_pl_list),
+            mock.patch.object(db, 'get_all_ucast_mac_remote_by_ls',
+                              return_value=[]),
+            mock.patch.object(db, 'get_all_physical_locators_by_ovsdb_id',
+                              return_value=[fake_locator]),
+            mock.patch.object(agent_tunnel_ips, 'get_cache'),
             mock.patch.object(self.plugin.agent_rpc,
                               'update_connection_to_gateway')) as (
                 admin_check, validate, get_devices, port_list, get_ls,
-                get_port, get_ip, get_ucast_mac, get_dict, get_pl, update_rpc):
+                get_port, get_ip, get_dict, get_ucast_macs, get_pls,
+                get_cache, update_rpc):
             self.plugin.create_l2_gateway_connection(self.db_context,
                                                      fake_l2gw_conn_dict)
             admin_check.assert_called_with(self.db_context, 'CREATE')
@@ -1279,11 +1441,72 @@ class TestL2gwRpcDriver(base.BaseTestCase):
                                       logical_switch,
                                       fake_conn_dict)
             get_port.assert_called_with(self.db_context, 'fake_network_id')
+            get_ucast_macs.assert_called_once_with(
+                self.db_context, {'ovsdb_identifier': ovsdb_id,
+                                  'logical_switch_id': 'fake_id'})
+            get_pls.assert_called_once_with(self.db_context, ovsdb_id)
             self.assertTrue(get_ip.called)
             self.assertTrue(get_dict.called)
-            self.assertTrue(get_ucast_mac.called)
-            self.assertTrue(get_pl.called)
-            self.assertTrue(update_rpc.called)
+            update_rpc.assert_called_with(
+                self.db_context, ovsdb_id, fake_ls_dict,
+                [{'uuid': 'fake_uuid', 'dst_ip': 'fake_ip1'}],
+                {'fake_ip1': [mock.ANY]}, fake_port)
+
+    def test_create_l2_gateway_connection_with_existing_macs(self):
+        self.db_context = ctx.get_admin_context()
+        fake_l2gw_conn_dict = {'l2_gateway_connection': {
+            'id': 'fake_id', 'network_id': 'fake_network_id',
+            'l2_gateway_id': 'fake_l2gw_id'}}
+        fake_port1 = {'device_owner': 'fake_owner',
+                      'mac_address': 'fake_mac1'}
+        fake_port2 = {'device_owner': 'fake_owner',
+                      'mac_address': 'fake_mac2'}
+        fake_port3 = {'device_owner': '',
+                      'mac_address': 'fake_mac3'}
+        ovsdb_id = 'fake_ovsdb_id'
+        with contextlib.nested(
+            mock.patch.object(self.plugin,
+                              '_validate_connection'),
+            mock.patch.object(self.service_plugin,
+                              'get_l2gateway_devices_by_gateway_id',
+                              return_value=[{'device_name': 'fake_device'}]),
+            mock.patch.object(self.plugin,
+                              '_process_port_list',
+                              return_value=(ovsdb_id, {'uuid': 'fake_id'},
+                                            {})),
+            mock.patch.object(self.plugin,
+                              '_get_logical_switch_dict',
+                              return_value={}),
+            mock.patch.object(self.plugin,
+                              '_get_port_details',
+                              return_value=[fake_port1, fake_port2,
+                                            fake_port3]),
+            mock.patch.object(self.plugin,
+                              '_get_ip_details',
+                              side_effect=[('fake_ip1', 'fake_ip'),
+                                           ('fake_ip2', 'fake_ip')]),
+            mock.patch.object(db, 'get_all_ucast_mac_remote_by_ls',
+                              return_value=[{'mac': 'fake_mac1'}]),
+            mock.patch.object(db, 'get_all_physical_locators_by_ovsdb_id',
+                              return_value=[]),
+            mock.patch.object(agent_tunnel_ips, 'get_cache'),
+            mock.patch.object(self.plugin.agent_rpc,
+                              'update_connection_to_gateway')) as (
+                validate, get_devices, port_list, get_ls, get_port, get_ip,
+                get_ucast_macs, get_pls, get_cache, update_rpc):
+            self.plugin.create_l2_gateway_connection(self.context,
+                                                     fake_l2gw_conn_dict)
+            self.assertEqual(2, get_ip.call_count)
+            get_cache.return_value.get_agent_ips.assert_called_once_with(
+                self.context, self.service_plugin._core_plugin)
+            locator_list = update_rpc.call_args[0][3]
+            mac_dict = update_rpc.call_args[0][4]
+            self.assertEqual([{'uuid': None, 'dst_ip': 'fake_ip1'},
+                              {'uuid': None, 'dst_ip': 'fake_ip2'}],
+                             locator_list)
+            self.assertEqual([], mac_dict['fake_ip1'])
+            self.assertEqual(['fake_mac2'],
+                             [mac['mac'] for mac in mac_dict['fake_ip2']])
 
     def test_create_l2gateway_connection_with_invalid_device(self):
         self.db_context = ctx.get_admin_context()
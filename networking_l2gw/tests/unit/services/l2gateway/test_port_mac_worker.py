@@ -0,0 +1,122 @@
+# Copyright (c) 2016 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron import context
+from neutron.tests import base
+
+from networking_l2gw.services.l2gateway import port_mac_worker
+
+
+class TestPortMacWorker(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestPortMacWorker, self).setUp()
+        self.context = mock.Mock()
+        self.plugin = mock.Mock()
+        self.driver = self.plugin._get_driver_for_provider.return_value
+        self.admin_context = mock.Mock()
+        mock.patch.object(context, 'get_admin_context',
+                          return_value=self.admin_context).start()
+        self.spawn = mock.patch.object(port_mac_worker.eventlet,
+                                       'spawn_n').start()
+
+    def _get_port(self, port_id, mac='fa:16:3e:00:00:01'):
+        return {'id': port_id, 'network_id': 'fake_network_id',
+                'mac_address': mac}
+
+    def test_synchronous(self):
+        worker = port_mac_worker.PortMacWorker(self.plugin, 0, 100)
+        port = self._get_port('port1')
+        worker.add_port_mac(self.context, port)
+        worker.delete_port_mac(self.context, port)
+        self.driver.add_port_mac.assert_called_once_with(self.context, port)
+        self.driver.delete_port_mac.assert_called_once_with(self.context,
+                                                            port)
+        self.assertFalse(self.spawn.called)
+        self.assertEqual(2, worker.get_stats()['processed'])
+
+    def test_queued_events_are_batched(self):
+        worker = port_mac_worker.PortMacWorker(self.plugin, 10, 2)
+        ports = [self._get_port('port%d' % i) for i in range(3)]
+        for port in ports:
+            worker.add_port_mac(self.context, port)
+        self.assertEqual(1, self.spawn.call_count)
+        self.assertFalse(self.driver.add_port_macs.called)
+        worker.process_queued(block=False)
+        worker.process_queued(block=False)
+        self.assertEqual(
+            [mock.call(self.admin_context, ports[:2]),
+             mock.call(self.admin_context, ports[2:])],
+            self.driver.add_port_macs.call_args_list)
+        self.assertEqual(0, worker.get_stats()['queued'])
+
+    def test_queued_events_are_coalesced(self):
+        worker = port_mac_worker.PortMacWorker(self.plugin, 10, 10)
+        port1 = self._get_port('port1')
+        port2 = self._get_port('port2')
+        worker.add_port_mac(self.context, port1)
+        worker.add_port_mac(self.context, port2)
+        worker.add_port_mac(self.context, port1)
+        worker.delete_port_mac(self.context, port2)
+        worker.process_queued(block=False)
+        self.driver.delete_port_mac.assert_called_once_with(
+            self.admin_context, port2)
+        self.driver.add_port_macs.assert_called_once_with(
+            self.admin_context, [port1])
+        stats = worker.get_stats()
+        self.assertEqual(4, stats['received'])
+        self.assertEqual(2, stats['coalesced'])
+        self.assertEqual(2, stats['processed'])
+
+    def test_full_queue_is_processed_synchronously(self):
+        worker = port_mac_worker.PortMacWorker(self.plugin, 1, 10)
+        port1 = self._get_port('port1')
+        port2 = self._get_port('port2')
+        worker.add_port_mac(self.context, port1)
+        worker.add_port_mac(self.context, port2)
+        self.driver.add_port_macs.assert_called_once_with(self.context,
+                                                          [port2])
+        self.assertEqual(1, worker.get_stats()['overflowed'])
+        self.assertEqual(1, worker.get_stats()['queued'])
+
+    def test_stats_are_logged_after_coalesced_events(self):
+        worker = port_mac_worker.PortMacWorker(self.plugin, 10, 10)
+        port1 = self._get_port('port1')
+        with mock.patch.object(port_mac_worker.LOG, 'info') as log_info:
+            worker.add_port_mac(self.context, port1)
+            worker.process_queued(block=False)
+            self.assertFalse(log_info.called)
+            worker.add_port_mac(self.context, port1)
+            worker.add_port_mac(self.context, port1)
+            worker.process_queued(block=False)
+            self.assertEqual(1, log_info.call_count)
+            self.assertEqual(1, log_info.call_args[0][1]['coalesced'])
+            # The counters are not logged again until they change.
+            worker.add_port_mac(self.context, port1)
+            worker.process_queued(block=False)
+            self.assertEqual(1, log_info.call_count)
+
+    def test_failed_delete_does_not_stop_the_batch(self):
+        worker = port_mac_worker.PortMacWorker(self.plugin, 10, 10)
+        self.driver.delete_port_mac.side_effect = RuntimeError
+        port1 = self._get_port('port1')
+        port2 = self._get_port('port2')
+        worker.delete_port_mac(self.context, port1)
+        worker.add_port_mac(self.context, port2)
+        worker.process_queued(block=False)
+        self.driver.add_port_macs.assert_called_once_with(
+            self.admin_context, [port2])
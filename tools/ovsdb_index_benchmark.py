@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# Copyright 2016 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Show the effect of the lookup indexes of the OVSDB tables.
+
+Fills an in-memory SQLite database with the OVSDB tables of the plugin,
+then prints the query plan and the average time of the lookups of
+networking_l2gw.db.l2gateway.ovsdb.lib before and after the indexes of
+the 4f1b6f5e8d2c migration are created.
+
+Usage: python tools/ovsdb_index_benchmark.py [ROWS_PER_OVSDB]
+"""
+
+from __future__ import print_function
+
+import sqlite3
+import sys
+import timeit
+
+OVSDB_IDENTIFIERS = ['ovsdb1', 'ovsdb2', 'ovsdb3', 'ovsdb4']
+
+TABLES = [
+    "CREATE TABLE logical_switches (uuid VARCHAR(36), name VARCHAR(255), "
+    "key INTEGER, ovsdb_identifier VARCHAR(64), "
+    "PRIMARY KEY (uuid, ovsdb_identifier))",
+    "CREATE TABLE physical_switches (uuid VARCHAR(36), name VARCHAR(255), "
+    "tunnel_ip VARCHAR(64), ovsdb_identifier VARCHAR(64), "
+    "switch_fault_status VARCHAR(32), "
+    "PRIMARY KEY (uuid, ovsdb_identifier))",
+    "CREATE TABLE physical_locators (uuid VARCHAR(36), dst_ip VARCHAR(64), "
+    "ovsdb_identifier VARCHAR(64), PRIMARY KEY (uuid, ovsdb_identifier))",
+    "CREATE TABLE ucast_macs_remotes (uuid VARCHAR(36), mac VARCHAR(32), "
+    "logical_switch_id VARCHAR(36), physical_locator_id VARCHAR(36), "
+    "ip_address VARCHAR(64), ovsdb_identifier VARCHAR(64), "
+    "PRIMARY KEY (uuid, ovsdb_identifier))",
+    "CREATE TABLE vlan_bindings (port_uuid VARCHAR(36), vlan INTEGER, "
+    "logical_switch_uuid VARCHAR(36), ovsdb_identifier VARCHAR(64), "
+    "PRIMARY KEY (port_uuid, vlan, logical_switch_uuid, ovsdb_identifier))",
+]
+
+INDEXES = [
+    "CREATE INDEX ix_logical_switches_name_ovsdb "
+    "ON logical_switches (name, ovsdb_identifier)",
+    "CREATE INDEX ix_physical_switches_name_ovsdb "
+    "ON physical_switches (name, ovsdb_identifier)",
+    "CREATE INDEX ix_physical_locators_dst_ip_ovsdb "
+    "ON physical_locators (dst_ip, ovsdb_identifier)",
+    "CREATE INDEX ix_ucast_macs_remotes_mac_ls_ovsdb "
+    "ON ucast_macs_remotes (mac, logical_switch_id, ovsdb_identifier)",
+    "CREATE INDEX ix_vlan_bindings_ls_ovsdb "
+    "ON vlan_bindings (logical_switch_uuid, ovsdb_identifier)",
+]
+
+
+def _mac(i):
+    return 'fa:16:3e:%02x:%02x:%02x' % ((i >> 16) & 0xff, (i >> 8) & 0xff,
+                                        i & 0xff)
+
+
+# The lookups of the ovsdb db lib, with the parameters of a row in the
+# middle of the tables.
+QUERIES = [
+    ('get_all_logical_switches_by_name',
+     "SELECT * FROM logical_switches WHERE name = ?",
+     ('net-50',)),
+    ('get_logical_switch_by_name',
+     "SELECT * FROM logical_switches WHERE name = ? "
+     "AND ovsdb_identifier = ?",
+     ('net-50', 'ovsdb2')),
+    ('get_physical_switch_by_name',
+     "SELECT * FROM physical_switches WHERE name = ? LIMIT 1",
+     ('switch-50',)),
+    ('get_physical_locator_by_dst_ip',
+     "SELECT * FROM physical_locators WHERE dst_ip = ? "
+     "AND ovsdb_identifier = ?",
+     ('10.0.0.50', 'ovsdb2')),
+    ('get_ucast_mac_remote_by_mac_and_ls',
+     "SELECT * FROM ucast_macs_remotes WHERE mac = ? "
+     "AND ovsdb_identifier = ? AND logical_switch_id = ?",
+     (_mac(50), 'ovsdb2', 'ls-50')),
+    ('get_all_vlan_bindings_by_logical_switch',
+     "SELECT * FROM vlan_bindings WHERE logical_switch_uuid = ? "
+     "AND ovsdb_identifier = ?",
+     ('ls-50', 'ovsdb2')),
+]
+
+
+def populate(conn, rows):
+    for statement in TABLES:
+        conn.execute(statement)
+    for ovsdb_identifier in OVSDB_IDENTIFIERS:
+        conn.executemany(
+            "INSERT INTO logical_switches VALUES (?, ?, ?, ?)",
+            [('ls-%d' % i, 'net-%d' % i, i, ovsdb_identifier)
+             for i in range(rows)])
+        conn.executemany(
+            "INSERT INTO physical_switches VALUES (?, ?, ?, ?, NULL)",
+            [('ps-%d' % i, 'switch-%d' % i, '192.168.0.1', ovsdb_identifier)
+             for i in range(rows)])
+        conn.executemany(
+            "INSERT INTO physical_locators VALUES (?, ?, ?)",
+            [('pl-%d' % i, '10.0.%d.%d' % (i // 256, i % 256),
+              ovsdb_identifier) for i in range(rows)])
+        conn.executemany(
+            "INSERT INTO ucast_macs_remotes VALUES (?, ?, ?, ?, ?, ?)",
+            [('mac-%d' % i, _mac(i), 'ls-%d' % (i % rows), 'pl-%d' % i,
+              '172.16.0.1', ovsdb_identifier) for i in range(rows)])
+        conn.executemany(
+            "INSERT INTO vlan_bindings VALUES (?, ?, ?, ?)",
+            [('port-%d' % (i % 16), i, 'ls-%d' % i, ovsdb_identifier)
+             for i in range(rows)])
+    conn.execute("ANALYZE")
+
+
+def report(conn, title, number):
+    print(title)
+    for name, query, params in QUERIES:
+        plan = conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+        elapsed = timeit.timeit(
+            lambda: conn.execute(query, params).fetchall(), number=number)
+        print('  %-40s %8.1f us' % (name, elapsed / number * 1e6))
+        for row in plan:
+            print('      %s' % row[-1])
+    print()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    conn = sqlite3.connect(':memory:')
+    populate(conn, rows)
+    report(conn, 'Without the lookup indexes (%d rows per OVSDB server)' %
+           rows, 200)
+    for statement in INDEXES:
+        conn.execute(statement)
+    conn.execute("ANALYZE")
+    report(conn, 'With the lookup indexes', 200)
+
+
+if __name__ == '__main__':
+    main()